@@ -0,0 +1,264 @@
+"""
+Photoshop 引擎基准测试: 在模拟的 Photoshop 对象模型上运行合成任务
+统计每秒任务数和每个任务的 COM 调用次数, 与保存的基线比较, 性能退化时返回非 0
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from loguru import logger
+
+import fake_photoshop
+
+# 必须在导入 Photoshop 引擎之前替换 photoshop 包
+fake_photoshop.install()
+
+from src.layer_tree_cache import LayerTreeCache  # noqa: E402
+from src.profiler import Profiler  # noqa: E402
+from src.ps_core import Photoshop  # noqa: E402
+from src.task_planner import plan_task_order  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# 场景: (名称, 任务数, 图层组数, 每组图层数, 每个任务修改的图层比例, 引擎参数, 是否排序任务)
+SCENARIOS = [
+    ("visible_small", 50, 5, 8, 0.2, {}, False),
+    ("mixed_medium", 100, 10, 10, 0.3, {}, False),
+    ("mixed_medium_planned", 100, 10, 10, 0.3, {}, True),
+    ("mixed_medium_jsx", 100, 10, 10, 0.3, {"use_jsx": True}, False),
+    # 图层树缓存已经存在时打开模板(第二次运行)
+    ("mixed_medium_cached", 100, 10, 10, 0.3, {"layer_tree_cache": True}, False),
+    ("dense_large", 40, 20, 20, 0.6, {}, False),
+]
+
+
+def make_tasks(
+    document: fake_photoshop.FakeDocument, task_count: int, density: float, seed: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    生成合成任务, 每个任务随机修改 density 比例的图层: 可见性、位置或文本(仅文本图层)
+    文本只有少数几种取值, 相邻任务之间有一部分修改相同, 接近真实表格中同一模板的 SKU
+    """
+    rng = random.Random(seed)
+    paths, text_paths = [], set()
+    for layer_set in document._layerSets.items:
+        for layer in layer_set._artLayers.items:
+            path = f"{layer_set._name}/{layer._name}"
+            paths.append(path)
+            if layer._textItem is not None:
+                text_paths.add(path)
+    change_count = max(1, int(len(paths) * density))
+    tasks = []
+    for index in range(task_count):
+        content = {}
+        for path in rng.sample(paths, change_count):
+            kind = rng.random()
+            if kind < 0.5:
+                content[path] = {"visible": rng.random() < 0.7}
+            elif kind < 0.8 and path in text_paths:
+                content[path] = {"visible": True, "textItem": {"contents": f"SKU{rng.randrange(8)}"}}
+            else:
+                content[path] = {"visible": True, "move": (rng.randrange(4) * 10, 0)}
+        tasks.append({"任务名": f"SKU{index:05d}", "内容": content})
+    return tasks
+
+
+def run_scenario(
+    name: str,
+    task_count: int,
+    groups: int,
+    layers_per_group: int,
+    density: float,
+    engine_kwargs: dict,
+    plan_order: bool,
+    latency: float,
+    profile: bool = False,
+) -> Dict[str, Any]:
+    """
+    运行一个场景
+    :return: {"tasks", "seconds", "tasks_per_sec", "open_calls", "calls_per_task", "calls"}
+    """
+    counter = fake_photoshop.CallCounter(latency)
+    document = fake_photoshop.build_document(counter, groups, layers_per_group)
+    fake_photoshop.open_document(document, counter)
+    tasks = make_tasks(document, task_count, density)
+    if plan_order:
+        tasks, _ = plan_task_order(tasks)
+
+    profiler = Profiler(enabled=profile)
+    with tempfile.TemporaryDirectory() as tmp:
+        # 引擎按文件名查找模板, 内容由模拟对象模型提供
+        open(os.path.join(tmp, "bench.psd"), "wb").close()
+        engine_kwargs = dict(engine_kwargs)
+        if engine_kwargs.get("layer_tree_cache"):
+            engine_kwargs["layer_tree_cache"] = LayerTreeCache(tmp)
+            # 先打开一次写入缓存, 只统计之后的运行
+            with Photoshop(
+                "bench", psd_dir_path=tmp, export_folder=os.path.join(tmp, "export"), **engine_kwargs
+            ):
+                pass
+            counter.reset()
+        ps = Photoshop(
+            "bench",
+            psd_dir_path=tmp,
+            export_folder=os.path.join(tmp, "export"),
+            profiler=profiler,
+            **engine_kwargs,
+        )
+        with ps:
+            open_calls = counter.total
+            counter.reset()
+            start = time.perf_counter()
+            for task in tasks:
+                ps.core(task["任务名"], task["内容"])
+        seconds = time.perf_counter() - start
+
+    task_calls = counter.total
+    return {
+        "scenario": name,
+        "tasks": task_count,
+        "layers": groups * layers_per_group,
+        "seconds": round(seconds, 4),
+        "tasks_per_sec": round(task_count / seconds, 2),
+        "open_calls": open_calls,
+        "calls_per_task": round(task_calls / task_count, 2),
+        "calls": dict(counter.calls.most_common(8)),
+        "profile": profiler.report() if profile else None,
+    }
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Dict[str, float]],
+    speed_tolerance: float | None = 0.3,
+    calls_tolerance: float = 0.0,
+) -> List[str]:
+    """
+    与基线比较
+    :param speed_tolerance: 每秒任务数允许下降的比例, 为 None 时不比较速度
+    :param calls_tolerance: 每个任务的调用次数允许增加的比例, 调用次数是确定的, 默认不允许增加
+    :return: 退化说明列表, 为空表示没有退化
+    """
+    regressions = []
+    for result in results:
+        base = baseline.get(result["scenario"])
+        if base is None:
+            continue
+        if result["calls_per_task"] > base["calls_per_task"] * (1 + calls_tolerance):
+            regressions.append(
+                f"{result['scenario']}: 每个任务调用 {base['calls_per_task']} -> "
+                f"{result['calls_per_task']} 次"
+            )
+        if speed_tolerance is not None and result["tasks_per_sec"] < base["tasks_per_sec"] * (
+            1 - speed_tolerance
+        ):
+            regressions.append(
+                f"{result['scenario']}: 每秒任务 {base['tasks_per_sec']} -> "
+                f"{result['tasks_per_sec']}"
+            )
+    return regressions
+
+
+def format_results(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, float]]) -> str:
+    """结果表格, 包含与基线的比值"""
+    lines = [
+        f"{'场景':<24}{'任务':>6}{'图层':>6}{'任务/秒':>10}{'调用/任务':>10}"
+        f"{'打开调用':>10}{'速度比':>8}{'调用比':>8}"
+    ]
+    for result in results:
+        base = baseline.get(result["scenario"])
+        speed = calls = "-"
+        if base:
+            speed = f"{result['tasks_per_sec'] / base['tasks_per_sec']:.2f}"
+            calls = f"{result['calls_per_task'] / base['calls_per_task']:.2f}"
+        lines.append(
+            f"{result['scenario']:<26}{result['tasks']:>6}{result['layers']:>6}"
+            f"{result['tasks_per_sec']:>11}{result['calls_per_task']:>12}"
+            f"{result['open_calls']:>12}{speed:>11}{calls:>11}"
+        )
+        lines.append(f"    {result['calls']}")
+        if result["profile"]:
+            lines.append(result["profile"])
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """读取基线, 没有基线文件时返回空基线"""
+    if not os.path.isfile(path):
+        return {"latency_us": None, "scenarios": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(
+    path: str, results: List[Dict[str, Any]], latency: float, keep: Dict[str, Any] | None = None
+):
+    """
+    保存基线
+    :param keep: 本次没有运行、需要保留的场景基线
+    """
+    scenarios = dict(keep or {})
+    for result in results:
+        scenarios[result["scenario"]] = {
+            "tasks_per_sec": result["tasks_per_sec"],
+            "calls_per_task": result["calls_per_task"],
+        }
+    data = {"latency_us": round(latency * 1e6, 3), "scenarios": scenarios}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Photoshop 引擎基准测试")
+    parser.add_argument("--latency-us", type=float, default=50, help="每次 COM 调用的模拟延迟(微秒)")
+    parser.add_argument("--scenario", action="append", help="只运行指定场景, 可重复指定")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果更新基线")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="每秒任务数允许下降的比例")
+    parser.add_argument("--output", default="bench_output.txt", help="结果写出的文件")
+    parser.add_argument("--profile", action="store_true", help="同时输出各阶段耗时")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    # 基准测试时不输出每个图层的日志
+    logger.remove()
+    latency = args.latency_us / 1e6
+    scenarios = [s for s in SCENARIOS if not args.scenario or s[0] in args.scenario]
+    results = [run_scenario(*scenario, latency, args.profile) for scenario in scenarios]
+
+    baseline = load_baseline(args.baseline)
+    # 模拟延迟不同时每秒任务数不可比, 只比较调用次数
+    same_latency = baseline["latency_us"] == round(args.latency_us, 3)
+    report = format_results(results, baseline["scenarios"])
+    if not same_latency and baseline["scenarios"]:
+        report += f"\n基线的模拟延迟为 {baseline['latency_us']}us, 只比较调用次数"
+    regressions = []
+    if not args.update_baseline:
+        tolerance = args.tolerance if same_latency else None
+        regressions = compare(results, baseline["scenarios"], tolerance)
+    if regressions:
+        report += "\n\n性能退化:\n" + "\n".join(regressions)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    if args.update_baseline:
+        save_baseline(
+            args.baseline, results, latency, baseline["scenarios"] if same_latency else None
+        )
+        print(f"基线已更新: {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
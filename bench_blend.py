@@ -0,0 +1,160 @@
+"""
+混合内核微基准: 比较 src/blend.py 的预乘原地内核与按公式逐项计算的参考实现
+参考实现使用非预乘 float64, 每次调用分配新数组, 同时用来校验内核结果
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from src.blend import (
+    BlendBuffers,
+    blend,
+    is_opaque,
+    load_opaque,
+    load_premultiplied,
+    store_unpremultiplied,
+)
+
+MODES = ("normal", "multiply", "screen", "overlay")
+
+
+def _blend_function(mode: str, backdrop: np.ndarray, source: np.ndarray) -> np.ndarray:
+    """W3C Compositing 规范中的可分离混合函数 B(Cb, Cs)"""
+    if mode == "multiply":
+        return backdrop * source
+    if mode == "screen":
+        return backdrop + source - backdrop * source
+    if mode == "overlay":
+        return np.where(
+            backdrop <= 0.5,
+            2 * source * backdrop,
+            1 - 2 * (1 - source) * (1 - backdrop),
+        )
+    return source
+
+
+def reference_blend(
+    backdrop: np.ndarray, source: np.ndarray, mode: str, opacity: float = 1.0
+) -> np.ndarray:
+    """
+    参考实现: 非预乘 uint8 RGBA 按公式合成
+    Co = (As * (1 - Ab) * Cs + As * Ab * B(Cb, Cs) + (1 - As) * Ab * Cb) / Ao
+    :param backdrop: 背景 (height, width, 4) uint8
+    :param source: 图层 (height, width, 4) uint8
+    :param opacity: 图层不透明度与填充不透明度的乘积 0-1
+    :return: 合成结果 uint8
+    """
+    cb, ab = backdrop[..., :3] / 255.0, backdrop[..., 3:4] / 255.0
+    cs, a_s = source[..., :3] / 255.0, source[..., 3:4] / 255.0 * opacity
+    ao = a_s + ab * (1 - a_s)
+    co = a_s * (1 - ab) * cs + a_s * ab * _blend_function(mode, cb, cs) + (1 - a_s) * ab * cb
+    co = np.divide(co, ao, out=np.zeros_like(co), where=ao > 0)
+    result = np.concatenate([co, ao], axis=-1)
+    return np.clip(np.rint(result * 255), 0, 255).astype(np.uint8)
+
+
+def kernel_blend(
+    backdrop: np.ndarray,
+    source: np.ndarray,
+    mode: str,
+    opacity: float = 1.0,
+    buffers: BlendBuffers | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """用合成器的内核完成与 reference_blend 相同的合成, 缓冲区可以跨调用复用"""
+    buffers = buffers or BlendBuffers()
+    height, width = backdrop.shape[:2]
+    canvas = load_premultiplied(backdrop, buffers.get("bench_canvas", height, width))
+    target = buffers.get("bench_source", height, width)
+    if mode == "normal" and opacity == 1 and is_opaque(source):
+        load_opaque(source, canvas)
+    else:
+        blend(canvas, load_premultiplied(source, target), mode, opacity, buffers)
+    if out is None:
+        out = np.empty_like(backdrop)
+    store_unpremultiplied(canvas, out, buffers)
+    return out
+
+
+def random_layers(size: int, seed: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """生成背景、半透明图层和不透明图层"""
+    rng = np.random.default_rng(seed)
+    backdrop = rng.integers(0, 256, (size, size, 4), dtype=np.uint8)
+    source = rng.integers(0, 256, (size, size, 4), dtype=np.uint8)
+    opaque = source.copy()
+    opaque[..., 3] = 255
+    return backdrop, source, opaque
+
+
+def _best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(size: int = 2048, repeat: int = 5) -> list[dict]:
+    """
+    运行微基准
+    :return: [{"case", "reference_ms", "kernel_ms", "speedup", "max_diff"}]
+    """
+    backdrop, source, opaque = random_layers(size)
+    buffers = BlendBuffers()
+    out = np.empty_like(backdrop)
+    cases = [(mode, source, 1.0) for mode in MODES]
+    cases += [("normal", source, 0.5), ("overlay", source, 0.5), ("normal", opaque, 1.0)]
+    results = []
+    for mode, layer, opacity in cases:
+        expected = reference_blend(backdrop, layer, mode, opacity)
+        actual = kernel_blend(backdrop, layer, mode, opacity, buffers, out)
+        max_diff = int(np.abs(expected.astype(np.int16) - actual).max())
+        reference_time = _best_time(lambda: reference_blend(backdrop, layer, mode, opacity), repeat)
+        kernel_time = _best_time(
+            lambda: kernel_blend(backdrop, layer, mode, opacity, buffers, out), repeat
+        )
+        name = f"{mode} {opacity:.0%}" + (" opaque" if layer is opaque else "")
+        results.append(
+            {
+                "case": name,
+                "reference_ms": round(reference_time * 1000, 2),
+                "kernel_ms": round(kernel_time * 1000, 2),
+                "speedup": round(reference_time / kernel_time, 2),
+                "max_diff": max_diff,
+            }
+        )
+    return results
+
+
+def format_results(results: list[dict]) -> str:
+    lines = [f"{'case':<20}{'reference_ms':>14}{'kernel_ms':>12}{'speedup':>10}{'max_diff':>10}"]
+    for r in results:
+        lines.append(
+            f"{r['case']:<20}{r['reference_ms']:>14.2f}{r['kernel_ms']:>12.2f}"
+            f"{r['speedup']:>10.2f}{r['max_diff']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="混合内核微基准")
+    parser.add_argument("--size", type=int, default=2048, help="图层边长(像素)")
+    parser.add_argument("--repeat", type=int, default=5, help="每种情况重复次数, 取最快一次")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    results = run(args.size, args.repeat)
+    print(format_results(results))
+    # 与参考实现的差异超过 1 时返回非 0
+    return 1 if any(r["max_diff"] > 1 for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
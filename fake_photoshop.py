@@ -0,0 +1,355 @@
+"""
+模拟 Photoshop 对象模型, 供基准测试和测试在没有 Photoshop 的环境中运行 Photoshop 引擎, 不属于 src 包
+每次属性读写和方法调用都计为一次 COM 调用, 并按设置的延迟等待
+"""
+
+import random
+import sys
+import types
+from collections import Counter
+from time import perf_counter, sleep
+from typing import Any, Dict, List
+
+from src.jsx_compiler import JSX_OK
+
+
+class CallCounter:
+    """COM 调用计数和延迟"""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        :param latency: 每次调用的延迟(秒)
+        """
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls = Counter()
+
+    def call(self, name: str):
+        """记录一次调用并等待延迟, 1ms 以下忙等保证精度"""
+        self.calls[name] += 1
+        latency = self.latency
+        if latency <= 0:
+            return
+        if latency >= 0.001:
+            sleep(latency)
+            return
+        end = perf_counter() + latency
+        while perf_counter() < end:
+            pass
+
+
+class _ComProperty:
+    """读写都计为一次调用的属性, 值保存在实例的 _<name> 中"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.attr = f"_{name}"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        instance.counter.call(f"{type(instance).__name__}.{self.name}")
+        return getattr(instance, self.attr)
+
+    def __set__(self, instance, value):
+        instance.counter.call(f"{type(instance).__name__}.{self.name}=")
+        setattr(instance, self.attr, value)
+
+
+class _FakeComObject:
+    def __init__(self, counter: CallCounter):
+        self.counter = counter
+
+    def _call(self, method: str):
+        self.counter.call(f"{type(self).__name__}.{method}()")
+
+
+class FakeRGB(_FakeComObject):
+    red = _ComProperty()
+    green = _ComProperty()
+    blue = _ComProperty()
+
+    def __init__(self, counter: CallCounter, red=0, green=0, blue=0):
+        super().__init__(counter)
+        self._red, self._green, self._blue = red, green, blue
+
+
+class FakeSolidColor(_FakeComObject):
+    rgb = _ComProperty()
+
+    def __init__(self, counter: CallCounter | None = None):
+        # ColorFactory 创建颜色时不传计数器, 使用当前会话的计数器
+        super().__init__(counter or FakeSession.counter or _default_counter)
+        self._rgb = FakeRGB(self.counter)
+
+
+class FakeTextItem(_FakeComObject):
+    contents = _ComProperty()
+    size = _ComProperty()
+    color = _ComProperty()
+
+    def __init__(self, counter: CallCounter, contents: str = "", size: float = 12):
+        super().__init__(counter)
+        self._contents = contents
+        self._size = size
+        self._color = FakeSolidColor(counter)
+
+
+class FakeLayers(_FakeComObject):
+    """artLayers / layerSets 集合, 遍历时每个元素计为一次调用"""
+
+    def __init__(self, counter: CallCounter, items: List[Any]):
+        super().__init__(counter)
+        self.items = items
+
+    def __len__(self) -> int:
+        self._call("length")
+        return len(self.items)
+
+    def __iter__(self):
+        for item in self.items:
+            self._call("item")
+            yield item
+
+    def __getitem__(self, index: int):
+        self._call("item")
+        return self.items[index]
+
+    def getByName(self, name: str):
+        self._call("getByName")
+        for item in self.items:
+            if item._name == name:
+                return item
+        raise KeyError(name)
+
+
+class _FakeLayerBase(_FakeComObject):
+    name = _ComProperty()
+    visible = _ComProperty()
+    bounds = _ComProperty()
+
+    def __init__(self, counter: CallCounter, name: str, visible: bool = True):
+        super().__init__(counter)
+        self._name = name
+        self._visible = visible
+        self._bounds = (0.0, 0.0, 100.0, 100.0)
+        self._rotation = 0.0  # 相对创建时方向累计旋转的角度
+
+    def translate(self, dx: float, dy: float):
+        self._call("translate")
+        left, top, right, bottom = self._bounds
+        self._bounds = (left + dx, top + dy, right + dx, bottom + dy)
+
+    def rotate(self, angle: float):
+        self._call("rotate")
+        self._rotation = (self._rotation + angle) % 360
+
+    def _state(self) -> tuple:
+        return self._visible, self._bounds, self._rotation
+
+    def _restore(self, state: tuple):
+        self._visible, self._bounds, self._rotation = state
+
+
+class FakeArtLayer(_FakeLayerBase):
+    textItem = _ComProperty()
+
+    def __init__(self, counter: CallCounter, name: str, visible: bool = True, text: str = None):
+        super().__init__(counter, name, visible)
+        self._textItem = FakeTextItem(counter, text) if text is not None else None
+
+    def _state(self) -> tuple:
+        text = self._textItem
+        if text is None:
+            return super()._state()
+        return super()._state() + (text._contents, text._size, text._color)
+
+    def _restore(self, state: tuple):
+        super()._restore(state[:3])
+        if len(state) > 3:
+            self._textItem._contents, self._textItem._size, self._textItem._color = state[3:]
+
+
+class FakeLayerSet(_FakeLayerBase):
+    artLayers = _ComProperty()
+    layerSets = _ComProperty()
+
+    def __init__(self, counter: CallCounter, name: str, art_layers=(), layer_sets=()):
+        super().__init__(counter, name)
+        self._artLayers = FakeLayers(counter, list(art_layers))
+        self._layerSets = FakeLayers(counter, list(layer_sets))
+
+    def translate(self, dx: float, dy: float):
+        """平移图层组同时平移所有子图层"""
+        super().translate(dx, dy)
+        stack = [self]
+        while stack:
+            parent = stack.pop()
+            for layer in parent._artLayers.items + parent._layerSets.items:
+                left, top, right, bottom = layer._bounds
+                layer._bounds = (left + dx, top + dy, right + dx, bottom + dy)
+            stack.extend(parent._layerSets.items)
+
+
+class FakeDocument(FakeLayerSet):
+    """文档, 记录历史快照, 保存时只计数不写文件"""
+
+    width = _ComProperty()
+    height = _ComProperty()
+
+    def __init__(self, counter: CallCounter, name: str, art_layers=(), layer_sets=()):
+        super().__init__(counter, name, art_layers, layer_sets)
+        self._width = self._height = 1000.0
+        self.snapshots: Dict[str, list] = {}
+        self.saved: List[str] = []
+
+    def _all_layers(self):
+        stack = [self]
+        while stack:
+            parent = stack.pop()
+            for layer in parent._artLayers.items:
+                yield layer
+            for layer_set in parent._layerSets.items:
+                yield layer_set
+                stack.append(layer_set)
+
+    def _take_snapshot(self, name: str):
+        self.snapshots[name] = [(layer, layer._state()) for layer in self._all_layers()]
+
+    def _revert_snapshot(self, name: str):
+        for layer, state in self.snapshots[name]:
+            layer._restore(state)
+
+    def saveAs(self, path: str, options=None, asCopy: bool = True):
+        self._call("saveAs")
+        self.saved.append(path)
+
+    def close(self, *args):
+        self._call("close")
+
+
+class FakeApplication(_FakeComObject):
+    activeDocument = _ComProperty()
+
+    def __init__(self, counter: CallCounter, document: FakeDocument):
+        super().__init__(counter)
+        self._activeDocument = document
+        self.scripts: List[str] = []
+
+    def doJavaScript(self, script: str):
+        """
+        脚本计为一次调用, 不解释执行其中的图层修改
+        只识别快照的创建和恢复, 使非批量模式下恢复快照后的文档状态正确
+        """
+        self._call("doJavaScript")
+        self.scripts.append(script)
+        document = self._activeDocument
+        if "historyStates.getByName(" in script:
+            name = script.split("historyStates.getByName(")[1].split(")")[0].strip("\"'")
+            document._revert_snapshot(name)
+        if "charIDToTypeID('SnpS')" in script:
+            name = script.split("putString(charIDToTypeID('Nm  '), ")[1].split(")")[0]
+            document._take_snapshot(name.strip("\"'"))
+        return JSX_OK
+
+
+class FakeSession:
+    """代替 photoshop.Session, 打开的总是 FakeSession.document"""
+
+    document: FakeDocument | None = None
+    counter: CallCounter | None = None
+
+    def __init__(self, file_path: str = None, action: str = None, **kwargs):
+        self.app = FakeApplication(self.counter, self.document)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    @property
+    def active_document(self) -> FakeDocument:
+        return self.app.activeDocument
+
+
+def build_document(
+    counter: CallCounter, groups: int, layers_per_group: int, text_ratio: float = 0.5, seed: int = 0
+) -> FakeDocument:
+    """
+    生成图层树: groups 个图层组, 每组 layers_per_group 个图层, 部分为文本图层
+    图层路径为 "组{g}/图层{i}"
+    """
+    rng = random.Random(seed)
+    layer_sets = []
+    for g in range(groups):
+        art_layers = [
+            FakeArtLayer(
+                counter,
+                f"图层{i}",
+                visible=rng.random() < 0.5,
+                text=f"文本{g}-{i}" if rng.random() < text_ratio else None,
+            )
+            for i in range(layers_per_group)
+        ]
+        layer_sets.append(FakeLayerSet(counter, f"组{g}", art_layers))
+    return FakeDocument(counter, "bench.psd", [FakeArtLayer(counter, "背景")], layer_sets)
+
+
+_default_counter = CallCounter()
+
+
+def _fake_module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def install():
+    """
+    用模拟对象模型代替 photoshop 包, 必须在导入 src.ps_core 之前调用
+    已经导入的模块中引用的 Session 和 SolidColor 也会被替换
+    """
+    save_options = {
+        name: type(name, (), {})
+        for name in (
+            "BMPSaveOptions",
+            "EPSSaveOptions",
+            "GIFSaveOptions",
+            "JPEGSaveOptions",
+            "PDFSaveOptions",
+            "PhotoshopSaveOptions",
+            "PNGSaveOptions",
+            "TargaSaveOptions",
+            "TiffSaveOptions",
+        )
+    }
+    api = _fake_module("photoshop.api", SolidColor=FakeSolidColor, **save_options)
+    sys.modules.update(
+        {
+            "photoshop": _fake_module("photoshop", Session=FakeSession, api=api),
+            "photoshop.api": api,
+            "photoshop.api._artlayer": _fake_module("photoshop.api._artlayer", ArtLayer=FakeArtLayer),
+            "photoshop.api._layerSet": _fake_module("photoshop.api._layerSet", LayerSet=FakeLayerSet),
+        }
+    )
+    for module_name, attrs in (
+        ("src.ps_core", {"Session": FakeSession}),
+        ("src.layer_factory", {"Session": FakeSession}),
+        ("src.ps_utils", {"SolidColor": FakeSolidColor, **save_options}),
+    ):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            module.__dict__.update(attrs)
+
+
+def open_document(document: FakeDocument, counter: CallCounter):
+    """指定下一次 Session 打开的文档"""
+    FakeSession.document = document
+    FakeSession.counter = counter
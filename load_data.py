@@ -1,9 +1,93 @@
 """本模块包含用于加载和预处理数据的函数"""
 
+from functools import lru_cache
 from itertools import zip_longest
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 
-import xlwings as xw
+from src.xlsm_reader import XlsmWorkbook
+
+# 导出配置信息在表格中的名称, 顺序与 settings 一致
+SETTING_NAMES = ["psd_name", "psd_file_path", "export_folder", "file_format", "suffix"]
+DEFAULT_SETTINGS = [None, None, "导出图片", "png", ""]
+# 选择列中表示不选择的值
+UNSELECTED_VALUES = {"", "0", "0.0", "F", "FALSE", "N", "NO", "否"}
+# 可显性表头中的图层组重复编号, 同一图层组需要操作多次时 excel 会自动加编号
+DUPLICATE_SUFFIXES = {str(i) for i in range(1, 11)}
+# 指定任务模板(psd_name)的列, 没有该列时所有任务使用导出配置中的模板
+TEMPLATE_COLUMN = "模板"
+# 列操作列表: ((列索引, "text" 或 "visible", 图层路径), ...)
+ColumnPlan = Tuple[Tuple[int, str, Tuple[str, ...]], ...]
+
+
+@lru_cache(maxsize=64)
+def compile_column_plan(header: Tuple[Any, ...]) -> ColumnPlan:
+    """
+    把表头编译为列操作列表, 每种表头只解析一次
+    :param header: 表头
+    :return: 列操作列表, 不修改图层的列不包含在内
+    """
+    plan = []
+    for index, column in enumerate(header):
+        if not isinstance(column, str):
+            continue
+        # 匹配标题属性
+        match column.split("丨"):
+            # 匹配修改文本图层属性
+            case ["文本", str(layer_set), str(layer_name)]:
+                path = (layer_name,) if layer_set == "" else (layer_set, layer_name)
+                plan.append((index, "text", path))
+            # 匹配表头中修改可显性图层属性, 图层名在单元格中
+            case ["可显性", str(layer_set_1), str(layer_set_2)]:
+                if layer_set_1 == "" and layer_set_2 == "":
+                    path = ()
+                # 这里如果两个图层组需要操作两次的话, 就会在表格中重复, excel 会自动多一个复制处理
+                elif layer_set_2 == "" or layer_set_2 in DUPLICATE_SUFFIXES:
+                    path = (layer_set_1,)
+                else:
+                    path = (layer_set_1, layer_set_2)
+                plan.append((index, "visible", path))
+    return tuple(plan)
+
+
+def convert_row(plan: ColumnPlan, row: List[Any]) -> Dict[str, Any]:
+    """
+    按列操作列表把一行的值转换为图层修改指令
+    :param plan: compile_column_plan 的结果
+    :param row: 一行的值列表
+    :return: {图层路径: 图层属性}
+    """
+    layer_dict = {}
+    row_length = len(row)
+    for index, kind, path in plan:
+        value = row[index] if index < row_length else None
+        if value is None:
+            continue
+        if kind == "text":
+            text_item = {}
+            match str(value).split("丨"):
+                case [str(text), str(font_size), str(font_color)]:
+                    text_item["contents"] = text
+                    text_item["size"] = int(font_size)
+                    text_item["color"] = font_color
+                case [str(text), str(font_size)]:
+                    text_item["contents"] = text
+                    text_item["size"] = int(font_size)
+                case _:
+                    text_item["contents"] = value
+            layer_dict["/".join(path)] = {"textItem": text_item}
+        else:
+            # 匹配单元格内容
+            match value.split("丨"):
+                # 如果是T或F, 则直接设置visible属性
+                case [str(layer_name), "T"]:
+                    layer_info = {"visible": True}
+                case [str(layer_name), "F"]:
+                    layer_info = {"visible": False}
+                # 如果没有, 默认为True
+                case _:
+                    layer_name, layer_info = value, {"visible": True}
+            layer_dict["/".join(path + (layer_name,))] = layer_info
+    return layer_dict
 
 
 class LoadData:
@@ -15,6 +99,8 @@ class LoadData:
         :param sheet_name: 工作表名称
         :param table_name: 表格名称或索引
         """
+        import xlwings as xw
+
         try:
             if sheet_name:
                 self.sheet = xw.books.active.sheets[sheet_name]
@@ -38,108 +124,142 @@ class LoadData:
     def read_settings(self) -> List[Any]:
         """读取导出配置信息"""
         try:
-            settings: List[Any] = [
-                self.sheet.range("psd_name").value,
-                self.sheet.range("psd_file_path").value,
-                self.sheet.range("export_folder").value,
-                self.sheet.range("file_format").value,
-                self.sheet.range("suffix").value,
-            ]
+            settings: List[Any] = [self.sheet.range(name).value for name in SETTING_NAMES]
         except ValueError as e:
             print(f"无法读取到表格中的配置信息,将使用默认配置\n{e}")
-            settings = [None, None, "导出图片", "png", ""]
+            settings = list(DEFAULT_SETTINGS)
         return settings
 
-    def read_range(self) -> List[Dict[str, Any]]:
-        """读取表格数据并返回列表"""
-        result_list = []
+    @staticmethod
+    def task_name(filename: Any) -> str:
+        """导出文件名转换为任务名"""
+        return str(filename).replace(".0", "")
 
-        for row in self.table_values:
-            row_dict = {k: v for k, v in zip_longest(self.table_header, row, fillvalue=None)}
-            result_list.append(row_dict)
-        return result_list
+    def table_rows(self) -> Tuple[List[Any], Iterable[List[Any]]]:
+        """返回表头和数据行, 每行为与表头对应的值列表"""
+        return self.table_header, self.table_values
 
-    def filter_data(self, input_data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    def read_range(self) -> Iterator[Dict[str, Any]]:
+        """逐行读取表格数据"""
+        header, rows = self.table_rows()
+        for row in rows:
+            yield {k: v for k, v in zip_longest(header, row, fillvalue=None)}
+
+    def filter_data(self, input_data: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
         """过滤数据，构造图层修改指令"""
         result_dict = {}
         for row_dict in input_data:
-            # 创建一个所有图层的字典
-            layer_dict = {}
-            for header in row_dict.keys():
-                if row_dict[header] is not None:
-                    # 创建单个图层的字典
-                    layer_info = {}
-                    # 匹配标题属性
-                    header_parts = header.split("丨")
-                    match header_parts:
-                        # 匹配修改文本图层属性
-                        case ["文本", str(layer_set), str(layer_name)]:
-                            layer_info["图层路径"] = (
-                                [layer_name]
-                                if layer_set == ""
-                                else [layer_set, layer_name]
-                            )
-
-                            layer_info["textItem"] = {}
-                            cell_value_parts = str(row_dict[header]).split("丨")
-                            match cell_value_parts:
-                                case [str(text), str(font_size), str(font_color)]:
-                                    layer_info["textItem"]["contents"] = text
-                                    layer_info["textItem"]["size"] = int(font_size)
-                                    layer_info["textItem"]["color"] = font_color
-                                case [str(text), str(font_size)]:
-                                    layer_info["textItem"]["contents"] = text
-                                    layer_info["textItem"]["size"] = int(font_size)
-                                case _:
-                                    layer_info["textItem"]["contents"] = row_dict[header]
-
-                        # 匹配表头中修改可显性图层属性
-                        case ["可显性", str(layer_set_1), str(layer_set_2)]:
-                            if layer_set_1 == "" and layer_set_2 == "":
-                                layer_info["图层路径"] = []
-                            # 这里如果两个图层组需要操作两次的话, 就会在表格中重复, excel 会自动多一个复制处理
-                            elif layer_set_2 == "" or layer_set_2 in [
-                                str(i) for i in range(1, 11)
-                            ]:
-                                layer_info["图层路径"] = [layer_set_1]
-                            else:
-                                layer_info["图层路径"] = [layer_set_1, layer_set_2]
-                            # 匹配单元格内容
-                            cell_value_parts = row_dict[header].split("丨")
-                            match cell_value_parts:
-                                # 如果是T或F, 则直接设置visible属性
-                                case [str(layer_name), "T"]:
-                                    layer_info["图层路径"].append(layer_name)
-                                    layer_info["visible"] = True
-                                case [str(layer_name), "F"]:
-                                    layer_info["图层路径"].append(layer_name)
-                                    layer_info["visible"] = False
-                                # 如果没有, 默认为True
-                                case _:
-                                    layer_info["图层路径"].append(row_dict[header])
-                                    layer_info["visible"] = True
-
-                    if layer_info:
-                        full_path = "/".join(layer_info["图层路径"])
-                        del layer_info["图层路径"]
-                        layer_dict[full_path] = layer_info
-            result_dict[row_dict["导出文件名"]] = layer_dict
+            plan = compile_column_plan(tuple(row_dict))
+            result_dict[row_dict["导出文件名"]] = convert_row(plan, list(row_dict.values()))
         return result_dict
 
+    def iter_tasks(
+        self, select: Callable[[List[Any]], bool] | None = None
+    ) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        逐行构造任务, 只转换选中的行
+        :param select: 接收一行的值列表, 返回是否选中; 为空时选中所有行
+        :return: 迭代 (导出文件名, {"任务名", "内容"}), 表格中有模板列且有值时任务包含 "模板"
+        """
+        header, rows = self.table_rows()
+        plan = compile_column_plan(tuple(header))
+        filename_index = header.index("导出文件名")
+        template_index = header.index(TEMPLATE_COLUMN) if TEMPLATE_COLUMN in header else None
+        for row in rows:
+            if select is None or select(row):
+                filename = row[filename_index]
+                task = {"任务名": self.task_name(filename), "内容": convert_row(plan, row)}
+                if template_index is not None and row[template_index] is not None:
+                    task["模板"] = str(row[template_index])
+                yield filename, task
+
+    def collect_tasks(
+        self, select: Callable[[List[Any]], bool] | None = None
+    ) -> List[Dict[str, Any]]:
+        """
+        返回选中行的任务列表, 导出文件名重复时使用最后一行的内容
+        :param select: 同 iter_tasks
+        """
+        return list(dict(self.iter_tasks(select)).values())
+
     def selected_skus(self) -> List[Dict[str, Any]]:
         """返回选中的SKUs"""
-        processed_data = self.filter_data(self.read_range())
-        result: List[Dict[str, Any]] = []
         # 如果没有选择SKU, 则返回空列表
-        if self.selected_ranges:
-            if isinstance(self.selected_ranges, tuple):
-                sku_list = [i[0] for i in self.selected_ranges if i is not None]
-            else:
-                sku_list = [self.selected_ranges]
-            for filename, content in processed_data.items():
-                if filename in sku_list:
-                    result.append({"任务名": str(filename).replace(".0", ""), "内容": content})
-        return result
+        if not self.selected_ranges:
+            return []
+        if isinstance(self.selected_ranges, tuple):
+            sku_set = {i[0] for i in self.selected_ranges if i is not None}
+        else:
+            sku_set = {self.selected_ranges}
+        sku_set.discard(None)
+        filename_index = self.table_header.index("导出文件名")
+        return self.collect_tasks(lambda row: row[filename_index] in sku_set)
+
+
+class XlsmLoadData(LoadData):
+    """
+    直接读取 .xlsm 文件的 LoadData, 不需要运行 Excel
+    任务由选择列或任务名列表筛选, 代替 Excel 中选中的单元格
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        sheet_name: str = None,
+        table_name: str | int = 0,
+        select_column: str = None,
+        skus: Iterable[Any] = None,
+    ):
+        """
+        :param file_path: .xlsm 文件路径
+        :param sheet_name: 工作表名称, 默认为保存时的活动工作表
+        :param table_name: 表格名称或索引
+        :param select_column: 选择列的表头, 该列有值(且不为 F/0/否)的行被选中
+        :param skus: 需要导出的文件名列表
+        """
+        self.workbook = XlsmWorkbook(file_path)
+        self.sheet_name = sheet_name or self.workbook.active_sheet
+        self.table_name = table_name
+        self.select_column = select_column
+        # 与任务名相同的规则统一为文本, 表格中的数字文件名可以直接用命令行参数匹配
+        self.skus = None if skus is None else {self.task_name(sku) for sku in skus}
+        self.table_header, _ = self.workbook.iter_table(self.sheet_name, table_name)
+        self.filename_index = self.table_header.index("导出文件名")
+        self.select_index = None
+        if select_column is not None:
+            if select_column not in self.table_header:
+                raise KeyError(f"表格中没有选择列: {select_column}")
+            self.select_index = self.table_header.index(select_column)
+        self.settings = self.read_settings()
+
+    def read_settings(self) -> List[Any]:
+        """读取命名单元格中的导出配置信息"""
+        try:
+            values = self.workbook.read_names(SETTING_NAMES, self.sheet_name)
+            settings = [values[name] for name in SETTING_NAMES]
+        except ValueError as e:
+            print(f"无法读取到表格中的配置信息,将使用默认配置\n{e}")
+            settings = list(DEFAULT_SETTINGS)
+        return settings
+
+    def table_rows(self) -> Tuple[List[Any], Iterable[List[Any]]]:
+        """流式读取表头和数据行"""
+        return self.workbook.iter_table(self.sheet_name, self.table_name)
+
+    def is_selected(self, row: List[Any]) -> bool:
+        """判断一行是否被选中, 未指定选择列和任务名列表时选中所有行"""
+        filename = row[self.filename_index]
+        if filename is None:
+            return False
+        if self.select_index is not None:
+            value = row[self.select_index]
+            if value is None or str(value).strip().upper() in UNSELECTED_VALUES:
+                return False
+        return self.skus is None or self.task_name(filename) in self.skus
+
+    def selected_skus(self) -> List[Dict[str, Any]]:
+        """返回选中的SKUs, 只转换选中的行"""
+        return self.collect_tasks(self.is_selected)
 
 
 if __name__ == "__main__":
@@ -1,49 +1,251 @@
 """主启动函数"""
 
+import argparse
 import os
 import sys
 
-from src.load_data import LoadData
-from src.ps_core import Photoshop
-
-
-class PSFactory:
-    """Photoshop 工厂类，用于创建指定类型的图像处理引擎实例（支持扩展）"""
-
-    @staticmethod
-    def create_engine(engine_type: str, *args, **kwargs):
-        if engine_type.lower() == "photoshop":
-            return Photoshop(*args, **kwargs)
-        else:
-            raise ValueError(f"不支持的图像处理引擎: {engine_type}")
-
+from loguru import logger
+
+from load_data import LoadData, XlsmLoadData
+from src.batch_journal import BatchJournal
+from src.document_pool import TEMPLATE_KEY, DocumentPool
+from src.export_profile import parse_profile_spec
+from src.export_queue import ExportQueue
+from src.layer_tree_cache import LayerTreeCache
+from src.parallel_runner import run_parallel
+from src.profiler import Profiler
+from src.ps_factory import PSFactory
+from src.render_cache import RenderCache
+from src.render_server import serve
+from src.task_dedup import dedupe_tasks, duplicate_names
+from src.task_planner import plan_task_order
 
 main_working_dir = os.path.dirname(__file__)
 sys.path.append(main_working_dir)
 os.chdir(main_working_dir)
 
 
-def main():
-    """主启动函数"""
+def main(
+    engine_type: str = "photoshop",
+    plan_order: bool = False,
+    workers: int = 1,
+    cache_dir: str | None = None,
+    cache_size_mb: int = 2048,
+    xlsm_path: str | None = None,
+    sheet_name: str | None = None,
+    select_column: str | None = None,
+    skus: list[str] | None = None,
+    serve_port: int | None = None,
+    host: str = "127.0.0.1",
+    pool_size: int = 4,
+    export_profiles: list | None = None,
+    async_export: int = 0,
+    export_threads: int = 1,
+    profile: bool = False,
+    trace_path: str | None = None,
+    layer_cache: str | None = None,
+    journal_path: str | None = None,
+    fsync_interval: float = 1.0,
+    dedupe: bool = False,
+):
+    """
+    主启动函数
+    :param engine_type: 图像处理引擎, photoshop 或 native
+    :param plan_order: 是否重新排列任务顺序, 减少相邻任务之间的图层修改
+    :param workers: 并行渲染的进程数量, 仅离线引擎支持多进程, 任务指定了模板时只在单进程中运行
+    :param cache_dir: 渲染缓存目录, 为空时不使用缓存
+    :param cache_size_mb: 渲染缓存大小上限(MB)
+    :param xlsm_path: 直接读取的 .xlsm 文件, 为空时从运行中的 Excel 读取
+    :param sheet_name: 工作表名称, 默认为活动工作表
+    :param select_column: 选择列的表头, 仅读取 .xlsm 文件时使用
+    :param skus: 需要导出的文件名, 仅读取 .xlsm 文件时使用
+    :param serve_port: 指定时以常驻渲染服务运行, 通过 HTTP 接收任务
+    :param host: 渲染服务监听地址
+    :param pool_size: 任务指定了多个模板时最多同时打开的模板数量
+    :param export_profiles: 导出配置列表, 每个任务按每个配置导出一个文件
+    :param async_export: 大于 0 时异步导出, 最多等待写出的任务数量
+    :param export_threads: 异步导出写出文件的线程数量
+    :param profile: 是否统计各阶段耗时, 结束时打印分位数
+    :param trace_path: 写出 Chrome trace JSON 的路径, 指定时同时统计耗时
+    :param layer_cache: 图层树缓存目录, 为空字符串时保存在模板旁边, 为 None 时不使用
+    :param journal_path: 批处理日志路径, 重新运行时跳过已完成的任务, 中断后先恢复模板
+    :param fsync_interval: 批处理日志写入磁盘的间隔(秒)
+    :param dedupe: 内容相同的任务只渲染一次, 其他任务的文件用硬链接或复制生成
+    """
+    profiler = Profiler() if profile or trace_path else None
+    journal = BatchJournal(journal_path, fsync_interval) if journal_path else None
     try:
-        load_data = LoadData()
+        if xlsm_path:
+            load_data = XlsmLoadData(
+                xlsm_path, sheet_name, select_column=select_column, skus=skus
+            )
+        else:
+            load_data = LoadData(sheet_name)
 
         ps_settings, suffix = load_data.settings[:-1], load_data.settings[-1]
-
-        # 使用工厂模式创建 Photoshop 实例
-        ps = PSFactory.create_engine("photoshop", *ps_settings)
-
-        # 遍历整个字典
-        for task in load_data.selected_skus():
-            print(task["内容"])
-            ps.core(task["任务名"] + suffix, task["内容"])
-
-        # 执行完毕后恢复图层状态
-        ps.restore_all_layers_to_initial()
+        engine_kwargs = {}
+        if cache_dir:
+            engine_kwargs["render_cache"] = RenderCache(cache_dir, cache_size_mb << 20)
+        if export_profiles:
+            engine_kwargs["export_profiles"] = export_profiles
+        if async_export > 0:
+            engine_kwargs["export_queue"] = ExportQueue(async_export, export_threads)
+        if profiler is not None:
+            engine_kwargs["profiler"] = profiler
+        if layer_cache is not None:
+            engine_kwargs["layer_tree_cache"] = LayerTreeCache(layer_cache or None)
+        if journal is not None:
+            engine_kwargs["journal"] = journal
+
+        if serve_port is not None:
+            # 使用表格中的模板配置打开文档, 之后的任务由 HTTP 请求提交
+            serve(engine_type, tuple(ps_settings), engine_kwargs, host, serve_port)
+            return
+
+        tasks = load_data.selected_skus()
+        if dedupe:
+            tasks, report = dedupe_tasks(tasks)
+            print(
+                f"任务去重: {report['task_count']} 个任务, 渲染 {report['render_count']} 次, "
+                f"节省 {report['renders_saved']} 次"
+            )
+        if any(TEMPLATE_KEY in task for task in tasks):
+            # 任务指定了模板时按模板路由到文档池中已打开的文档
+            if workers > 1:
+                logger.warning(f"任务指定了模板, 文档池只在单进程中运行, 忽略 --workers {workers}")
+            with DocumentPool(
+                engine_type, tuple(ps_settings), engine_kwargs, max_open=pool_size
+            ) as pool:
+                result = pool.run(tasks, suffix, plan_order=plan_order)
+            print(
+                f"渲染完成 {len(result['outputs'])} 个, 失败 {len(result['errors'])} 个, "
+                f"打开模板 {pool.stats['opened']} 次"
+            )
+            return
+
+        if workers > 1:
+            result = run_parallel(
+                tasks,
+                suffix,
+                engine_type=engine_type,
+                engine_args=tuple(ps_settings),
+                engine_kwargs=engine_kwargs,
+                workers=workers,
+            )
+            print(f"渲染完成 {len(result['outputs'])} 个, 失败 {len(result['errors'])} 个")
+            return
+
+        # 使用工厂模式创建图像处理引擎实例
+        ps = PSFactory.create_engine(engine_type, *ps_settings, **engine_kwargs)
+
+        if plan_order:
+            tasks, report = plan_task_order(tasks)
+            print(
+                f"任务排序: 图层属性修改 {report['original_cost']} -> "
+                f"{report['planned_cost']} 次, 预计节省 {report['saved_ratio']:.1%}"
+            )
+
+        # 遍历整个字典, 退出时恢复图层状态
+        with ps:
+            for task in tasks:
+                print(task["内容"])
+                ps.core(
+                    task["任务名"] + suffix,
+                    task["内容"],
+                    duplicates=duplicate_names(task, suffix),
+                )
 
     except Exception as e:
         print(f"程序执行出错: {e}")
+    finally:
+        if journal is not None:
+            journal.close()
+        if profiler is not None:
+            print(profiler.report())
+            if trace_path:
+                profiler.write_chrome_trace(trace_path)
+                print(f"Chrome trace 已写出到 {trace_path}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="根据表格数据批量修改 PSD 图层并导出")
+    parser.add_argument(
+        "engine", nargs="?", default="photoshop", choices=["photoshop", "native"]
+    )
+    parser.add_argument("--workers", type=int, default=1, help="并行渲染的进程数量, 任务指定了模板时不生效")
+    parser.add_argument(
+        "--plan", action="store_true", help="重新排列任务顺序, 减少相邻任务之间的图层修改"
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="内容相同的任务只渲染一次, 其他导出文件与渲染结果硬链接, 原地修改其中一个会同时改变其他文件",
+    )
+    parser.add_argument("--cache-dir", help="渲染缓存目录, 命中缓存的任务跳过渲染")
+    parser.add_argument("--cache-size-mb", type=int, default=2048, help="渲染缓存大小上限")
+    parser.add_argument("--xlsm", help="直接读取 .xlsm 文件, 不需要运行 Excel")
+    parser.add_argument("--sheet", help="工作表名称, 默认为活动工作表")
+    parser.add_argument("--select-column", help="选择列的表头, 该列有值的行被导出")
+    parser.add_argument(
+        "--sku", action="append", dest="skus", help="需要导出的文件名, 可重复指定"
+    )
+    parser.add_argument("--serve", type=int, metavar="PORT", help="以常驻渲染服务运行")
+    parser.add_argument("--host", default="127.0.0.1", help="渲染服务监听地址")
+    parser.add_argument("--pool-size", type=int, default=4, help="最多同时打开的模板数量")
+    parser.add_argument(
+        "--export-profile",
+        action="append",
+        dest="export_profiles",
+        type=parse_profile_spec,
+        help="导出配置, 如 jpg,quality=85,suffix=_web 或 png,width=400,suffix=_thumb, 可重复指定",
+    )
+    parser.add_argument(
+        "--async-export",
+        type=int,
+        default=0,
+        metavar="N",
+        help="异步导出, 编码写出和下一个任务的图层修改同时进行, 最多 N 个任务等待写出",
+    )
+    parser.add_argument("--export-threads", type=int, default=1, help="异步导出的线程数量")
+    parser.add_argument("--profile", action="store_true", help="统计各阶段耗时并打印分位数")
+    parser.add_argument("--trace", metavar="PATH", help="写出 Chrome trace JSON 文件")
+    parser.add_argument("--journal", metavar="PATH", help="批处理日志, 中断后重新运行时从中断处继续")
+    parser.add_argument(
+        "--fsync-interval", type=float, default=1.0, help="批处理日志写入磁盘的间隔(秒)"
+    )
+    parser.add_argument(
+        "--layer-cache",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="缓存模板的图层树, 模板没有变化时不再遍历图层; 不指定目录时保存在模板旁边",
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    main(
+        args.engine,
+        plan_order=args.plan,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        cache_size_mb=args.cache_size_mb,
+        xlsm_path=args.xlsm,
+        sheet_name=args.sheet,
+        select_column=args.select_column,
+        skus=args.skus,
+        serve_port=args.serve,
+        host=args.host,
+        pool_size=args.pool_size,
+        export_profiles=args.export_profiles,
+        async_export=args.async_export,
+        export_threads=args.export_threads,
+        profile=args.profile,
+        trace_path=args.trace,
+        layer_cache=args.layer_cache,
+        journal_path=args.journal,
+        fsync_interval=args.fsync_interval,
+        dedupe=args.dedupe,
+    )
\ No newline at end of file
@@ -0,0 +1,509 @@
+"""图像处理引擎基类"""
+
+import os
+from time import perf_counter_ns
+
+from loguru import logger
+
+from .export_profile import ExportProfile, parse_profiles
+from .base_layer_factory import list_all_layers
+from .batch_journal import BatchJournal
+from .export_queue import ExportError, ExportQueue, ExportTicket, ExportWrite
+from .layer_state import EMPTY_STATE, LayerState
+from .layer_tree_cache import LayerTreeCache
+from .profiler import Profiler
+from .render_cache import RenderCache, content_key, link_or_copy
+
+
+class BaseCore:
+    """图像处理引擎基类：封装与具体后端无关的任务处理流程"""
+
+    def __init__(
+        self,
+        psd_name: str,
+        psd_dir_path: str = None,
+        export_folder: str = "default_export_folder",
+        file_format: str = "png",
+        colse_ps: bool = False,
+        render_cache: RenderCache | None = None,
+        export_profiles: list | None = None,
+        export_queue: ExportQueue | None = None,
+        profiler: Profiler | None = None,
+        layer_tree_cache: LayerTreeCache | None = None,
+        journal: BatchJournal | None = None,
+    ):
+        """
+        初始化图像处理引擎
+        :param psd_name: psd文件名
+        :param psd_dir_path: psd文件路径,默认工作目录下的psd文件夹
+        :param export_folder: 导出文件夹名,是在默认工作目录下创建
+        :param file_format: 导出文件格式，默认为png
+        :param render_cache: 导出结果缓存, 命中时跳过渲染和导出
+        :param export_profiles: 默认导出配置列表, 每个任务按每个配置导出一个文件;
+            为空时只按 file_format 导出原尺寸文件
+        :param export_queue: 异步导出队列, 合成结果交给后台线程写出, 同时开始下一个任务;
+            引擎不支持时仍然同步导出
+        :param profiler: 耗时统计, 为空时不统计
+        :param layer_tree_cache: 图层树缓存, 模板没有变化时不再遍历图层, get_psd_info 不再打开文档
+        :param journal: 批处理日志, 跳过已完成的任务, 上次运行中断时打开模板后先恢复图层
+        """
+        self.psd_name = psd_name
+        self.psd_dir_path = psd_dir_path
+        self.export_folder = self._create_export_folder(export_folder)
+        self.file_format = file_format.lower()
+        self.colse_ps = colse_ps
+        self.render_cache = render_cache
+        self.export_profiles = parse_profiles(export_profiles)
+        self.export_queue = export_queue
+        # 异步导出失败的文件 {导出文件名: {路径: 错误信息}}
+        self.export_errors: dict[str, dict[str, str]] = {}
+        self.profiler = profiler or Profiler(enabled=False)
+        self.layer_tree_cache = layer_tree_cache
+        self.journal = journal
+        self.run_time_record: dict[str, float] = {}  # 每个任务的运行时间(秒)
+
+    def __enter__(self):
+        """初始化会话"""
+        with self.profiler.span("open", psd_name=self.psd_name):
+            session = self._init_ps_session()
+        self.layer_factory.profiler = self.profiler
+        return session
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """等待异步导出完成并关闭会话, 有文件导出失败时抛出 ExportError"""
+        failed = self._flush_export_queue()
+        try:
+            self._restore_layers()
+            self._journal_restored()
+            if self.colse_ps:
+                self.doc.close()
+        finally:
+            self._release_resources()
+        if failed and exc_type is None:
+            raise ExportError(failed)
+
+    def _restore_layers(self):
+        """结束会话时把所有修改过的图层恢复到初始状态"""
+        self.layer_factory.restore_all_layers_to_initial()
+
+    def _release_resources(self):
+        """结束会话或关闭文档后释放引擎占用的线程等资源"""
+
+    def _flush_export_queue(self) -> dict[str, dict[str, str]]:
+        """等待异步导出队列写完, 返回失败的文件并记录到 export_errors"""
+        if self.export_queue is None:
+            return {}
+        failed = self.export_queue.flush()
+        self.export_errors.update(failed)
+        return failed
+
+    def flush_exports(self):
+        """等待已提交的异步导出全部写出, 有文件导出失败时抛出 ExportError"""
+        failed = self._flush_export_queue()
+        if failed:
+            raise ExportError(failed)
+
+    def _init_ps_session(self):
+        """
+        初始化会话, 打开文档并创建图层工厂
+        """
+        raise NotImplementedError
+
+    def _prepare_layers(self):
+        """打开文档后建立图层索引, 恢复上次中断时修改过的图层, 再记录快照"""
+        self._index_layers()
+        self._restore_from_journal()
+        # 记录打开时的快照, 大量图层需要恢复时一次恢复
+        self.layer_factory.capture_snapshot()
+
+    def _restore_from_journal(self):
+        """
+        上次运行中断时模板可能仍停留在某个任务的状态, 按日志中的初始状态恢复图层,
+        这些图层之后不再从文档读取初始状态
+        """
+        if self.journal is None:
+            return
+        states = self.journal.initial_states(self.psd_file_path)
+        if not states:
+            return
+        logger.warning(f"上次运行没有恢复模板 {self.psd_file_path}, 按日志恢复 {len(states)} 个图层")
+        layer_factory = self.layer_factory
+        # 文档状态未知, 丢弃所有本地值, 每个属性都重新写入
+        layer_factory.invalidate()
+        for layer_name, state in states.items():
+            layer_factory.current_state.pop(layer_name, None)
+            layer_factory.change_layer_state(layer_name, state)
+        layer_factory.initial_state.update(states)
+
+    def _journal_restored(self):
+        """模板已经恢复到初始状态, 日志中不再需要其中的初始状态"""
+        if self.journal is not None:
+            self.journal.record_restored(self.psd_file_path)
+
+    def _index_layers(self):
+        """
+        打开文档后建立图层索引: 图层树缓存有效时从缓存读取, 图层第一次使用时再定位;
+        否则遍历一次图层树, 使用缓存时同时写入缓存
+        """
+        cache = self.layer_tree_cache
+        tree = cache.load(self.psd_file_path) if cache is not None else None
+        if tree is not None:
+            self.layer_factory.load_layer_tree(tree)
+            return
+        self.layer_factory.build_layer_index()
+        if cache is not None:
+            cache.save(self.psd_file_path, self._layer_tree())
+
+    def _layer_tree(self) -> dict:
+        """写入图层树缓存的内容: 文档名、尺寸和图层树"""
+        return {
+            "name": self.doc.name,
+            "width": float(self.doc.width),
+            "height": float(self.doc.height),
+            **self.layer_factory.dump_layer_tree(),
+        }
+
+    def activate(self):
+        """把本引擎的文档设为当前文档, 同时打开多个文档时切换前调用"""
+
+    def close_document(self):
+        """
+        等待异步导出写完后不恢复图层直接关闭文档, 未保存的修改全部丢弃, 并释放引擎资源
+        导出失败的文件记录在 export_errors 中, 不抛出异常
+        """
+        self._flush_export_queue()
+        try:
+            self.doc.close()
+            self._journal_restored()
+        finally:
+            self._release_resources()
+
+    def _get_psd_file_path(self) -> str | None:
+        """
+        获取PSD文件路径
+        :return: PSD文件完整路径
+        """
+        try:
+            base_path = self.psd_dir_path or os.path.join(os.getcwd(), "psd")
+            # 尝试PSD和PSB两种格式
+            for ext in [".psd", ".psb"]:
+                file_path = os.path.join(base_path, f"{self.psd_name}{ext}")
+                if os.path.isfile(file_path):
+                    return file_path
+        except Exception as e:
+            logger.error(f"获取PSD文件路径失败: {e}")
+            raise FileNotFoundError(f"找不到PSD文件: {self.psd_name}")
+
+    def _create_export_folder(self, export_folder: str) -> str:
+        """
+        创建导出文件夹
+        :param export_folder: 导出文件夹名
+        :return: 导出文件夹完整路径
+        """
+        try:
+            full_path = os.path.join(os.getcwd(), export_folder)
+            if not os.path.exists(full_path):
+                os.makedirs(full_path)
+                logger.warning(f"创建文件夹 {full_path} 成功")
+            return full_path
+
+        except Exception as e:
+            raise FileNotFoundError(f"创建文件夹 {full_path} 失败: {e}")
+
+    def _export_path(self, export_name: str) -> str:
+        """导出文件完整路径"""
+        return f"{self.export_folder}/{export_name}.{self.file_format}"
+
+    def _export_targets(
+        self, export_name: str, export_profiles: list[ExportProfile] | None = None
+    ) -> list[tuple[ExportProfile | None, str]]:
+        """
+        一个任务的所有导出文件
+        :return: [(导出配置, 完整路径)], 没有导出配置时为 [(None, 原格式路径)]
+        """
+        if not export_profiles:
+            return [(None, self._export_path(export_name))]
+        return [
+            (profile, f"{self.export_folder}/{profile.file_name(export_name)}")
+            for profile in export_profiles
+        ]
+
+    def get_psd_info(self) -> dict:
+        """
+        返回当前psd文件信息，包括所有图层集及其对应的图层
+        图层树缓存有效时直接从缓存返回, 不打开文档
+        """
+        if self.layer_tree_cache is not None:
+            psd_file_path = self._get_psd_file_path()
+            tree = self.layer_tree_cache.load(psd_file_path) if psd_file_path else None
+            if tree is not None:
+                return {
+                    "name": tree["name"],
+                    "psd_file_path": psd_file_path,
+                    "psd_size": f"width: {tree['width']:.0f}, height: {tree['height']:.0f}",
+                    "all_layer": list_all_layers(tree["names"]),
+                }
+        with self:
+            return {
+                "name": self.doc.name,
+                "psd_file_path": self.psd_file_path,
+                "psd_size": f"width: {self.doc.width:.0f}, height: {self.doc.height:.0f}",
+                "all_layer": self.layer_factory.get_all_layers(),
+            }
+
+    def ps_saveas(self, export_name: str, export_profiles: list[ExportProfile] | None = None):
+        """
+        保存文件到指定路径
+        :param export_name: 导出文件名
+        :param export_profiles: 导出配置列表, 为空时只按 file_format 导出
+        """
+        raise NotImplementedError
+
+    def render_options(self) -> dict:
+        """
+        影响导出图像的引擎参数, 作为渲染缓存键的一部分, 不同引擎或参数的渲染结果不共用缓存
+        :return: {参数名: 值}
+        """
+        return {"engine": type(self).__name__}
+
+    def _export_writes(
+        self, export_name: str, export_profiles: list[ExportProfile] | None = None
+    ) -> list[ExportWrite] | None:
+        """
+        取出当前合成结果, 生成可以在后台线程执行的写出函数
+        写出函数只能引用合成结果的副本, 不能引用之后会被修改的图层
+        :return: [(路径, 写出函数)], 引擎不支持异步导出时返回 None
+        """
+        return None
+
+    def _fan_out(
+        self,
+        targets: list[tuple[ExportProfile | None, str]],
+        duplicate_targets: dict[str, list[tuple[ExportProfile | None, str]]],
+    ):
+        """把导出文件硬链接或复制到内容相同的任务的导出路径"""
+        for dup_targets in duplicate_targets.values():
+            for (_, src_path), (_, dest_path) in zip(targets, dup_targets):
+                link_or_copy(src_path, dest_path)
+
+    def _content_keys(
+        self, input_data: dict, targets: list[tuple[ExportProfile | None, str]]
+    ) -> list[str]:
+        """
+        每个导出文件的内容键, 渲染缓存和批处理日志共用
+        :return: 与 targets 一一对应的内容键
+        """
+        render_options = self.render_options()
+        return [
+            content_key(
+                self.psd_file_path,
+                input_data,
+                profile.file_format if profile else self.file_format,
+                {"render": render_options, "profile": profile.to_dict() if profile else None},
+            )
+            for profile, _ in targets
+        ]
+
+    def _journal_done(
+        self,
+        export_name: str,
+        targets: list[tuple[ExportProfile | None, str]],
+        duplicate_targets: dict[str, list[tuple[ExportProfile | None, str]]],
+        keys: list[str],
+    ):
+        """在批处理日志中记录任务和内容相同的任务已经完成"""
+        if self.journal is None:
+            return
+        self.journal.record_done(export_name, _outputs(targets, keys))
+        for name, dup_targets in duplicate_targets.items():
+            self.journal.record_done(name, _outputs(dup_targets, keys))
+
+    def core(
+        self,
+        export_name: str,
+        input_data: dict,
+        export_profiles: list | None = None,
+        duplicates: list[str] | None = None,
+    ) -> ExportTicket | None:
+        """
+        核心处理函数
+        :param export_name: 导出文件名
+        :param input_data: 图层属性数据
+        :param export_profiles: 本任务的导出配置列表, 为空时使用创建引擎时的配置
+        :param duplicates: 内容与本任务相同的其他任务的导出文件名, 只渲染一次,
+            导出成功后用硬链接或复制生成它们的文件
+        :return: 异步导出时返回导出凭据, wait() 等待写出并抛出该任务的导出错误;
+            同步导出或命中缓存时返回 None
+        """
+        start_time = perf_counter_ns()
+        with self.profiler.span("task", "task", export_name=export_name):
+            ticket = self._run_task(export_name, input_data, export_profiles, duplicates)
+        # 记录运行时间, 异步导出时不包含写出文件的时间
+        self.run_time_record[export_name] = round((perf_counter_ns() - start_time) / 1e9, 2)
+        return ticket
+
+    def _run_task(
+        self,
+        export_name: str,
+        input_data: dict,
+        export_profiles: list | None,
+        duplicates: list[str] | None = None,
+    ) -> ExportTicket | None:
+        """执行一个任务的各个阶段, 参数见 core"""
+        layer_factory = self.layer_factory
+        profiler = self.profiler
+        if export_profiles is None:
+            export_profiles = self.export_profiles
+        else:
+            export_profiles = parse_profiles(export_profiles)
+        targets = self._export_targets(export_name, export_profiles)
+        duplicate_targets = {
+            name: self._export_targets(name, export_profiles) for name in duplicates or ()
+        }
+
+        content_keys = []
+        if self.render_cache is not None or self.journal is not None:
+            with profiler.span("cache"):
+                content_keys = self._content_keys(input_data, targets)
+
+        # 上次运行已经以相同内容完成并且导出文件(包括相同内容的任务)仍然存在的任务直接跳过
+        if self.journal is not None and self.journal.is_done(
+            {
+                **_outputs(targets, content_keys),
+                **{
+                    path: key
+                    for dup_targets in duplicate_targets.values()
+                    for path, key in _outputs(dup_targets, content_keys).items()
+                },
+            }
+        ):
+            logger.info(f"{export_name} 在批处理日志中已完成, 跳过")
+            self.journal.skipped += 1
+            return None
+
+        # 0. 相同模板和相同内容已经渲染过时直接使用缓存文件, 所有导出文件都命中才跳过
+        if self.render_cache is not None:
+            with profiler.span("cache"):
+                if all(
+                    self.render_cache.materialize(cache_key, export_path)
+                    for cache_key, (_, export_path) in zip(content_keys, targets)
+                ):
+                    logger.info(f"{export_name} 命中渲染缓存, 跳过渲染")
+                    self._fan_out(targets, duplicate_targets)
+                    self._journal_done(export_name, targets, duplicate_targets, content_keys)
+                    return None
+        # 导出文件可能是指向缓存或其他导出文件的硬链接, 先删除避免覆盖链接的内容
+        for _, export_path in targets:
+            if os.path.isfile(export_path) and os.stat(export_path).st_nlink > 1:
+                os.remove(export_path)
+        # 把 input_data 转换为不可变的图层状态
+        change_states = {
+            layer_name: LayerState.coerce(change_state)
+            for layer_name, change_state in input_data.items()
+        }
+
+        with profiler.span("restore"):
+            # 从快照修改更便宜时, 先一次恢复所有图层, 不再逐个恢复
+            if layer_factory.has_snapshot:
+                current_cost, base_cost = layer_factory.restore_costs(change_states)
+                if base_cost < current_cost:
+                    logger.info(
+                        f"{export_name} 从快照修改({base_cost} 次)比从当前状态修改"
+                        f"({current_cost} 次)更快, 先恢复快照"
+                    )
+                    layer_factory.revert_to_snapshot()
+
+            # 1.查找已经修改但接下来不需要修改的图层，需要恢复的图层
+            current_all_initialized = set(layer_factory.current_state.keys())
+            for layer_to_restore in current_all_initialized - change_states.keys():
+                initial_state = layer_factory.initial_state.get(layer_to_restore)
+                if not initial_state:
+                    continue
+                logger.info(f"正在恢复图层 {layer_to_restore} 到初始状态")
+                try:
+                    layer_factory.restore_layer_state(layer_to_restore)
+
+                    del layer_factory.initial_state[layer_to_restore]
+                    layer_factory.layer_initial_states.pop(layer_to_restore, None)
+                except Exception as e:
+                    logger.error(f"恢复图层 {layer_to_restore} 失败: {e}")
+
+        # 2. 执行任务之前看是否修改的属性需要记录修改前状态
+        with profiler.span("snapshot"):
+            # 任务修改的每个属性(可见性、位置、旋转、文本)都记录初始值, 之后的任务不再修改时可以恢复
+            for layer_name, change_state in change_states.items():
+                if layer_factory.unrecorded_state(layer_name, change_state):
+                    logger.debug(f"图层 {layer_name} 需要记录初始状态")
+                    layer_factory.save_initial_layer_state(layer_name, change_state)
+            # 修改图层之前把初始状态写入日志, 中断后可以恢复模板
+            if self.journal is not None:
+                self.journal.record_initial(
+                    self.psd_file_path,
+                    {
+                        layer_name: layer_factory.initial_state[layer_name]
+                        for layer_name in change_states
+                        if layer_name in layer_factory.initial_state
+                    },
+                )
+
+        with profiler.span("change"):
+            for layer_name, change_state in change_states.items():
+                current_state = layer_factory.current_state.get(layer_name, EMPTY_STATE)
+                if not current_state:
+                    logger.warning(f"图层 {layer_name} 的初始属性不存在")
+
+                # 如果之前修改过位置或旋转过, 但这次不需要修改
+                if (current_state.move is not None and change_state.move is None) or (
+                    current_state.rotate and change_state.rotate is None
+                ):
+                    logger.info(f"图层 {layer_name} 需要先恢复位置和角度到初始状态")
+                    layer_factory.restore_layer_state(layer_name)
+
+                # 如果之前修改过字体大小或颜色，但这次不需要修改
+                if current_state.text is not None and change_state.text is not None:
+                    current_text, new_text = current_state.text, change_state.text
+                    if (current_text.size is not None and new_text.size is None) or (
+                        current_text.color is not None and new_text.color is None
+                    ):
+                        logger.info(f"图层 {layer_name} 需要先恢复字体大小和颜色到初始状态")
+                        layer_factory.restore_text_item_to_initial(layer_name)
+
+                # 3. 判断是否需要真正修改, 只比较属性级别的差异
+                current_state = layer_factory.current_state.get(layer_name, EMPTY_STATE)
+                delta = current_state.delta(change_state)
+                if delta:
+                    logger.info(
+                        f"图层 {layer_name} 状态不一致需要修改\n"
+                        f"修改前: {current_state}\n修改内容: {delta}"
+                    )
+                    # 4. 执行修改
+                    layer_factory.change_layer_state(layer_name, change_state)
+                else:
+                    logger.info(f"图层 {layer_name} 状态一致，无需修改")
+
+        # 5. 导出文件, 写入缓存、生成相同内容的任务的文件和记录完成必须在文件写出之后
+        def on_success():
+            if self.render_cache is not None:
+                for cache_key, (_, export_path) in zip(content_keys, targets):
+                    self.render_cache.put(cache_key, export_path)
+            self._fan_out(targets, duplicate_targets)
+            self._journal_done(export_name, targets, duplicate_targets, content_keys)
+
+        if self.render_cache is None and self.journal is None and not duplicate_targets:
+            on_success = None
+        with profiler.span("export"):
+            writes = None
+            if self.export_queue is not None:
+                writes = self._export_writes(export_name, export_profiles)
+            if writes is not None:
+                # 队列已满时在这里等待, 限制内存中的合成结果数量
+                return self.export_queue.submit(export_name, writes, on_success)
+            self.ps_saveas(export_name, export_profiles)
+            if on_success is not None:
+                on_success()
+        return None
+
+
+def _outputs(targets: list[tuple[ExportProfile | None, str]], keys: list[str]) -> dict[str, str]:
+    """{导出路径: 内容键}"""
+    return {path: key for (_, path), key in zip(targets, keys)}
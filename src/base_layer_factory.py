@@ -0,0 +1,402 @@
+"""图层工厂基类"""
+
+from loguru import logger
+
+from .layer_state import EMPTY_STATE, LayerState
+from .profiler import NULL_PROFILER, Profiler
+
+
+class BaseLayerFactory:
+    """图层工厂基类：管理图层的初始状态和当前状态，与具体图像处理后端无关"""
+
+    # 恢复一次快照相当于修改多少次图层属性, 用于选择恢复方式
+    snapshot_revert_cost = 2
+
+    def __init__(self):
+        self.layer_dict = {}  # 图层索引: 完整路径 -> 图层列表
+        self.layer_indexed = False  # 图层索引是否已建立
+        self.layer_tree: dict[str, tuple[list, list]] = {}  # 图层集路径 -> (图层名, 图层集名)
+        # 图层在文档中的位置: 完整路径 -> [(("set" | "art", 序号), ...)], 与图层索引一一对应
+        self.layer_locations: dict[str, list[tuple]] = {}
+        # 从图层树缓存读取、尚未定位的图层: 完整路径 -> [{"index", "visible", "bounds", "text"}]
+        self.layer_nodes: dict[str, list[dict]] = {}
+        self.initial_state: dict[str, LayerState] = {}  # 初始状态
+        # 同一路径下多个图层(拷贝图层)的初始状态不同时, 每个图层各自的初始状态
+        self.layer_initial_states: dict[str, list[LayerState]] = {}
+        self.current_state: dict[str, LayerState] = {}  # 当前状态
+        self.has_snapshot = False  # 是否已记录打开文档时的快照
+
+        self.profiler: Profiler = NULL_PROFILER  # 耗时统计, 由引擎设置
+
+    @property
+    def document(self):
+        """当前文档, 作为图层树的根节点"""
+        raise NotImplementedError
+
+    def get_all_layers(self) -> list:
+        """获取所有图层, 图层名来自图层索引, 不再逐个读取"""
+        if not self.layer_indexed:
+            self.build_layer_index()
+        return list_all_layers(self.layer_tree)
+
+    def build_layer_index(self):
+        """
+        遍历一次整个图层树, 建立 完整路径 -> 图层列表 的索引
+        与 getByName 行为保持一致: 同名时取第一个, 图层集优先于图层, 并附带 " 拷贝" 图层
+        """
+        self.layer_dict = {}
+        self.layer_tree = {}
+        self.layer_locations = {}
+        self.layer_nodes = {}
+        self._index_layer_set(self.document, "", ())
+        self.layer_indexed = True
+        logger.info(f"图层索引建立完成, 共 {len(self.layer_dict)} 条路径")
+
+    def _index_layer_set(self, parent, prefix: str, location: tuple):
+        """递归索引一个图层集下的所有图层"""
+        layer_sets = [(layer_set.name, layer_set) for layer_set in parent.layerSets]
+        art_layers = [(art_layer.name, art_layer) for art_layer in parent.artLayers]
+        self.layer_tree[prefix] = (
+            [name for name, _ in art_layers],
+            [name for name, _ in layer_sets],
+        )
+
+        # 先写入图层再写入图层集, 同名时图层集覆盖图层
+        for kind, candidates in (("art", art_layers), ("set", layer_sets)):
+            first_by_name = {}
+            for index, (name, layer) in enumerate(candidates):
+                first_by_name.setdefault(name, (location + ((kind, index),), layer))
+            for name, (layer_location, layer) in first_by_name.items():
+                change_layer_list = [layer]
+                locations = [layer_location]
+                copy = first_by_name.get(f"{name} 拷贝")
+                if copy is not None:
+                    change_layer_list.append(copy[1])
+                    locations.append(copy[0])
+                self.layer_dict[prefix + name] = change_layer_list
+                self.layer_locations[prefix + name] = locations
+
+        visited = set()
+        for index, (name, layer_set) in enumerate(layer_sets):
+            if name not in visited:
+                visited.add(name)
+                self._index_layer_set(layer_set, f"{prefix}{name}/", location + (("set", index),))
+
+    def dump_layer_tree(self) -> dict:
+        """
+        导出图层树, 用于图层树缓存
+        :return: {"names": {图层集路径: [图层名, 图层集名]},
+            "layers": {完整路径: [{"index", "visible", "bounds", "text"}]}}
+        """
+        if not self.layer_indexed:
+            self.build_layer_index()
+        return {
+            "names": {prefix: list(names) for prefix, names in self.layer_tree.items()},
+            "layers": {
+                path: [
+                    {"index": [list(step) for step in location], **self._describe_layer(layer)}
+                    for location, layer in zip(self.layer_locations[path], layer_list)
+                ]
+                for path, layer_list in self.layer_dict.items()
+                if path in self.layer_locations
+            },
+        }
+
+    def load_layer_tree(self, tree: dict):
+        """
+        使用缓存的图层树代替遍历文档, 图层在第一次使用时按位置定位
+        :param tree: dump_layer_tree 的结果
+        """
+        self.layer_tree = {prefix: tuple(names) for prefix, names in tree["names"].items()}
+        self.layer_nodes = dict(tree["layers"])
+        self.layer_dict = {}
+        self.layer_locations = {}
+        self.layer_indexed = True
+        logger.info(f"图层索引从缓存读取完成, 共 {len(self.layer_nodes)} 条路径")
+
+    def _locate_layers(self, nodes: list[dict]) -> list:
+        """按缓存中的位置取得图层对象, 只访问路径上的图层集"""
+        layers = []
+        for node in nodes:
+            layer = self.document
+            for kind, index in node["index"]:
+                layer = (layer.layerSets if kind == "set" else layer.artLayers)[index]
+            layers.append(layer)
+        return layers
+
+    def get_layer_by_layername(self, layername: str) -> list:
+        """根据层名获取图层"""
+        if not self.layer_indexed:
+            self.build_layer_index()
+
+        change_layer_list = self.layer_dict.get(layername)
+        if change_layer_list is None and layername in self.layer_nodes:
+            change_layer_list = self._locate_layers(self.layer_nodes.pop(layername))
+            self.layer_dict[layername] = change_layer_list
+        if change_layer_list is None:
+            logger.error(f"未找到图层 {layername}")
+            change_layer_list = self.layer_dict[layername] = []
+        return change_layer_list
+
+    def invalidate(self, layer_name: str | None = None):
+        """
+        丢弃缓存的图层属性, 在图层工厂以外修改了文档后调用
+        :param layer_name: 图层路径, 为空时丢弃所有图层
+        """
+
+    def change_layer_state(self, layer_name: str, change_state: LayerState | dict):
+        """
+        修改图层状态, 只修改与当前状态不同的属性
+        :param layer_name: 图层路径
+        :param change_state: 目标状态
+        """
+        change_state = LayerState.coerce(change_state)
+        with self.profiler.span("lookup"):
+            layer_list = self.get_layer_by_layername(layer_name)
+        if not layer_list:
+            return
+        current = self.current_state.get(layer_name, EMPTY_STATE)
+        initials = self.layer_initial_states.get(layer_name) or [
+            self.initial_state.get(layer_name, EMPTY_STATE)
+        ] * len(layer_list)
+        self.current_state[layer_name] = self._change_layers(
+            layer_name, list(zip(layer_list, initials)), current, change_state
+        )
+
+    def restore_layer_state(self, layer_name: str):
+        """
+        把图层恢复到初始状态, 同一路径下初始状态不同的图层(拷贝图层)各自恢复到自己的初始状态
+        :param layer_name: 图层路径
+        """
+        initial = self.initial_state.get(layer_name)
+        if not initial:
+            return
+        states = self.layer_initial_states.get(layer_name)
+        if states is None:
+            self.change_layer_state(layer_name, initial)
+            return
+        with self.profiler.span("lookup"):
+            layer_list = self.get_layer_by_layername(layer_name)
+        current = self.current_state.get(layer_name, EMPTY_STATE)
+        for layer, state in zip(layer_list, states):
+            self._change_layers(layer_name, [(layer, state)], current, state)
+        self.current_state[layer_name] = self.restored_state(layer_name)
+
+    def restored_state(self, layer_name: str) -> LayerState:
+        """恢复到初始状态后图层的当前状态, 同一路径下各图层取值不同的属性视为未知"""
+        states = self.layer_initial_states.get(layer_name)
+        if states is None:
+            return self.initial_state[layer_name]
+        return _common_state(states)
+
+    def _change_layers(
+        self,
+        layer_name: str,
+        layers: list[tuple],
+        current: LayerState,
+        change_state: LayerState,
+    ) -> LayerState:
+        """
+        把一个路径下的图层从当前状态修改到目标状态
+        :param layers: [(图层对象, 该图层的初始状态)]
+        :return: 修改后的当前状态
+        """
+        layer_list = [layer for layer, _ in layers]
+        delta = current.delta(change_state)
+        # rotate 是相对打开时方向的角度, 未指定时保持当前角度;
+        # 引擎的旋转操作是在当前方向上再旋转, 这里换算为增量
+        rotate = change_state.rotate if change_state.rotate is not None else current.rotate
+        if current.rotate and (delta.rotate is not None or delta.move is not None):
+            # 旋转以图层中心为轴、相对当前方向进行: 先转回原方向并回到旋转前的位置,
+            # 再移动和旋转到目标状态, 结果与从初始状态直接修改一致
+            self._apply_layer_state(layer_name, layer_list, LayerState(rotate=-current.rotate))
+            for layer, initial in layers:
+                move = change_state.move or current.move or initial.move
+                target = LayerState(delta.visible, move, rotate or None, delta.text)
+                self._apply_layer_state(layer_name, [layer], target)
+        elif delta:
+            self._apply_layer_state(layer_name, layer_list, delta)
+        if rotate != change_state.rotate:
+            change_state = LayerState(
+                change_state.visible, change_state.move, rotate, change_state.text
+            )
+        return change_state
+
+    def _apply_layer_state(self, layer_name: str, layer_list: list, delta: LayerState):
+        """把需要修改的属性写入图层, 按修改的属性组合统计每个图层的耗时"""
+        if not self.profiler.enabled:
+            for layer in layer_list:
+                self._change_layer_state(layer, delta)
+            return
+        properties = "+".join(name for name, _ in delta.items())
+        for layer in layer_list:
+            with self.profiler.span(properties, "layer", layer=layer_name):
+                self._change_layer_state(layer, delta)
+
+    def unrecorded_state(self, layername: str, layerinfo: LayerState | dict) -> LayerState:
+        """
+        layerinfo 中还没有记录初始值的属性
+        旋转后转回原方向时需要回到旋转前的位置, 记录旋转的初始值时同时记录位置
+        """
+        layerinfo = LayerState.coerce(layerinfo)
+        if layerinfo.rotate is not None and layerinfo.move is None:
+            layerinfo = LayerState(layerinfo.visible, (0, 0), layerinfo.rotate, layerinfo.text)
+        initial = self.initial_state.get(layername)
+        if initial is None:
+            return layerinfo
+        return LayerState(
+            *(
+                value if recorded is None else None
+                for value, recorded in zip(layerinfo.values(), initial.values())
+            )
+        )
+
+    def save_initial_layer_state(self, layername: str, layerinfo: LayerState | dict):
+        """保存图层状态, 已经保存过的图层只补充记录还没有记录的属性"""
+        layerinfo = self.unrecorded_state(layername, layerinfo)
+        if not layerinfo:
+            return
+        with self.profiler.span("lookup"):
+            target_layers = self.get_layer_by_layername(layername)
+        if not target_layers:
+            return
+        # 使用工厂创建初始状态, 同一路径下的每个图层(拷贝图层)分别记录
+        states = [self._create_layer_state(layer, layerinfo) for layer in target_layers]
+        previous = self.layer_initial_states.get(layername) or [
+            self.initial_state.get(layername)
+        ] * len(states)
+        merged = [_merge_states(old, new) for old, new in zip(previous, states)]
+        self.initial_state[layername] = merged[0]
+        if any(state != merged[0] for state in merged):
+            self.layer_initial_states[layername] = merged
+        # 同时保存当前状态, 新记录的属性还没有被修改过, 当前值就是初始值
+        self.current_state[layername] = _merge_states(
+            self.current_state.get(layername), _common_state(states)
+        )
+        logger.info(f"保存初始状态成功: {layername=}, {merged=}")
+
+    def restore_text_item_to_initial(self, layer_name: str):
+        """将指定图层的文本属性恢复到初始状态"""
+        initial_state = self.initial_state.get(layer_name, EMPTY_STATE)
+        if initial_state.text is not None:
+            self.restore_layer_state(layer_name)
+            logger.info(f"图层 {layer_name} 的文本属性已恢复到初始状态")
+
+    def restore_all_layers_to_initial(self):
+        """恢复所有图层的状态为初始状态, 逐个恢复的代价更高时直接恢复快照"""
+        if self.has_snapshot:
+            replay_cost = sum(
+                self.current_state.get(layer_name, EMPTY_STATE).delta(initial).change_count()
+                for layer_name, initial in self.initial_state.items()
+            )
+            if replay_cost > self.snapshot_revert_cost:
+                self.revert_to_snapshot()
+                return
+        for layer_name in list(self.initial_state):
+            self.restore_layer_state(layer_name)
+
+    def capture_snapshot(self):
+        """打开文档后记录一次快照, 之后可以一次操作把所有图层恢复到打开时的状态"""
+        self._capture_snapshot()
+        self.has_snapshot = True
+        logger.info("文档快照已记录")
+
+    def revert_to_snapshot(self):
+        """恢复到打开文档时的快照, 已记录初始状态的图层当前状态即为初始状态"""
+        self._restore_snapshot()
+        self.current_state = {
+            layer_name: self.restored_state(layer_name) for layer_name in self.initial_state
+        }
+        logger.info("已恢复到文档快照")
+
+    def restore_costs(self, change_states: dict[str, LayerState]) -> tuple[int, int]:
+        """
+        估算修改到目标状态需要的属性修改次数
+        :param change_states: 目标状态
+        :return: (从当前状态修改的次数, 先恢复快照再修改的次数)
+        """
+        current_cost = 0
+        base_cost = self.snapshot_revert_cost
+        for layer_name, change_state in change_states.items():
+            current = self.current_state.get(layer_name, EMPTY_STATE)
+            current_cost += current.delta(change_state).change_count()
+            base = self.initial_state.get(layer_name, EMPTY_STATE)
+            base_cost += base.delta(change_state).change_count()
+        # 不再需要的图层要逐个恢复到初始状态
+        for layer_name in self.current_state.keys() - change_states.keys():
+            initial = self.initial_state.get(layer_name)
+            if initial:
+                current_cost += self.current_state[layer_name].delta(initial).change_count()
+        return current_cost, base_cost
+
+    def _describe_layer(self, layer) -> dict:
+        """
+        读取图层打开时的状态, 写入图层树缓存
+        :param layer: 图层对象
+        :return: {"visible", "bounds", "text"}, text 为 {"contents", "size", "color"} 或 None
+        """
+        raise NotImplementedError
+
+    def _create_layer_state(self, layer, layer_info: LayerState) -> LayerState:
+        """
+        记录图层状态信息
+        :param layer: 图层对象
+        :param layer_info: 需要记录的属性
+        :return: 初始状态
+        """
+        raise NotImplementedError
+
+    def _change_layer_state(self, layer, change_state: LayerState):
+        """
+        修改图层状态
+        :param layer: 图层对象
+        :param change_state: 需要修改的属性, rotate 为在当前方向上再旋转的角度
+        """
+        raise NotImplementedError
+
+    def _capture_snapshot(self):
+        """记录整个文档的快照"""
+        raise NotImplementedError
+
+    def _restore_snapshot(self):
+        """把整个文档恢复到快照"""
+        raise NotImplementedError
+
+
+def _merge_states(state: LayerState | None, extra: LayerState) -> LayerState:
+    """state 中未指定的属性使用 extra 中的值"""
+    if state is None:
+        return extra
+    return LayerState(
+        *(
+            value if value is not None else other
+            for value, other in zip(state.values(), extra.values())
+        )
+    )
+
+
+def _common_state(states: list[LayerState]) -> LayerState:
+    """多个图层取值都相同的属性, 取值不同的属性为 None"""
+    return LayerState(
+        *(
+            values[0] if all(value == values[0] for value in values) else None
+            for values in zip(*(state.values() for state in states))
+        )
+    )
+
+
+def list_all_layers(layer_tree: dict) -> list:
+    """
+    顶层图层和每个顶层图层集的子图层名
+    :param layer_tree: 图层集路径 -> (图层名, 图层集名)
+    """
+    top_art_names, top_set_names = layer_tree[""]
+    layers = []
+    layers.append({"TOP": list(top_art_names)})
+
+    # 构建图层集及其子图层的详细信息
+    for set_name in top_set_names:
+        art_names, set_names = layer_tree.get(f"{set_name}/", ([], []))
+        layers.append(f"{set_name}: {list(art_names) + list(set_names)}")
+
+    return layers
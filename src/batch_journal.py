@@ -0,0 +1,172 @@
+"""批处理日志: 追加记录已完成的任务和图层初始状态, 中断后重新运行时跳过已完成的任务并恢复模板"""
+
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+from .layer_state import LayerState
+
+
+class BatchJournal:
+    """
+    只追加的 JSON Lines 日志, 每行一条记录:
+    {"type": "initial", "psd": 模板路径, "layers": {图层路径: 初始状态}} 修改图层之前记录
+    {"type": "done", "task": 导出文件名, "outputs": {导出路径: 内容键}} 任务导出成功后记录
+    {"type": "restored", "psd": 模板路径} 模板恢复到初始状态或不保存关闭后记录
+
+    完成记录先缓存在内存中, 每 fsync_interval 秒一次写入并 fsync; 初始状态必须在修改图层之前落盘,
+    立即写入。中断时最多丢失最近 fsync_interval 秒的完成记录, 这些任务重新运行
+
+    完成记录按导出文件的内容键(模板、图层数据、导出格式和引擎参数)匹配, 重复使用同一个日志时
+    修改过图层数据或模板的任务重新渲染, 不会因为导出文件仍然存在而跳过
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 1.0):
+        """
+        :param path: 日志文件路径, 已存在时读取其中的记录并继续追加
+        :param fsync_interval: 完成记录写入磁盘的间隔(秒), 为 0 时每条记录立即写入
+        """
+        self.path = os.path.abspath(path)
+        self.fsync_interval = fsync_interval
+        self._open()
+
+    def _open(self):
+        # {导出路径: 内容键}
+        self.done: dict[str, str] = {}
+        # 本次运行中按日志跳过的任务数
+        self.skipped = 0
+        # {模板路径: {图层路径: 初始状态}}, 只包含没有恢复的模板
+        self.initial: dict[str, dict[str, LayerState]] = {}
+        self._replay()
+        self._buffer: list[bytes] = []
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(self.path, flags)
+
+    def __getstate__(self) -> dict:
+        """多进程渲染时每个进程打开自己的文件描述符, 追加写入同一个日志"""
+        self.flush()
+        return {"path": self.path, "fsync_interval": self.fsync_interval}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _replay(self):
+        """读取已有的记录, 中断时写了一半的最后一行跳过"""
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, encoding="utf-8", errors="replace") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"批处理日志第 {line_number} 行不完整, 已跳过")
+                    continue
+                kind = record.get("type")
+                if kind == "done":
+                    outputs = record["outputs"]
+                    # 旧格式的完成记录没有内容键, 无法确认导出文件与任务一致, 重新渲染
+                    if isinstance(outputs, dict):
+                        self.done.update(outputs)
+                elif kind == "initial":
+                    layers = self.initial.setdefault(record["psd"], {})
+                    for layer_name, state in record["layers"].items():
+                        layers[layer_name] = LayerState.coerce(state)
+                elif kind == "restored":
+                    self.initial.pop(record["psd"], None)
+        logger.info(
+            f"读取批处理日志 {self.path}: 已完成 {len(self.done)} 个导出文件, "
+            f"{len(self.initial)} 个模板需要恢复"
+        )
+
+    def is_done(self, outputs: dict[str, str]) -> bool:
+        """
+        任务的所有导出文件都已按相同的内容键记录完成并且仍然存在
+        :param outputs: {导出路径: 内容键}
+        """
+        return all(
+            self.done.get(os.path.abspath(path)) == key and os.path.isfile(path)
+            for path, key in outputs.items()
+        )
+
+    def initial_states(self, psd_file_path: str) -> dict[str, LayerState]:
+        """上次运行中修改过、没有恢复的图层的初始状态"""
+        return dict(self.initial.get(os.path.abspath(psd_file_path), {}))
+
+    def record_initial(self, psd_file_path: str, states: dict[str, LayerState]):
+        """
+        记录图层初始状态, 只写入与已记录的状态不同的图层, 修改图层之前立即写入磁盘
+        :param states: {图层路径: 初始状态}
+        """
+        psd = os.path.abspath(psd_file_path)
+        recorded = self.initial.setdefault(psd, {})
+        changed = {
+            layer_name: state
+            for layer_name, state in states.items()
+            if recorded.get(layer_name) is not state
+        }
+        if not changed:
+            return
+        recorded.update(changed)
+        layers = {layer_name: state.to_dict() for layer_name, state in changed.items()}
+        self._append({"type": "initial", "psd": psd, "layers": layers}, sync=True)
+
+    def record_done(self, export_name: str, outputs: dict[str, str]):
+        """
+        记录任务导出成功, 按间隔批量写入
+        :param outputs: {导出路径: 内容键}
+        """
+        outputs = {os.path.abspath(path): key for path, key in outputs.items()}
+        with self._lock:
+            self.done.update(outputs)
+        self._append({"type": "done", "task": export_name, "outputs": outputs})
+
+    def record_restored(self, psd_file_path: str):
+        """记录模板已经恢复, 之后不再需要其中的初始状态"""
+        psd = os.path.abspath(psd_file_path)
+        if self.initial.pop(psd, None) is not None:
+            self._append({"type": "restored", "psd": psd}, sync=True)
+
+    def _append(self, record: dict, sync: bool = False):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._buffer.append(line.encode("utf-8"))
+            if sync or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._flush_locked()
+
+    def flush(self):
+        """把缓存的记录写入磁盘"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer:
+            # 一次写入完整的若干行, 多个进程追加同一个日志时行不会交错
+            data = b"".join(self._buffer)
+            while data:
+                data = data[os.write(self._fd, data) :]
+            os.fsync(self._fd)
+            self._buffer = []
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """写入缓存的记录并关闭文件"""
+        if self._fd is None:
+            return
+        if self.skipped:
+            logger.info(f"按批处理日志 {self.path} 跳过 {self.skipped} 个已完成的任务")
+        self.flush()
+        os.close(self._fd)
+        self._fd = None
@@ -0,0 +1,157 @@
+"""
+预乘 RGBA 的向量化混合内核, 所有运算在调用方提供的缓冲区中原地完成
+画布按通道平面存储为 (4, height, width) float32, 与 alpha 平面的运算沿整行连续进行
+"""
+
+import numpy as np
+
+# 正常模式以外支持的混合模式, 其他模式(包括图层组的穿透)按正常模式合成
+SPECIAL_MODES = ("multiply", "screen", "overlay")
+
+_255 = np.float32(255)
+
+
+class BlendBuffers:
+    """
+    合成时复用的缓冲区: 按名称保存一维数组, 只在需要更大的尺寸时重新分配
+    返回的数组是连续的, 同名缓冲区同一时间只能有一个使用者
+    """
+
+    def __init__(self):
+        self._arrays: dict[tuple, np.ndarray] = {}
+
+    def get(
+        self, name, height: int, width: int, channels: int = 4, dtype=np.float32
+    ) -> np.ndarray:
+        """
+        :param name: 缓冲区名称
+        :return: (channels, height, width) 数组, 内容未初始化
+        """
+        size = channels * height * width
+        key = (name, np.dtype(dtype))
+        array = self._arrays.get(key)
+        if array is None or array.size < size:
+            array = np.empty(size, dtype)
+            self._arrays[key] = array
+        return array[:size].reshape(channels, height, width)
+
+    def zeros(self, name, height: int, width: int, channels: int = 4) -> np.ndarray:
+        """清零后的 float32 缓冲区"""
+        array = self.get(name, height, width, channels)
+        array.fill(0)
+        return array
+
+
+def load_opaque(pixels: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    不透明像素的预乘值与非预乘值相同, 只需要转换为浮点数, 省去预乘和混合运算;
+    调用前用 is_opaque 判断, 有透明像素的图层仍然走 load_premultiplied + blend
+    :param pixels: 完全不透明的 (height, width, 4) uint8
+    :param out: (4, height, width) float32, 原地写入
+    """
+    np.divide(pixels.transpose(2, 0, 1), _255, out=out)
+    return out
+
+
+def load_premultiplied(pixels: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    把非预乘 uint8 RGBA 转换为预乘 float32 通道平面
+    :param pixels: (height, width, 4) uint8
+    :param out: (4, height, width) float32, 原地写入
+    """
+    load_opaque(pixels, out)
+    np.multiply(out[:3], out[3], out=out[:3])
+    return out
+
+
+def is_opaque(pixels: np.ndarray) -> bool:
+    """uint8 像素是否完全不透明, 在 uint8 alpha 通道上取最小值, 不分配与图层同样大小的数组"""
+    return bool(pixels[..., 3].min() == 255)
+
+
+def blend(
+    dst: np.ndarray,
+    src: np.ndarray,
+    mode: str,
+    opacity: float,
+    buffers: BlendBuffers,
+):
+    """
+    按混合模式把预乘源图像叠加到预乘画布上:
+    结果 = S * (1 - Da) + D * (1 - Sa) + B(S, D), alpha 平面使用同一公式即 Sa + Da - Sa * Da
+    :param dst: 画布区域 (4, height, width) float32 预乘, 原地修改
+    :param src: 与 dst 形状相同的源图像, float32 预乘, 会被修改
+    :param mode: normal / multiply / screen / overlay, 其他模式按 normal 处理
+    :param opacity: 图层不透明度与填充不透明度的乘积 0-1
+    :param buffers: 临时缓冲区
+    """
+    if opacity <= 0:
+        return
+    if opacity < 1:
+        src *= np.float32(opacity)
+    height, width = dst.shape[1:]
+    src_alpha, dst_alpha = src[3], dst[3]
+
+    if mode not in SPECIAL_MODES:
+        # S + D * (1 - Sa)
+        inverse = buffers.get("inverse_src_alpha", height, width, 1)[0]
+        np.subtract(1, src_alpha, out=inverse)
+        dst *= inverse
+        dst += src
+        return
+
+    if mode == "screen":
+        # S + D - S * D
+        product = buffers.get("product", height, width)
+        np.multiply(src, dst, out=product)
+        dst += src
+        dst -= product
+        return
+
+    # multiply: B = S * D
+    # overlay: 2D <= Da 时 B = 2 * S * D, 否则 B = Sa * Da - 2 * (Da - D) * (Sa - S)
+    term = buffers.get("product", height, width)
+    np.multiply(src, dst, out=term)
+    if mode == "overlay":
+        term *= 2
+        screen = buffers.get("overlay_screen", height, width)
+        other = buffers.get("overlay_other", height, width)
+        np.subtract(dst_alpha, dst, out=screen)
+        np.subtract(src_alpha, src, out=other)
+        screen *= other
+        screen *= -2
+        np.multiply(src_alpha, dst_alpha, out=other[0])
+        screen += other[0]
+        light = buffers.get("overlay_mask", height, width, 4, np.bool_)
+        np.multiply(dst, 2, out=other)
+        np.greater(other, dst_alpha, out=light)
+        np.copyto(term, screen, where=light)
+
+    inverse_dst = buffers.get("inverse_dst_alpha", height, width, 1)[0]
+    inverse_src = buffers.get("inverse_src_alpha", height, width, 1)[0]
+    np.subtract(1, dst_alpha, out=inverse_dst)
+    np.subtract(1, src_alpha, out=inverse_src)
+    src *= inverse_dst
+    dst *= inverse_src
+    dst += src
+    dst += term
+
+
+def store_unpremultiplied(canvas: np.ndarray, out: np.ndarray, buffers: BlendBuffers):
+    """
+    把预乘 float32 画布转换为非预乘 uint8 RGBA
+    :param canvas: (4, height, width) float32 预乘, 不会被修改
+    :param out: (height, width, 4) uint8, 原地写入
+    """
+    height, width = canvas.shape[1:]
+    straight = buffers.get("straight", height, width)
+    alpha = canvas[3]
+    visible = buffers.get("visible", height, width, 1, np.bool_)[0]
+    np.greater(alpha, 0, out=visible)
+    straight[:3] = 0
+    np.divide(canvas[:3], alpha, out=straight[:3], where=visible)
+    straight[3] = alpha
+    straight *= _255
+    np.rint(straight, out=straight)
+    np.clip(straight, 0, 255, out=straight)
+    np.copyto(out.transpose(2, 0, 1), straight, casting="unsafe")
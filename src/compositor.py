@@ -0,0 +1,378 @@
+"""基于 NumPy 的图层合成器"""
+
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .blend import (
+    SPECIAL_MODES,
+    BlendBuffers,
+    blend,
+    is_opaque,
+    load_opaque,
+    load_premultiplied,
+    store_unpremultiplied,
+)
+from .psd_reader import PsdDocument, PsdLayer
+
+
+class GroupRasterCache:
+    """
+    图层组合成结果的 LRU 缓存, 键为图层组和所有子孙图层的状态(可见性、不透明度、混合模式、位置、像素)
+    缓存的是预乘 float32 通道平面
+    子孙图层都没有变化的图层组直接使用缓存的合成结果, 总大小不超过 max_bytes
+    可以在多个线程中同时使用
+    """
+
+    def __init__(self, max_bytes: int = 256 << 20):
+        """
+        :param max_bytes: 缓存的合成结果总大小上限, 为 0 时不缓存
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # {(图层组 id, 状态): (合成结果, 左上角坐标, 引用的像素数组)}
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(group: PsdLayer) -> tuple:
+        """图层组的有效状态, 像素按数组对象区分, 图层修改像素时总是替换数组"""
+        return id(group), tuple(
+            (
+                layer.visible,
+                layer.opacity,
+                layer.fill_opacity,
+                layer.blend_mode,
+                layer.left,
+                layer.top,
+                id(layer.pixels),
+                id(layer.source),
+            )
+            for layer in group.descendants()
+        )
+
+    def get(self, key: tuple) -> tuple[np.ndarray, int, int] | None:
+        """
+        :return: (合成结果, left, top), 没有缓存时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[:3]
+
+    def put(self, key: tuple, group: PsdLayer, raster: np.ndarray, left: int, top: int):
+        """缓存图层组的合成结果, 超过上限时淘汰最久未使用的结果"""
+        if raster.nbytes > self.max_bytes:
+            return
+        # 保留像素数组的引用, 缓存存在期间数组 id 不会被复用
+        pixels = [(layer.pixels, layer.source) for layer in group.descendants()]
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (raster, left, top, pixels)
+            self.total_bytes += raster.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (evicted, *_) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class Compositor:
+    """
+    将 PSD 图层树合成为整张 RGBA 图像, 在预乘 float32 通道平面上按图层的混合模式和不透明度合成,
+    画布和临时数组都复用缓冲区(每个线程各自一组), 合成每个图层时不分配内存
+    保留上一次的合成结果, 图层修改时用 mark_dirty 标记变化的区域, 下次只重新合成这些区域
+    每个像素的合成只依赖该位置的图层像素, 局部合成的结果与整张重新合成逐字节一致
+    """
+
+    def __init__(self, document: PsdDocument, group_cache_bytes: int = 256 << 20):
+        """
+        :param document: 解析后的 PSD 文档
+        :param group_cache_bytes: 图层组合成结果缓存的大小上限, 为 0 时不缓存
+        """
+        self.document = document
+        self.group_cache = GroupRasterCache(group_cache_bytes)
+        self._local = threading.local()
+        # 上一次的合成结果, 以及之后需要重新合成的区域 (left, top, right, bottom)
+        self._result: np.ndarray | None = None
+        self._dirty: tuple[int, int, int, int] | None = None
+        # 合成结果已经交给调用方(可能在后台线程中写出), 修改前先复制
+        self._shared = False
+
+    @property
+    def _buffers(self) -> BlendBuffers:
+        """当前线程的缓冲区"""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = BlendBuffers()
+        return buffers
+
+    def mark_dirty(self, bounds: tuple[int, int, int, int]):
+        """
+        标记需要重新合成的区域, 与已标记的区域取并集
+        :param bounds: 画布坐标 (left, top, right, bottom), 超出画布的部分忽略
+        """
+        left, top = max(bounds[0], 0), max(bounds[1], 0)
+        right = min(bounds[2], self.document.width)
+        bottom = min(bounds[3], self.document.height)
+        if left >= right or top >= bottom:
+            return
+        if self._dirty is not None:
+            left, top = min(left, self._dirty[0]), min(top, self._dirty[1])
+            right, bottom = max(right, self._dirty[2]), max(bottom, self._dirty[3])
+        self._dirty = (left, top, right, bottom)
+
+    def invalidate(self):
+        """丢弃合成结果, 下次整张重新合成"""
+        self._result = None
+        self._dirty = None
+
+    def composite(self) -> np.ndarray:
+        """
+        合成整个文档, 只重新合成上次之后标记的区域
+        :return: (height, width, 4) uint8 RGBA 图像, 只读
+        """
+        if self._result is None:
+            width, height = self.document.width, self.document.height
+            self._result = np.empty((height, width, 4), np.uint8)
+            self._composite_region(0, 0, width, height)
+            self._dirty = None
+            self._shared = False
+        elif self._dirty is not None:
+            if self._shared:
+                self._result = self._result.copy()
+                self._shared = False
+            self._composite_region(*self._dirty)
+            self._dirty = None
+        self._shared = True
+        result = self._result.view()
+        result.flags.writeable = False
+        return result
+
+    def _composite_region(self, left: int, top: int, right: int, bottom: int):
+        """合成画布上的一个矩形区域, 写入合成结果"""
+        self._render(left, top, right, bottom, self._result[top:bottom, left:right])
+
+    def _render(self, left: int, top: int, right: int, bottom: int, out: np.ndarray):
+        """
+        合成画布上的一个矩形区域
+        :param out: (bottom - top, right - left, 4) uint8, 原地写入
+        """
+        buffers = self._buffers
+        canvas = buffers.zeros(("canvas", 0), bottom - top, right - left)
+        self._composite_children(self.document, canvas, left, top, 0)
+        store_unpremultiplied(canvas, out, buffers)
+
+    def _layer_rows(self, layer: PsdLayer, top: int, bottom: int) -> np.ndarray:
+        """图层像素在图层坐标中的 [top, bottom) 行"""
+        return layer.read_rows(top, bottom)
+
+    def _composite_children(
+        self, parent: PsdLayer, canvas: np.ndarray, origin_x: int, origin_y: int, depth: int
+    ):
+        """
+        按由下到上的顺序把子图层合成到预乘画布上
+        :param origin_x: 画布左上角在文档中的横坐标
+        :param origin_y: 画布左上角在文档中的纵坐标
+        :param depth: 图层组嵌套深度, 每一层使用自己的画布缓冲区
+        """
+        for layer in parent.children:
+            opacity = layer.opacity * layer.fill_opacity / (255 * 255)
+            if not layer.visible or opacity == 0:
+                continue
+            if layer.is_group:
+                self._blend_group(layer, canvas, origin_x, origin_y, depth, opacity)
+                continue
+            # 只转换与画布相交的像素
+            left, top = layer.left - origin_x, layer.top - origin_y
+            height, width = layer.shape
+            x0, y0 = max(left, 0), max(top, 0)
+            x1 = min(left + width, canvas.shape[2])
+            y1 = min(top + height, canvas.shape[1])
+            if x0 >= x1 or y0 >= y1:
+                continue
+            pixels = self._layer_rows(layer, y0 - top, y1 - top)[:, x0 - left : x1 - left]
+            target = canvas[:, y0:y1, x0:x1]
+            if layer.blend_mode not in SPECIAL_MODES and opacity == 1 and is_opaque(pixels):
+                # 完全不透明的正常图层直接覆盖, 只省去预乘和混合, 画布仍然是 float32
+                load_opaque(pixels, target)
+                continue
+            source = load_premultiplied(
+                pixels, self._buffers.get("source", y1 - y0, x1 - x0)
+            )
+            blend(target, source, layer.blend_mode, opacity, self._buffers)
+
+    def _blend_group(
+        self,
+        group: PsdLayer,
+        canvas: np.ndarray,
+        origin_x: int,
+        origin_y: int,
+        depth: int,
+        opacity: float,
+    ):
+        """把图层组的合成结果叠加到画布上, 只处理图层组边界内的部分"""
+        left, top, right, bottom = group.bounds
+        left, top = max(left, 0), max(top, 0)
+        right = min(right, self.document.width)
+        bottom = min(bottom, self.document.height)
+        # 需要的部分: 图层组边界与画布的交集
+        x0, y0 = max(left, origin_x), max(top, origin_y)
+        x1 = min(right, origin_x + canvas.shape[2])
+        y1 = min(bottom, origin_y + canvas.shape[1])
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        key = self.group_cache.make_key(group) if self.group_cache.max_bytes > 0 else None
+        cached = self.group_cache.get(key) if key is not None else None
+        if cached is not None:
+            # 缓存的结果不能被混合修改, 复制需要的部分
+            raster, raster_x, raster_y = cached
+            source = self._buffers.get("source", y1 - y0, x1 - x0)
+            np.copyto(
+                source, raster[:, y0 - raster_y : y1 - raster_y, x0 - raster_x : x1 - raster_x]
+            )
+        else:
+            source = self._composite_group(group, x0, y0, x1, y1, depth + 1)
+            if key is not None and (x0, y0, x1, y1) == (left, top, right, bottom):
+                # 合成了整个图层组时缓存, 只合成了一部分时不缓存
+                self.group_cache.put(key, group, source.copy(), x0, y0)
+        target = canvas[:, y0 - origin_y : y1 - origin_y, x0 - origin_x : x1 - origin_x]
+        blend(target, source, group.blend_mode, opacity, self._buffers)
+
+    def _composite_group(
+        self, group: PsdLayer, left: int, top: int, right: int, bottom: int, depth: int
+    ) -> np.ndarray:
+        """合成图层组在文档中一个矩形区域内的子图层"""
+        raster = self._buffers.zeros(("canvas", depth), bottom - top, right - left)
+        self._composite_children(group, raster, left, top, depth)
+        return raster
+
+
+class TiledCompositor(Compositor):
+    """
+    分块合成, 用于画布很大的 PSB 文档: 把画布切成 tile_size 大小的块, 由上到下逐行处理
+    每行块先解码与这几行相交的可见图层在这几行上的像素, 再在线程池中并行合成这一行的各个块,
+    合成完一行就交给调用方编码写出
+    浮点缓冲区只有块大小, 输出和超过解码缓存上限的图层只保留当前一行块, 内存占用与画布高度无关
+    不保留整张合成结果, 每次调用都重新合成
+    """
+
+    def __init__(
+        self,
+        document: PsdDocument,
+        tile_size: int = 1024,
+        workers: int | None = None,
+        group_cache_bytes: int = 256 << 20,
+    ):
+        """
+        :param document: 解析后的 PSD 文档, 可以是延迟解码像素的文档
+        :param tile_size: 块的边长(像素)
+        :param workers: 并行合成的线程数量
+        :param group_cache_bytes: 图层组合成结果缓存的大小上限, 为 0 时不缓存
+        """
+        super().__init__(document, group_cache_bytes)
+        self.tile_size = tile_size
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._executor: ThreadPoolExecutor | None = None
+        # 当前一行块解码的像素 {图层 id: (起始行, 像素)}, 合成期间只读
+        self._band_rows: dict[int, tuple[int, np.ndarray]] = {}
+
+    def close(self):
+        """结束合成线程"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def composite(self) -> np.ndarray:
+        """
+        分块合成整个文档并拼接为整张图像, 用于需要整张图像的格式和导出配置
+        :return: (height, width, 4) uint8 RGBA 图像
+        """
+        result = np.empty((self.document.height, self.document.width, 4), np.uint8)
+        top = 0
+        for rows in self.composite_rows():
+            result[top : top + len(rows)] = rows
+            top += len(rows)
+        return result
+
+    def composite_rows(self) -> Iterator[np.ndarray]:
+        """
+        由上到下逐行块合成
+        :return: 每行块的 (rows, width, 4) uint8 图像, 只在取下一行块之前有效
+        """
+        width, height = self.document.width, self.document.height
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="tile")
+        layers = self._visible_layers()
+        band = np.empty((min(self.tile_size, height), width, 4), np.uint8)
+        try:
+            for top in range(0, height, self.tile_size):
+                bottom = min(top + self.tile_size, height)
+                self._decode_band(layers, top, bottom)
+                out = band[: bottom - top]
+                futures = []
+                for left in range(0, width, self.tile_size):
+                    right = min(left + self.tile_size, width)
+                    futures.append(
+                        self._executor.submit(
+                            self._render, left, top, right, bottom, out[:, left:right]
+                        )
+                    )
+                for future in futures:
+                    future.result()
+                self._band_rows = {}
+                yield out
+        finally:
+            self._band_rows = {}
+
+    def _visible_layers(self) -> list[PsdLayer]:
+        """实际可见(自身和所有上级图层组都可见)且有像素的图层"""
+        layers = []
+        stack = [self.document]
+        while stack:
+            for layer in stack.pop().children:
+                if not layer.visible or layer.opacity * layer.fill_opacity == 0:
+                    continue
+                if layer.is_group:
+                    stack.append(layer)
+                elif layer.pixels is not None or layer.source is not None:
+                    layers.append(layer)
+        return layers
+
+    def _decode_band(self, layers: list[PsdLayer], top: int, bottom: int):
+        """在线程池中解码没有解码的图层与 [top, bottom) 行相交的部分"""
+        pending = []
+        for layer in layers:
+            if layer.pixels is not None:
+                continue
+            row0 = max(top - layer.top, 0)
+            row1 = min(bottom - layer.top, layer.shape[0])
+            if row0 < row1:
+                pending.append((layer, row0, row1))
+        decoded = self._executor.map(lambda job: job[0].source.read_rows(*job[1:]), pending)
+        self._band_rows = {
+            id(layer): (row0, rows) for (layer, row0, _), rows in zip(pending, decoded)
+        }
+
+    def _layer_rows(self, layer: PsdLayer, top: int, bottom: int) -> np.ndarray:
+        """优先使用当前一行块已经解码的像素"""
+        entry = self._band_rows.get(id(layer))
+        if entry is not None:
+            start, rows = entry
+            return rows[top - start : bottom - start]
+        return super()._layer_rows(layer, top, bottom)
@@ -0,0 +1,167 @@
+"""多模板文档池: 同时保持多个模板打开, 按最近使用淘汰"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from .export_queue import ExportError
+from .ps_factory import PSFactory
+from .task_dedup import duplicate_names
+from .task_planner import plan_task_order
+
+# 任务中模板名称所在的键
+TEMPLATE_KEY = "模板"
+
+
+class DocumentPool:
+    """
+    文档池: 每个模板对应一个已打开的引擎实例, 各自维护图层索引和图层状态
+    打开的模板超过 max_open 个时淘汰最久未使用的模板
+    """
+
+    def __init__(
+        self,
+        engine_type: str = "native",
+        engine_args: tuple = (),
+        engine_kwargs: dict | None = None,
+        max_open: int = 4,
+        close_evicted: bool = True,
+    ):
+        """
+        :param engine_type: 图像处理引擎, photoshop 或 native
+        :param engine_args: 创建引擎的位置参数, 第一个参数 psd_name 为默认模板
+        :param engine_kwargs: 创建引擎的关键字参数
+        :param max_open: 最多同时打开的模板数量
+        :param close_evicted: 淘汰时直接关闭文档(不保存), 否则先恢复图层到初始状态
+        """
+        if max_open < 1:
+            raise ValueError("max_open 至少为 1")
+        self.engine_type = engine_type
+        self.engine_args = tuple(engine_args)
+        self.engine_kwargs = engine_kwargs or {}
+        self.max_open = max_open
+        self.close_evicted = close_evicted
+        self.default_template = self.engine_args[0] if self.engine_args else None
+        self.engines: OrderedDict[str, Any] = OrderedDict()
+        self.active_template: str | None = None
+        self.stats = {"opened": 0, "evicted": 0, "switches": 0}
+        # 关闭模板时等待写出的导出中失败的文件, 由 run 一起返回
+        self.export_errors: Dict[str, Dict[str, str]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, template: str | None = None):
+        """
+        取出模板对应的已打开引擎, 未打开时打开, 并设为当前文档
+        :param template: 模板名称(psd_name), 为空时使用默认模板
+        """
+        template = template or self.default_template
+        if template is None:
+            raise ValueError("任务没有指定模板, 且没有默认模板")
+        engine = self.engines.get(template)
+        if engine is None:
+            while len(self.engines) >= self.max_open:
+                self._evict()
+            engine = self._open(template)
+        else:
+            self.engines.move_to_end(template)
+        if template != self.active_template:
+            if self.active_template is not None:
+                self.stats["switches"] += 1
+            engine.activate()
+            self.active_template = template
+        return engine
+
+    def core(self, template: str | None, export_name: str, input_data: dict):
+        """把任务交给模板对应的引擎执行"""
+        self.get(template).core(export_name, input_data)
+
+    def run(
+        self, tasks: List[Dict[str, Any]], suffix: str = "", plan_order: bool = True
+    ) -> Dict[str, Any]:
+        """
+        依次执行任务, 任务的 "模板" 键指定模板
+        :param tasks: 任务列表, "副本" 键中的任务与该任务内容相同, 只渲染一次
+        :param suffix: 导出文件名后缀
+        :param plan_order: 按模板分组(保持模板首次出现的顺序)并在组内排序, 减少文档切换和图层修改
+        :return: {"outputs", "errors", "run_time_record"}
+        """
+        if plan_order:
+            groups: Dict[str, List[Dict[str, Any]]] = {}
+            for task in tasks:
+                groups.setdefault(task.get(TEMPLATE_KEY) or self.default_template, []).append(task)
+            tasks = [task for group in groups.values() for task in plan_task_order(group)[0]]
+
+        result = {"outputs": [], "errors": {}, "run_time_record": {}}
+        # {相同内容的任务的导出文件名: 渲染任务的导出文件名}
+        leaders = {}
+        for task in tasks:
+            export_name = task["任务名"] + suffix
+            duplicates = duplicate_names(task, suffix)
+            try:
+                engine = self.get(task.get(TEMPLATE_KEY))
+                engine.core(export_name, task["内容"], duplicates=duplicates)
+                result["outputs"].append(export_name)
+                result["outputs"].extend(duplicates)
+                leaders.update(dict.fromkeys(duplicates, export_name))
+                result["run_time_record"][export_name] = engine.run_time_record.get(export_name)
+            except Exception as e:
+                logger.error(f"任务 {export_name} 渲染失败: {e}")
+                result["errors"][export_name] = str(e)
+        # 异步导出时等待写出, 所有模板共用一个导出队列
+        export_queue = self.engine_kwargs.get("export_queue")
+        if export_queue is not None:
+            failed = {**self.export_errors, **export_queue.flush()}
+            self.export_errors = {}
+            for export_name, errors in failed.items():
+                result["errors"][export_name] = "; ".join(errors.values())
+            result["outputs"] = [
+                name for name in result["outputs"] if leaders.get(name, name) not in failed
+            ]
+        return result
+
+    def close(self):
+        """关闭池中所有模板"""
+        while self.engines:
+            self._release(*self.engines.popitem(last=False))
+        self.active_template = None
+
+    def _open(self, template: str):
+        start_time = time.time()
+        engine = PSFactory.create_engine(
+            self.engine_type, template, *self.engine_args[1:], **self.engine_kwargs
+        )
+        engine.__enter__()
+        self.engines[template] = engine
+        self.stats["opened"] += 1
+        logger.info(f"文档池打开模板 {template}, 用时 {time.time() - start_time:.2f}s")
+        return engine
+
+    def _evict(self):
+        """淘汰最久未使用的模板"""
+        template, engine = self.engines.popitem(last=False)
+        if template == self.active_template:
+            self.active_template = None
+        self._release(template, engine)
+        self.stats["evicted"] += 1
+        logger.info(f"文档池淘汰模板 {template}")
+
+    def _release(self, template: str, engine):
+        """关闭模板, 两种方式都先等待导出写完, 再结束引擎的线程"""
+        try:
+            if self.close_evicted:
+                engine.close_document()
+            else:
+                engine.__exit__(None, None, None)
+        except ExportError:
+            # 失败的文件已经记录在引擎的 export_errors 中
+            pass
+        except Exception as e:
+            logger.error(f"关闭模板 {template} 失败: {e}")
+        self.export_errors.update(engine.export_errors)
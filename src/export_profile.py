@@ -0,0 +1,152 @@
+"""导出配置: 一次合成后按多个格式、尺寸和质量导出"""
+
+from typing import Any, Dict, List
+
+
+class ExportProfile:
+    """
+    一种导出文件的描述, 不可变、可哈希
+    width 和 height 只指定一个时按比例缩放, 都不指定时保持原尺寸
+    """
+
+    __slots__ = ("file_format", "width", "height", "quality", "suffix")
+
+    def __init__(
+        self,
+        file_format: str = "png",
+        width: int | None = None,
+        height: int | None = None,
+        quality: int | None = None,
+        suffix: str = "",
+    ):
+        """
+        :param file_format: 导出文件格式
+        :param width: 输出宽度(像素)
+        :param height: 输出高度(像素)
+        :param quality: 有损格式的质量, 1-100
+        :param suffix: 加在导出文件名后的后缀, 如 "_thumb"
+        """
+        for name, value in (("width", width), ("height", height)):
+            if value is not None and int(value) <= 0:
+                raise ValueError(f"导出配置的 {name} 必须大于 0: {value}")
+        if quality is not None and not 1 <= int(quality) <= 100:
+            raise ValueError(f"导出配置的 quality 必须在 1-100 之间: {quality}")
+        object.__setattr__(self, "file_format", file_format.lower())
+        object.__setattr__(self, "width", None if width is None else int(width))
+        object.__setattr__(self, "height", None if height is None else int(height))
+        object.__setattr__(self, "quality", None if quality is None else int(quality))
+        object.__setattr__(self, "suffix", suffix or "")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} 是不可变对象")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} 是不可变对象")
+
+    def __repr__(self) -> str:
+        return f"ExportProfile({self.to_dict()!r})"
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.to_dict().values()))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ExportProfile) and self.to_dict() == other.to_dict()
+
+    def __reduce__(self):
+        return (type(self), tuple(self.to_dict().values()))
+
+    @classmethod
+    def from_dict(cls, profile: Dict[str, Any]) -> "ExportProfile":
+        """
+        从字典创建
+        :param profile: {"format", "width", "height", "quality", "suffix"}
+        """
+        return cls(
+            profile.get("format", profile.get("file_format", "png")),
+            profile.get("width"),
+            profile.get("height"),
+            profile.get("quality"),
+            profile.get("suffix", ""),
+        )
+
+    @classmethod
+    def coerce(cls, profile: "ExportProfile | Dict[str, Any] | str") -> "ExportProfile":
+        """字典、格式名或 ExportProfile 统一转换为 ExportProfile"""
+        if isinstance(profile, ExportProfile):
+            return profile
+        if isinstance(profile, str):
+            return cls(profile)
+        return cls.from_dict(profile)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典, 也用作渲染缓存键的一部分"""
+        return {
+            "format": self.file_format,
+            "width": self.width,
+            "height": self.height,
+            "quality": self.quality,
+            "suffix": self.suffix,
+        }
+
+    @property
+    def resizes(self) -> bool:
+        """是否需要缩放"""
+        return self.width is not None or self.height is not None
+
+    def target_size(self, width: int, height: int) -> tuple[int, int]:
+        """
+        计算输出尺寸
+        :param width: 原图宽度
+        :param height: 原图高度
+        :return: (宽, 高)
+        """
+        if self.width is not None and self.height is not None:
+            return self.width, self.height
+        if self.width is not None:
+            return self.width, max(1, round(height * self.width / width))
+        if self.height is not None:
+            return max(1, round(width * self.height / height)), self.height
+        return width, height
+
+    def file_name(self, export_name: str) -> str:
+        """导出文件名(含扩展名)"""
+        return f"{export_name}{self.suffix}.{self.file_format}"
+
+    @property
+    def photoshop_quality(self) -> int | None:
+        """Photoshop JPEG 导出的质量, 0-12"""
+        return None if self.quality is None else round(self.quality * 12 / 100)
+
+    def encode_options(self) -> Dict[str, Any]:
+        """离线引擎写出文件时的编码参数"""
+        if self.quality is not None and self.file_format in ("jpg", "jpeg"):
+            return {"quality": self.quality}
+        return {}
+
+
+def parse_profile_spec(spec: str) -> ExportProfile:
+    """
+    解析命令行中的导出配置
+    :param spec: 如 "jpg,quality=85,suffix=_web" 或 "png,width=400,suffix=_thumb"
+    """
+    file_format, *options = [part.strip() for part in spec.split(",")]
+    profile: Dict[str, Any] = {"format": file_format}
+    for option in options:
+        key, sep, value = option.partition("=")
+        if not sep or key not in ("width", "height", "quality", "suffix"):
+            raise ValueError(f"无法解析导出配置: {spec}")
+        profile[key] = value if key == "suffix" else int(value)
+    return ExportProfile.from_dict(profile)
+
+
+def parse_profiles(profiles: List[Any] | None) -> List[ExportProfile]:
+    """
+    解析导出配置列表, 检查导出文件名不重复
+    :param profiles: ExportProfile、字典或格式名的列表
+    :return: ExportProfile 列表
+    """
+    result = [ExportProfile.coerce(profile) for profile in profiles or []]
+    names = [profile.file_name("") for profile in result]
+    if len(set(names)) != len(names):
+        raise ValueError(f"导出配置的文件名重复, 请为相同格式指定不同的 suffix: {names}")
+    return result
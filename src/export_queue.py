@@ -0,0 +1,165 @@
+"""异步导出队列: 合成结果交给后台线程编码写出, 同时开始下一个任务的图层修改"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from loguru import logger
+
+# 一个导出文件: (完整路径, 写出函数)
+ExportWrite = Tuple[str, Callable[[], Any]]
+
+# 通知工作线程退出
+_STOP = object()
+
+
+class ExportError(Exception):
+    """导出文件失败, errors 为 {导出文件名: {路径: 错误信息}}"""
+
+    def __init__(self, errors: Dict[str, Dict[str, str]]):
+        self.errors = errors
+        files = [path for paths in errors.values() for path in paths]
+        super().__init__(f"{len(files)} 个文件导出失败: {', '.join(files)}")
+
+
+class ExportTicket:
+    """一个任务的导出, 提交后由工作线程写出所有文件"""
+
+    __slots__ = ("export_name", "writes", "on_success", "done", "errors")
+
+    def __init__(
+        self,
+        export_name: str,
+        writes: List[ExportWrite],
+        on_success: Callable[[], Any] | None = None,
+    ):
+        self.export_name = export_name
+        self.writes = writes
+        self.on_success = on_success
+        self.done = threading.Event()
+        # {路径: 错误信息}
+        self.errors: Dict[str, str] = {}
+
+    def wait(self, timeout: float | None = None):
+        """等待写出完成, 有文件失败时抛出 ExportError"""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"任务 {self.export_name} 导出等待超时")
+        if self.errors:
+            raise ExportError({self.export_name: dict(self.errors)})
+
+
+class ExportQueue:
+    """
+    有界导出队列: 等待写出的任务超过 max_pending 个时 submit 阻塞, 限制内存中的合成结果数量
+    失败的文件按任务记录, flush 时统一抛出
+    """
+
+    def __init__(self, max_pending: int = 4, workers: int = 1):
+        """
+        :param max_pending: 最多等待写出的任务数量
+        :param workers: 写出文件的线程数量
+        """
+        if max_pending < 1 or workers < 1:
+            raise ValueError("max_pending 和 workers 至少为 1")
+        self.max_pending = max_pending
+        self.workers = workers
+        self._reset()
+
+    def _reset(self):
+        self.jobs: queue.Queue = queue.Queue(self.max_pending)
+        self.failed: Dict[str, Dict[str, str]] = {}
+        self.stats = {"submitted": 0, "written": 0, "failed": 0, "blocked_ms": 0.0}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def __getstate__(self) -> dict:
+        """多进程渲染时每个进程创建自己的队列和线程"""
+        return {"max_pending": self.max_pending, "workers": self.workers}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(
+        self,
+        export_name: str,
+        writes: List[ExportWrite],
+        on_success: Callable[[], Any] | None = None,
+    ) -> ExportTicket:
+        """
+        提交一个任务的导出, 队列已满时等待
+        :param export_name: 导出文件名
+        :param writes: [(路径, 写出函数)], 写出函数不能引用之后会被修改的图层数据
+        :param on_success: 所有文件写出成功后在工作线程中调用, 如写入渲染缓存
+        """
+        if not self._threads:
+            self._start()
+        ticket = ExportTicket(export_name, writes, on_success)
+        start = time.perf_counter()
+        self.jobs.put(ticket)
+        with self._lock:
+            self.stats["submitted"] += 1
+            self.stats["blocked_ms"] += (time.perf_counter() - start) * 1000
+        return ticket
+
+    def flush(self) -> Dict[str, Dict[str, str]]:
+        """
+        等待已提交的导出全部写出
+        :return: 自上次 flush 以来失败的文件 {导出文件名: {路径: 错误信息}}
+        """
+        if self._threads:
+            self.jobs.join()
+        with self._lock:
+            failed, self.failed = self.failed, {}
+        return failed
+
+    def close(self):
+        """写出已提交的导出后结束工作线程"""
+        self.flush()
+        for _ in self._threads:
+            self.jobs.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"export-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while (ticket := self.jobs.get()) is not _STOP:
+            try:
+                self._write(ticket)
+            finally:
+                ticket.done.set()
+                self.jobs.task_done()
+        self.jobs.task_done()
+
+    def _write(self, ticket: ExportTicket):
+        """写出一个任务的所有文件, 单个文件失败不影响其他文件"""
+        for path, write in ticket.writes:
+            try:
+                write()
+                logger.info(f"导出{path}成功")
+            except Exception as e:
+                logger.error(f"导出{path}失败: {e}")
+                ticket.errors[path] = str(e)
+        if not ticket.errors and ticket.on_success is not None:
+            try:
+                ticket.on_success()
+            except Exception as e:
+                logger.warning(f"任务 {ticket.export_name} 导出后处理失败: {e}")
+        with self._lock:
+            self.stats["written"] += len(ticket.writes) - len(ticket.errors)
+            self.stats["failed"] += len(ticket.errors)
+            if ticket.errors:
+                self.failed[ticket.export_name] = dict(ticket.errors)
@@ -0,0 +1,170 @@
+"""离线渲染引擎的图像编码与写出"""
+
+import struct
+import zlib
+from collections.abc import Iterable
+
+import numpy as np
+
+from .export_profile import ExportProfile
+
+# 交给 Pillow 编码的格式, 以及对应的 Pillow 格式名
+PILLOW_FORMATS = {
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "bmp": "BMP",
+    "gif": "GIF",
+    "tga": "TGA",
+    "tiff": "TIFF",
+}
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def _png_header(width: int, height: int) -> bytes:
+    """PNG 文件头和 IHDR, 8 位 RGBA"""
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+
+
+def _png_rows(pixels: np.ndarray) -> np.ndarray:
+    """每行前加一个过滤类型字节(0, 不过滤)"""
+    height, width = pixels.shape[:2]
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = pixels.reshape(height, width * 4)
+    return raw
+
+
+def encode_png(pixels: np.ndarray, compress_level: int = 6) -> bytes:
+    """
+    将 RGBA 像素编码为 PNG 字节
+    :param pixels: (height, width, 4) uint8
+    :param compress_level: zlib 压缩级别
+    :return: PNG 文件内容
+    """
+    height, width = pixels.shape[:2]
+    return (
+        _png_header(width, height)
+        + _png_chunk(b"IDAT", zlib.compress(_png_rows(pixels).tobytes(), compress_level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def write_png_rows(
+    path: str, width: int, height: int, bands: Iterable[np.ndarray], compress_level: int = 6
+):
+    """
+    逐段编码写出 PNG, 每段压缩后立即写入文件, 不需要整张图像
+    :param path: 输出路径
+    :param width: 图像宽度
+    :param height: 图像高度
+    :param bands: 由上到下的 (rows, width, 4) uint8 图像, 行数之和等于 height
+    :param compress_level: zlib 压缩级别
+    """
+    compressor = zlib.compressobj(compress_level)
+    written = 0
+    with open(path, "wb") as f:
+        f.write(_png_header(width, height))
+        for band in bands:
+            written += len(band)
+            data = compressor.compress(_png_rows(band))
+            if data:
+                f.write(_png_chunk(b"IDAT", data))
+        if written != height:
+            raise ValueError(f"PNG 行数不一致: {written} != {height}")
+        f.write(_png_chunk(b"IDAT", compressor.flush()))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def flatten(pixels: np.ndarray, background: tuple = (255, 255, 255)) -> np.ndarray:
+    """
+    把 RGBA 图像合并到纯色背景上, 返回 RGB 图像
+    :param pixels: (height, width, 4) uint8
+    :param background: 背景颜色
+    :return: (height, width, 3) uint8
+    """
+    alpha = pixels[..., 3:4].astype(np.float32) / 255
+    rgb = pixels[..., :3].astype(np.float32) * alpha + np.array(
+        background, np.float32
+    ) * (1 - alpha)
+    return np.clip(np.rint(rgb), 0, 255).astype(np.uint8)
+
+
+def _area_weights(source: int, target: int) -> np.ndarray:
+    """
+    面积重采样的权重矩阵, 每个输出像素取其覆盖的输入像素按覆盖面积加权平均
+    :return: (target, source) float32, 每行之和为 1
+    """
+    edges = np.arange(target + 1, dtype=np.float64) * (source / target)
+    index = np.arange(source, dtype=np.float64)
+    overlap = np.minimum(edges[1:, None], index[None, :] + 1) - np.maximum(
+        edges[:-1, None], index[None, :]
+    )
+    overlap = np.clip(overlap, 0, None)
+    return (overlap / overlap.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def resize_pixels(pixels: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    缩放 RGBA 图像, 在预乘透明度后做面积重采样, 透明边缘不会出现黑边
+    :param pixels: (height, width, 4) uint8
+    :param width: 输出宽度
+    :param height: 输出高度
+    :return: (height, width, 4) uint8
+    """
+    source_height, source_width = pixels.shape[:2]
+    if (source_width, source_height) == (width, height):
+        return pixels
+    image = pixels.astype(np.float32)
+    image[..., :3] *= image[..., 3:4] / 255
+    # 先缩放高度再缩放宽度, 两次矩阵乘法
+    image = np.tensordot(_area_weights(source_height, height), image, axes=(1, 0))
+    image = np.tensordot(image, _area_weights(source_width, width), axes=(1, 1))
+    image = image.transpose(0, 2, 1)
+    alpha = image[..., 3:4]
+    np.divide(image[..., :3] * 255, alpha, out=image[..., :3], where=alpha > 0)
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+def write_profile(path: str, pixels: np.ndarray, profile: ExportProfile):
+    """
+    按导出配置缩放并写出图像文件
+    :param path: 输出路径
+    :param pixels: (height, width, 4) uint8 RGBA 图像, 不会被修改
+    :param profile: 导出配置
+    """
+    if profile.resizes:
+        height, width = pixels.shape[:2]
+        pixels = resize_pixels(pixels, *profile.target_size(width, height))
+    write_image(path, pixels, profile.file_format, **profile.encode_options())
+
+
+def write_image(path: str, pixels: np.ndarray, file_format: str, **options):
+    """
+    写出图像文件
+    :param path: 输出路径
+    :param pixels: (height, width, 4) uint8 RGBA 图像
+    :param file_format: 文件格式
+    :param options: 编码参数, 如 quality
+    """
+    file_format = file_format.lower()
+    if file_format == "png":
+        with open(path, "wb") as f:
+            f.write(encode_png(pixels, **options))
+        return
+
+    if file_format not in PILLOW_FORMATS:
+        raise ValueError(f"Unsupported file format: {file_format}")
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ValueError(f"导出 {file_format} 格式需要安装 Pillow: {e}")
+
+    if file_format in ("jpg", "jpeg", "bmp", "gif"):
+        image = Image.fromarray(flatten(pixels), "RGB")
+    else:
+        image = Image.fromarray(pixels, "RGBA")
+    image.save(path, PILLOW_FORMATS[file_format], **options)
@@ -0,0 +1,223 @@
+"""把一次任务的图层修改和导出编译为单个 ExtendScript 脚本"""
+
+import json
+
+from .layer_state import LayerState
+
+# 导出格式对应的 ExtendScript 导出选项类
+JSX_SAVE_OPTIONS = {
+    "jpg": "JPEGSaveOptions",
+    "jpeg": "JPEGSaveOptions",
+    "png": "PNGSaveOptions",
+    "gif": "GIFSaveOptions",
+    "bmp": "BMPSaveOptions",
+    "eps": "EPSSaveOptions",
+    "pdf": "PDFSaveOptions",
+    "psd": "PhotoshopSaveOptions",
+    "tga": "TargaSaveOptions",
+    "tiff": "TiffSaveOptions",
+}
+
+# 脚本运行成功时的返回值
+JSX_OK = "ok"
+
+# 打开文档后记录的历史快照名称
+SNAPSHOT_NAME = "ps_of_py_base"
+
+# 按路径查找图层的辅助函数, 与 LayerFactory 的查找规则一致:
+# 图层集优先于图层, 同时返回 " 拷贝" 图层
+_JSX_PRELUDE = """function _byName(items, name) {
+    for (var i = 0; i < items.length; i++) {
+        if (items[i].name == name) return items[i];
+    }
+    return null;
+}
+function _layers(path) {
+    var parent = app.activeDocument;
+    for (var i = 0; i < path.length - 1; i++) {
+        parent = _byName(parent.layerSets, path[i]);
+        if (!parent) return [];
+    }
+    var name = path[path.length - 1];
+    var kinds = [parent.layerSets, parent.artLayers];
+    for (var k = 0; k < kinds.length; k++) {
+        var target = _byName(kinds[k], name);
+        if (target) {
+            var copy = _byName(kinds[k], name + " \\u62f7\\u8d1d");
+            return copy ? [target, copy] : [target];
+        }
+    }
+    return [];
+}
+function _color(hex) {
+    var color = new SolidColor();
+    color.rgb.hexValue = hex.replace("#", "");
+    return color;
+}
+"""
+
+
+def _js(value) -> str:
+    """Python 值转换为 ExtendScript 字面量(纯 ASCII)"""
+    return json.dumps(value, ensure_ascii=True)
+
+
+class JsxCompiler:
+    """收集图层修改和导出指令, 编译为一次 doJavaScript 调用即可执行的脚本"""
+
+    def __init__(self):
+        self.statements: list[str] = []
+        self.layer_names: set[str] = set()  # 待执行脚本中修改过的图层
+        self.reverted = False  # 待执行脚本中是否包含恢复快照, 恢复后所有图层都会变化
+
+    def __bool__(self) -> bool:
+        return bool(self.statements)
+
+    def change_layer_state(self, layer_name: str, change_state: LayerState):
+        """
+        添加一个图层的修改指令
+        :param layer_name: 图层路径, 如 "标题/标题1"
+        :param change_state: 需要修改的属性
+        """
+        body = []
+        if change_state.visible is not None:
+            body.append(f"layer.visible = {_js(bool(change_state.visible))};")
+        if change_state.move is not None:
+            x, y = change_state.move
+            body.append(
+                f"layer.translate({_js(x)} - layer.bounds[0].as('px'), "
+                f"{_js(y)} - layer.bounds[1].as('px'));"
+            )
+        if change_state.rotate is not None:
+            body.append(f"layer.rotate({_js(change_state.rotate)});")
+        if change_state.text is not None:
+            for key, attr_name in change_state.text.items():
+                if key == "color":
+                    body.append(f"layer.textItem.color = _color({_js(attr_name)});")
+                    continue
+                body.append(f"layer.textItem[{_js(key)}] = {_js(attr_name)};")
+        if not body:
+            return
+
+        statement = [
+            f"layers = _layers({_js(layer_name.split('/'))});",
+            "for (var i = 0; i < layers.length; i++) {",
+            "    var layer = layers[i];",
+            *[f"    {line}" for line in body],
+            "}",
+        ]
+        self.statements.append("\n".join(statement))
+        self.layer_names.add(layer_name)
+
+    def save_as(
+        self,
+        path: str,
+        file_format: str,
+        width: int | None = None,
+        height: int | None = None,
+        quality: int | None = None,
+    ):
+        """
+        添加导出指令
+        :param path: 导出文件完整路径
+        :param file_format: 导出文件格式
+        :param width: 输出宽度, 与 height 只指定一个时按比例缩放
+        :param height: 输出高度
+        :param quality: JPEG 质量, 0-12
+        """
+        file_format = file_format.lower()
+        if file_format not in JSX_SAVE_OPTIONS:
+            raise ValueError(f"Unsupported file format: {file_format}")
+        options = f"new {JSX_SAVE_OPTIONS[file_format]}()"
+        if quality is not None and file_format in ("jpg", "jpeg"):
+            options = (
+                f"(function () {{ var o = {options}; "
+                f"o.quality = {_js(quality)}; return o; }})()"
+            )
+        if width is None and height is None:
+            self.statements.append(
+                f"app.activeDocument.saveAs(new File({_js(path)}), {options}, true);"
+            )
+            return
+        # 复制文档后缩放导出, 不影响原文档
+        self.statements.append(
+            "\n".join(
+                [
+                    "(function (doc) {",
+                    f"    var w = {_js(width)}, h = {_js(height)};",
+                    "    var ratio = doc.width.as('px') / doc.height.as('px');",
+                    "    if (w === null) w = Math.max(1, Math.round(h * ratio));",
+                    "    if (h === null) h = Math.max(1, Math.round(w / ratio));",
+                    "    var copy = doc.duplicate();",
+                    "    copy.resizeImage(UnitValue(w, 'px'), UnitValue(h, 'px'), null, "
+                    "ResampleMethod.BICUBIC);",
+                    f"    copy.saveAs(new File({_js(path)}), {options}, true);",
+                    "    copy.close(SaveOptions.DONOTSAVECHANGES);",
+                    "    app.activeDocument = doc;",
+                    "})(app.activeDocument);",
+                ]
+            )
+        )
+
+    def create_snapshot(self, name: str = SNAPSHOT_NAME):
+        """
+        添加把当前文档记录为历史快照的指令
+        :param name: 快照名称
+        """
+        self.statements.append(
+            "\n".join(
+                [
+                    "var desc = new ActionDescriptor();",
+                    "var snapshotRef = new ActionReference();",
+                    "snapshotRef.putClass(charIDToTypeID('SnpS'));",
+                    "desc.putReference(charIDToTypeID('null'), snapshotRef);",
+                    "var fromRef = new ActionReference();",
+                    "fromRef.putProperty(charIDToTypeID('HstS'), charIDToTypeID('CrnH'));",
+                    "desc.putReference(charIDToTypeID('From'), fromRef);",
+                    f"desc.putString(charIDToTypeID('Nm  '), {_js(name)});",
+                    "desc.putEnumerated(charIDToTypeID('Usng'), charIDToTypeID('HstS'), "
+                    "charIDToTypeID('FllD'));",
+                    "executeAction(charIDToTypeID('Mk  '), desc, DialogModes.NO);",
+                ]
+            )
+        )
+
+    def revert_snapshot(self, name: str = SNAPSHOT_NAME):
+        """
+        添加恢复到历史快照的指令, 一次操作恢复所有图层
+        :param name: 快照名称
+        """
+        self.statements.append(
+            "app.activeDocument.activeHistoryState = "
+            f"app.activeDocument.historyStates.getByName({_js(name)});"
+        )
+        self.reverted = True
+
+    def compile(self) -> str:
+        """
+        生成完整脚本, 运行成功返回 "ok", 失败返回错误信息
+        :return: ExtendScript 脚本
+        """
+        body = "\n".join(self.statements)
+        return (
+            _JSX_PRELUDE
+            + "(function () {\n"
+            + "var rulerUnits = app.preferences.rulerUnits;\n"
+            + "app.preferences.rulerUnits = Units.PIXELS;\n"
+            + "try {\n"
+            + "var layers;\n"
+            + body
+            + f"\nreturn {_js(JSX_OK)};\n"
+            + "} catch (e) {\n"
+            + "return 'error: ' + e.message + ' (line ' + e.line + ')';\n"
+            + "} finally {\n"
+            + "app.preferences.rulerUnits = rulerUnits;\n"
+            + "}\n"
+            + "})();\n"
+        )
+
+    def clear(self):
+        """清空已收集的指令"""
+        self.statements = []
+        self.layer_names = set()
+        self.reverted = False
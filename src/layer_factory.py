@@ -1,178 +1,225 @@
 """图层工厂"""
 
-import time
 
 from loguru import logger
 from photoshop import Session
 from photoshop.api._artlayer import ArtLayer
 from photoshop.api._layerSet import LayerSet
 
+from .base_layer_factory import BaseLayerFactory
+from .jsx_compiler import JSX_OK, SNAPSHOT_NAME, JsxCompiler
+from .layer_shadow import LayerShadow
+from .layer_state import LayerState
 from .ps_utils import ColorFactory
 
 logger.add("layer.log", rotation="1 MB")
 
 
-class LayerFactory:
+class LayerFactory(BaseLayerFactory):
     """工厂类：创建和管理图层状态"""
 
-    def __init__(self, ps_session: Session):
+    def __init__(self, ps_session: Session, use_jsx: bool = False):
+        """
+        :param ps_session: Photoshop 会话
+        :param use_jsx: 是否把图层修改编译为 ExtendScript 批量执行
+        """
+        super().__init__()
         self.ps_session = ps_session
-
-        self.layer_dict = {}  # 图层列表
-        self.initial_state = {}  # 初始状态
-        self.current_state = {}  # 当前状态
-
-        self.run_time_record: dict = {}  # 运行时间记录
-
-    def get_all_layers(self) -> list[LayerSet | ArtLayer]:
-        """获取所有图层"""
-        layers = []
-        layers.append(
-            {"TOP": [layer.name for layer in self.ps_session.active_document.artLayers]}
-        )
-
-        # 构建图层集及其子图层的详细信息
-        for layer_set in self.ps_session.active_document.layerSets:
-            layers_in_set = [layer.name for layer in layer_set.artLayers] + [
-                layer.name for layer in layer_set.layerSets
-            ]
-            layers.append(f"{layer_set.name}: {layers_in_set}")
-
+        self.jsx_compiler = JsxCompiler() if use_jsx else None
+        # 图层影子: id(图层对象) -> LayerShadow, 图层对象由图层索引持有
+        self.shadows: dict[int, LayerShadow] = {}
+        # 十六进制颜色 -> SolidColor, 相同颜色只创建一次
+        self.colors: dict[str, object] = {}
+        # 文档是否与打开时一致, 一致时图层树缓存中的状态可以直接作为影子的值
+        self.pristine = True
+
+    @property
+    def document(self):
+        """当前文档"""
+        return self.ps_session.active_document
+
+    def shadow(self, layer: LayerSet | ArtLayer) -> LayerShadow:
+        """图层的影子, 第一次使用时创建"""
+        shadow = self.shadows.get(id(layer))
+        if shadow is None or shadow.layer is not layer:
+            shadow = self.shadows[id(layer)] = LayerShadow(layer)
+            if self.jsx_compiler:
+                # 待执行的脚本(恢复快照、父图层组或子图层的修改)可能改变这个图层的位置
+                shadow.pending.add("position")
+        return shadow
+
+    def invalidate(self, layer_name: str | None = None):
+        """
+        丢弃影子中的本地值, 在 LayerFactory 以外修改了文档后调用
+        :param layer_name: 图层路径, 为空时丢弃所有图层
+        """
+        if layer_name is None:
+            for shadow in self.shadows.values():
+                shadow.invalidate()
+            # 文档已经与模板文件不同, 不再使用图层树缓存中的状态
+            self.pristine = False
+            return
+        for layer in self.layer_dict.get(layer_name, []):
+            self.shadow(layer).invalidate()
+
+    def _apply_layer_state(self, layer_name: str, layer_list: list, delta: LayerState):
+        """把需要修改的属性写入图层, 批量模式下只记录到待执行脚本中并同步影子"""
+        self.pristine = False
+        if self.jsx_compiler is None:
+            super()._apply_layer_state(layer_name, layer_list, delta)
+        elif len(layer_list) < len(self.layer_dict.get(layer_name, [])):
+            # 脚本按路径修改路径下的所有图层, 只修改其中一部分图层(拷贝图层各自恢复)时直接写入
+            self.run_pending_script()
+            super()._apply_layer_state(layer_name, layer_list, delta)
+        else:
+            self.jsx_compiler.change_layer_state(layer_name, delta)
+            for layer in layer_list:
+                self.shadow(layer).record(delta)
+        if delta.move is not None or delta.rotate is not None or delta.text is not None:
+            self._forget_related_positions(layer_name)
+
+    def _forget_related_positions(self, layer_name: str):
+        """图层边界变化后, 父图层组和子图层的位置都可能变化, 丢弃它们影子中的位置"""
+        parts = layer_name.split("/")
+        related = ["/".join(parts[:depth]) for depth in range(1, len(parts))]
+        prefix = layer_name + "/"
+        if prefix in self.layer_tree:
+            # 图层组: 所有子图层
+            related.extend(path for path in self.layer_dict if path.startswith(prefix))
+        for path in related:
+            for layer in self.layer_dict.get(path, []):
+                shadow = self.shadows.get(id(layer))
+                if shadow is not None and shadow.layer is layer:
+                    shadow.forget_position()
+                    if self.jsx_compiler is not None:
+                        shadow.pending.add("position")
+
+    def save_initial_layer_state(self, layername: str, layerinfo: LayerState | dict):
+        """
+        保存图层状态, 批量模式下只有待执行的脚本会改变需要读取的属性时才先执行脚本,
+        保证读到的是真实状态(父图层组的修改也会改变图层位置); 恢复快照后影子中的
+        快照值直接作为初始值, 恢复、修改和导出仍然在一个脚本中执行
+        """
+        unrecorded = self.unrecorded_state(layername, layerinfo)
+        if (
+            self.jsx_compiler
+            and unrecorded
+            and not all(
+                self.shadow(layer).readable(unrecorded)
+                for layer in self.layer_dict.get(layername, [])
+            )
+        ):
+            self.run_pending_script()
+        super().save_initial_layer_state(layername, layerinfo)
+
+    def run_pending_script(self):
+        """通过一次 doJavaScript 调用执行所有待执行的图层修改和导出"""
+        if not self.jsx_compiler:
+            return
+        statement_count = len(self.jsx_compiler.statements)
+        with self.profiler.span("jsx", statements=statement_count):
+            self._run_script(self.jsx_compiler)
+
+    def run_script(self, compiler: JsxCompiler):
+        """通过一次 doJavaScript 调用执行单独编译的脚本, 如需要缩放的导出, 执行后清空指令"""
+        if not compiler:
+            return
+        with self.profiler.span("jsx", statements=len(compiler.statements)):
+            self._run_script(compiler)
+
+    def _run_script(self, compiler: JsxCompiler):
+        """编译并执行脚本, 执行后清空指令"""
+        script = compiler.compile()
+        reverted = compiler.reverted
+        compiler.clear()
+        result = self.ps_session.app.doJavaScript(script)
+        if result != JSX_OK:
+            logger.error(f"批量脚本执行失败: {result}")
+            raise RuntimeError(f"批量脚本执行失败: {result}")
+        if reverted or compiler is self.jsx_compiler:
+            # 待执行的修改都已经生效, Photoshop 中的值就是影子记录的值
+            for shadow in self.shadows.values():
+                shadow.pending.clear()
+
+    def _capture_snapshot(self):
+        """在历史记录面板中记录快照, 影子中的值就是快照中的值"""
+        # 快照必须包含已经记录的修改
+        self.run_pending_script()
+        for shadow in self.shadows.values():
+            shadow.rebase()
+        compiler = JsxCompiler()
+        compiler.create_snapshot(SNAPSHOT_NAME)
+        self._run_script(compiler)
+
+    def _restore_snapshot(self):
+        """切换到历史快照, 批量模式下和其他修改一起执行, 影子同时回到快照中的值"""
+        for shadow in self.shadows.values():
+            shadow.revert()
+        self.pristine = True
+        if self.jsx_compiler is not None:
+            self.jsx_compiler.revert_snapshot(SNAPSHOT_NAME)
+            return
+        compiler = JsxCompiler()
+        compiler.revert_snapshot(SNAPSHOT_NAME)
+        self._run_script(compiler)
+
+    def _locate_layers(self, nodes: list[dict]) -> list:
+        """按缓存中的位置取得图层, 文档没有修改过时缓存中的状态直接作为影子的值"""
+        layers = super()._locate_layers(nodes)
+        if self.pristine:
+            for layer, node in zip(layers, nodes):
+                self.shadow(layer).seed(node)
         return layers
 
-    def get_layer_by_layername(self, layername: str) -> list[LayerSet | ArtLayer]:
-        """根据层名获取图层"""
-
-        if layername in self.layer_dict:
-            # 如果层名在图层列表中，则直接返回
-            return self.layer_dict[layername]
-
-        layer_path = layername.split("/")
-        final_name = layer_path[-1]
-        copy_name = f"{final_name} 拷贝"
-        change_layer_list = []
-
-        # 根路径
-        root_path = self.ps_session.active_document
-        # 循环找到最后一个节点
-        for layer_item in layer_path[:-1]:
+    def _describe_layer(self, layer: LayerSet | ArtLayer) -> dict:
+        """读取图层打开时的状态, 同时写入影子"""
+        shadow = self.shadow(layer)
+        text = None
+        if not isinstance(layer, LayerSet):
             try:
-                current_layer = root_path.layerSets.getByName(layer_item)
+                text = shadow.get_text().to_dict()
             except Exception:
-                logger.error(f"未找到图层集 '{layer_item}' 在路径 {layer_path}")
-                break
-        else:
-            layerSets_list = [layerSet.name for layerSet in current_layer.layerSets]
-            artLayers_list = [artLayer.name for artLayer in current_layer.artLayers]
-            # 优先查找图层集
-            if final_name in layerSets_list:
-                target_layer = current_layer.layerSets.getByName(final_name)
-                change_layer_list.append(target_layer)
-                if copy_name in layerSets_list:
-                    target_layer = current_layer.layerSets.getByName(copy_name)
-                    change_layer_list.append(target_layer)
-            # 再查找图层
-            elif final_name in artLayers_list:
-                target_layer = current_layer.artLayers.getByName(final_name)
-                change_layer_list.append(target_layer)
-                if copy_name in artLayers_list:
-                    target_layer = current_layer.artLayers.getByName(copy_name)
-                    change_layer_list.append(target_layer)
-
-            else:
-                logger.error(f"未找到图层 '{final_name}' 在路径 {layer_path}")
-
-        self.layer_dict[layername] = change_layer_list
-        return change_layer_list
-
-    def change_layer_state(self, layer_name: str, change_state: dict):
-        """修改图层状态"""
-        layer_list = self.get_layer_by_layername(layer_name)
-        for layer in layer_list:
-            self._change_layer_state(layer, change_state)
-            self.current_state[layer_name] = change_state
-
-    def save_initial_layer_state(self, layername: str, layerinfo: dict):
-        """保存图层状态"""
-        if layername not in self.initial_state:
-            target_layers = self.get_layer_by_layername(layername)
-            for target_layer in target_layers:
-                # 使用工厂创建初始状态
-                state = self._create_layer_state(target_layer, layerinfo)
-
-                # 同时保存初始状态和当前状态
-                self.initial_state[layername] = state.copy()
-                self.current_state[layername] = state.copy()
-
-                logger.info(f"保存初始状态成功: {layername=}, {state=}")
-
-    def restore_text_item_to_initial(self, layer_name: str):
-        """将指定图层的文本属性恢复到初始状态"""
-        initial_state = self.initial_state.get(layer_name, {})
-        if "textItem" in initial_state:
-            self.change_layer_state(layer_name, initial_state)
-            logger.info(f"图层 {layer_name} 的文本属性已恢复到初始状态")
-
-    def restore_all_layers_to_initial(self):
-        """恢复所有图层的状态为初始状态"""
-        for layer_name, layer_info in self.initial_state.items():
-            self.change_layer_state(layer_name, layer_info)
-
-    def _create_layer_state(self, layer: LayerSet | ArtLayer, layer_info: dict) -> dict:
+                # 不是文本图层
+                text = None
+        return {"visible": shadow.get_visible(), "bounds": list(shadow.read_bounds()), "text": text}
+
+    def _create_layer_state(
+        self, layer: LayerSet | ArtLayer, layer_info: LayerState
+    ) -> LayerState:
         """
         记录图层状态信息
         :param layer: 图层对象
-        :param layer_info: 图层信息
-        :return: 初始状态字典
+        :param layer_info: 需要记录的属性
+        :return: 初始状态
         """
-        state = {}
-        if "visible" in layer_info:
-            state["visible"] = layer.visible
-        if "move" in layer_info:
-            state["move"] = (layer.bounds[0], layer.bounds[1])  # type: ignore #
-        if "textItem" in layer_info:
-            state["textItem"] = {}
-            text_item = layer.textItem
-            state["textItem"]["contents"] = text_item.contents
-            state["textItem"]["size"] = text_item.size
-            font_color = text_item.color.rgb
-            # 将RGB颜色转换为十六进制
-            state["textItem"]["color"] = ColorFactory.rgb_to_hex(
-                font_color.red, font_color.green, font_color.blue
-            )
-        return state
+        return self.shadow(layer).read_state(layer_info)
 
-    def _change_layer_state(self, layer: LayerSet | ArtLayer, change_state: dict):
+    def _change_layer_state(self, layer: LayerSet | ArtLayer, change_state: LayerState):
         """
         修改图层状态
-        :param layer_key: 图层名称
-        :param change_state: 初始状态
-        :return: 修改结果
+        :param layer: 图层对象
+        :param change_state: 需要修改的属性
         """
-        start_time = time.time()
-
-        if "visible" in change_state:
-            layer.visible = change_state["visible"]
+        shadow = self.shadow(layer)
+        if change_state.visible is not None:
+            shadow.set_visible(change_state.visible)
+        # 修改位置
+        if change_state.move is not None:
+            shadow.move_to(*change_state.move)
         # 修改旋转角度
-        if "move" in change_state:
-            x = layer.bounds[0]  # type: ignore
-            y = layer.bounds[1]  # type: ignore
-            layer.translate(change_state["move"][0] - x, change_state["move"][1] - y)
-        if "rotate" in change_state:
-            layer.rotate(change_state["rotate"])
+        if change_state.rotate is not None:
+            shadow.rotate(change_state.rotate)
         # 如果是文本图层，修改文本属性
-        if "textItem" in change_state:
-            text_item_state = change_state["textItem"]
-            for key, attr_name in text_item_state.items():
+        if change_state.text is not None:
+            for key, attr_name in change_state.text.items():
                 if key == "color":
-                    layer.textItem.color = ColorFactory.hex_to_rgb(attr_name)
+                    shadow.set_text(key, attr_name, self._color(attr_name))
                     continue
-                if key == "contents":
-                    if isinstance(attr_name, (int, float)):
-                        attr_name = str(int(attr_name))
-
-                setattr(layer.textItem, key, attr_name)
-
-        self.run_time_record[layer.name + str(change_state)] = round(
-            time.time() - start_time, 2
-        )
+                shadow.set_text(key, attr_name)
+
+    def _color(self, hex_color: str):
+        """十六进制颜色对应的 SolidColor, 相同颜色复用同一个对象"""
+        color = self.colors.get(hex_color)
+        if color is None:
+            color = self.colors[hex_color] = ColorFactory.hex_to_rgb(hex_color)
+        return color
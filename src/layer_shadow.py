@@ -0,0 +1,247 @@
+"""图层影子模型: 在本地保存 Photoshop 图层属性, 读取不再跨进程调用"""
+
+from typing import Any
+
+from .layer_state import LayerState, TextState
+from .ps_utils import ColorFactory
+
+# 尚未从 Photoshop 读取的属性
+_UNKNOWN = object()
+
+# 随快照恢复的属性
+_STATE_ATTRS = ("visible", "position", "contents", "size", "color")
+# LayerState 的属性对应的影子属性
+_INFO_ATTRS = (
+    ("visible", ("visible",)),
+    ("move", ("position",)),
+    ("text", ("contents", "size", "color")),
+)
+
+
+def normalize_color(hex_color: str) -> str:
+    """十六进制颜色统一为 rgb_to_hex 的格式, 与从 Photoshop 读取的值一致"""
+    return "#" + str(hex_color).lstrip("#").lower()
+
+
+class LayerShadow:
+    """
+    一个图层的影子: 属性第一次用到时从 Photoshop 读取, 之后通过影子写入的修改同时更新本地值
+    快照之后没有修改过时读到的值就是快照中的值, 恢复快照后直接使用, 不需要重新读取
+    旋转后位置无法在本地计算, 重新读取
+    """
+
+    __slots__ = (
+        "layer",
+        "visible",
+        "position",
+        "text_item",
+        "contents",
+        "size",
+        "color",
+        "base",
+        "dirty",
+        "pending",
+    )
+
+    def __init__(self, layer: Any):
+        """
+        :param layer: Photoshop 图层对象
+        """
+        self.layer = layer
+        self.invalidate()
+
+    def invalidate(self):
+        """丢弃所有本地值, 下次使用时重新读取"""
+        self.visible = _UNKNOWN
+        self.position = _UNKNOWN
+        self.text_item = _UNKNOWN
+        self.contents = _UNKNOWN
+        self.size = _UNKNOWN
+        self.color = _UNKNOWN
+        # 快照中的属性值: {属性: 值}, 以及快照之后修改过的属性
+        self.base: dict[str, Any] = {}
+        self.dirty: set[str] = set()
+        # 批量模式下待执行的脚本会改变的属性, 脚本执行前 Photoshop 中的值不是执行后的值
+        self.pending: set[str] = set()
+
+    def rebase(self):
+        """记录快照时调用, 当前的本地值就是快照中的值"""
+        self.base = {
+            name: getattr(self, name)
+            for name in _STATE_ATTRS
+            if getattr(self, name) is not _UNKNOWN
+        }
+        self.dirty.clear()
+
+    def revert(self):
+        """文档恢复到快照后调用, 属性回到快照中的值, 快照中未知的属性下次使用时读取"""
+        # 快照之后修改过且快照中没有本地值的属性, 恢复快照的脚本执行后才能读取
+        self.pending |= self.dirty - self.base.keys()
+        for name in _STATE_ATTRS:
+            setattr(self, name, self.base.get(name, _UNKNOWN))
+        self.dirty.clear()
+
+    def _loaded(self, name: str, value: Any) -> Any:
+        """记录从 Photoshop 读到的值"""
+        setattr(self, name, value)
+        if name not in self.dirty:
+            self.base[name] = value
+        return value
+
+    def _written(self, name: str, value: Any):
+        """记录写入的值"""
+        setattr(self, name, value)
+        self.dirty.add(name)
+
+    def knows(self, layer_info: LayerState) -> bool:
+        """需要的属性是否都已经有本地值"""
+        if layer_info.visible is not None and self.visible is _UNKNOWN:
+            return False
+        if layer_info.move is not None and self.position is _UNKNOWN:
+            return False
+        if layer_info.text is not None and _UNKNOWN in (self.contents, self.size, self.color):
+            return False
+        return True
+
+    def readable(self, layer_info: LayerState) -> bool:
+        """
+        有待执行的脚本时需要的属性能否不执行脚本直接得到: 有本地值(恢复快照后为快照中的值),
+        或者待执行的脚本不会改变它, Photoshop 中的值就是脚本执行后的值
+        """
+        for field, names in _INFO_ATTRS:
+            if getattr(layer_info, field) is None:
+                continue
+            for name in names:
+                if getattr(self, name) is _UNKNOWN and name in self.pending:
+                    return False
+        return True
+
+    # 读取
+
+    def get_visible(self) -> bool:
+        if self.visible is _UNKNOWN:
+            self._loaded("visible", self.layer.visible)
+        return self.visible
+
+    def get_position(self) -> tuple:
+        """图层左上角坐标, 一次读取 bounds"""
+        if self.position is _UNKNOWN:
+            bounds = self.layer.bounds
+            self._loaded("position", (bounds[0], bounds[1]))
+        return self.position
+
+    def read_bounds(self) -> tuple:
+        """读取完整的图层边界, 同时记录左上角坐标"""
+        bounds = tuple(self.layer.bounds)
+        if self.position is _UNKNOWN:
+            self._loaded("position", bounds[:2])
+        return bounds
+
+    def get_text_item(self):
+        if self.text_item is _UNKNOWN:
+            self.text_item = self.layer.textItem
+        return self.text_item
+
+    def get_text(self) -> TextState:
+        """文本内容、字号和颜色"""
+        if self.contents is _UNKNOWN:
+            self._loaded("contents", self.get_text_item().contents)
+        if self.size is _UNKNOWN:
+            self._loaded("size", self.get_text_item().size)
+        if self.color is _UNKNOWN:
+            rgb = self.get_text_item().color.rgb
+            self._loaded("color", ColorFactory.rgb_to_hex(rgb.red, rgb.green, rgb.blue))
+        return TextState(self.contents, self.size, self.color)
+
+    def read_state(self, layer_info: LayerState) -> LayerState:
+        """
+        读取 layer_info 中指定的属性
+        :return: 当前状态
+        """
+        visible = self.get_visible() if layer_info.visible is not None else None
+        move = self.get_position() if layer_info.move is not None else None
+        text = self.get_text() if layer_info.text is not None else None
+        # 打开时的方向即 0 度
+        rotate = 0 if layer_info.rotate is not None else None
+        return LayerState(visible, move, rotate, text)
+
+    def seed(self, node: dict):
+        """
+        使用图层树缓存中打开时的状态作为本地值, 只能在文档与模板文件一致时调用
+        :param node: {"visible", "bounds", "text"}
+        """
+        values = {"visible": node.get("visible")}
+        if node.get("bounds") is not None:
+            values["position"] = tuple(node["bounds"][:2])
+        text = node.get("text")
+        if text is not None:
+            values.update(contents=text.get("contents"), size=text.get("size"))
+            if text.get("color") is not None:
+                values["color"] = normalize_color(text["color"])
+        for name, value in values.items():
+            if value is not None and getattr(self, name) is _UNKNOWN and name not in self.dirty:
+                self._loaded(name, value)
+
+    # 写入
+
+    def set_visible(self, visible: bool):
+        if self.visible is _UNKNOWN or self.visible != visible:
+            self.layer.visible = visible
+        self._written("visible", visible)
+
+    def move_to(self, left: float, top: float):
+        """移动图层左上角到指定位置"""
+        x, y = self.get_position()
+        if (x, y) != (left, top):
+            self.layer.translate(left - x, top - y)
+        self._written("position", (left, top))
+
+    def rotate(self, angle: float):
+        self.layer.rotate(angle)
+        self.forget_position()
+
+    def forget_position(self):
+        """图层边界被其他修改改变(旋转、文本变化、父图层组或子图层移动), 下次使用时重新读取"""
+        self._written("position", _UNKNOWN)
+
+    def set_text(self, key: str, value: Any, color_object: Any = None):
+        """
+        修改文本属性
+        :param key: contents / size / color
+        :param value: 属性值, 颜色为十六进制
+        :param color_object: 颜色对应的 SolidColor
+        """
+        text_item = self.get_text_item()
+        if key == "color":
+            text_item.color = color_object
+            self._written("color", normalize_color(value))
+            return
+        setattr(text_item, key, value)
+        if key in ("contents", "size"):
+            self._written(key, value)
+        # 文本内容和字号改变文本边界
+        self.forget_position()
+
+    def record(self, delta: LayerState):
+        """
+        记录已经交给脚本执行的修改, 不调用 Photoshop
+        :param delta: 脚本中执行的属性修改
+        """
+        if delta.visible is not None:
+            self._written("visible", delta.visible)
+            self.pending.add("visible")
+        if delta.move is not None:
+            self._written("position", tuple(delta.move))
+            self.pending.add("position")
+        if delta.rotate is not None:
+            self.forget_position()
+            self.pending.add("position")
+        if delta.text is not None:
+            for key, value in delta.text.items():
+                if key == "color":
+                    self._written("color", normalize_color(value))
+                elif key in ("contents", "size"):
+                    self._written(key, value)
+                    self.forget_position()
+                    self.pending.add("position")
+                self.pending.add(key)
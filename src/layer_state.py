@@ -0,0 +1,185 @@
+"""不可变、可哈希的图层状态模型"""
+
+import weakref
+
+
+def _changed(old, new):
+    """new 已指定且与 old 不同时返回 new, 否则返回 None"""
+    return new if new is not None and new != old else None
+
+
+class _InternedState:
+    """
+    不可变状态基类: 相同字段的实例只创建一次(驻留), 哈希值在创建时计算
+    未指定的属性为 None
+    """
+
+    __slots__ = ("_hash", "__weakref__")
+    _fields: tuple[str, ...] = ()
+    _interned: weakref.WeakValueDictionary
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, *values):
+        key = values
+        instance = cls._interned.get(key)
+        if instance is None:
+            instance = super().__new__(cls)
+            for name, value in zip(cls._fields, values):
+                object.__setattr__(instance, name, value)
+            object.__setattr__(instance, "_hash", hash((cls, key)))
+            cls._interned[key] = instance
+        return instance
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} 是不可变对象")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} 是不可变对象")
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if type(self) is not type(other) or self._hash != other._hash:
+            return False
+        return self.values() == other.values()
+
+    def __bool__(self) -> bool:
+        """是否指定了任意属性"""
+        return any(value is not None for value in self.values())
+
+    def __reduce__(self):
+        return (type(self), self.values())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.items())
+        return f"{type(self).__name__}({fields})"
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def items(self):
+        """已指定的 (属性名, 值)"""
+        for name in self._fields:
+            value = getattr(self, name)
+            if value is not None:
+                yield name, value
+
+    def change_count(self) -> int:
+        """设置这些属性需要的修改次数, 嵌套状态的每个属性各算一次"""
+        return sum(
+            value.change_count() if isinstance(value, _InternedState) else 1
+            for _, value in self.items()
+        )
+
+
+class TextState(_InternedState):
+    """文本图层属性"""
+
+    __slots__ = ("contents", "size", "color")
+    _fields = ("contents", "size", "color")
+
+    def __new__(cls, contents=None, size=None, color=None):
+        # 表格中的数字内容统一转换为整数文本
+        if isinstance(contents, (int, float)) and not isinstance(contents, bool):
+            contents = str(int(contents))
+        return super().__new__(cls, contents, size, color)
+
+    @classmethod
+    def from_dict(cls, text_item: dict) -> "TextState":
+        return cls(text_item.get("contents"), text_item.get("size"), text_item.get("color"))
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def delta(self, target: "TextState") -> "TextState":
+        """target 中与当前值不同的属性"""
+        if self is target:
+            return EMPTY_TEXT
+        return TextState(
+            _changed(self.contents, target.contents),
+            _changed(self.size, target.size),
+            _changed(self.color, target.color),
+        )
+
+
+class LayerState(_InternedState):
+    """
+    单个图层的状态, 同时用于描述初始状态、当前状态和修改指令
+    作为状态时 rotate 是相对模板打开时方向的顺时针角度(打开时为 0), 不随之前的任务累加;
+    作为传给引擎 _change_layer_state 的修改指令时是在当前方向上再旋转的角度
+    """
+
+    __slots__ = ("visible", "move", "rotate", "text")
+    _fields = ("visible", "move", "rotate", "text")
+
+    def __new__(
+        cls,
+        visible: bool | None = None,
+        move: tuple | None = None,
+        rotate: float | None = None,
+        text: TextState | None = None,
+    ):
+        if move is not None:
+            move = tuple(move)
+        if text is not None and not text:
+            text = None
+        return super().__new__(cls, visible, move, rotate, text)
+
+    @classmethod
+    def from_dict(cls, layer_info: dict) -> "LayerState":
+        """
+        从 input_data 中单个图层的字典创建
+        :param layer_info: {"visible", "move", "rotate", "textItem"}
+        """
+        text_item = layer_info.get("textItem")
+        return cls(
+            layer_info.get("visible"),
+            layer_info.get("move"),
+            layer_info.get("rotate"),
+            TextState.from_dict(text_item) if text_item is not None else None,
+        )
+
+    @classmethod
+    def coerce(cls, layer_info: "LayerState | dict") -> "LayerState":
+        """字典或 LayerState 统一转换为 LayerState"""
+        if isinstance(layer_info, LayerState):
+            return layer_info
+        return cls.from_dict(layer_info)
+
+    def to_dict(self) -> dict:
+        """转换回 input_data 格式的字典"""
+        result = {}
+        for name, value in self.items():
+            if name == "text":
+                result["textItem"] = value.to_dict()
+            else:
+                result[name] = value
+        return result
+
+    def delta(self, target: "LayerState") -> "LayerState":
+        """
+        从当前状态修改到 target 需要设置的属性, 只包含 target 中指定且与当前值不同的属性
+        :param target: 目标状态
+        :return: 需要修改的属性
+        """
+        if self is target:
+            return EMPTY_STATE
+        text = None
+        if target.text is not None:
+            text = (self.text or EMPTY_TEXT).delta(target.text)
+        return LayerState(
+            _changed(self.visible, target.visible),
+            _changed(self.move, target.move),
+            _changed(self.rotate, target.rotate),
+            text,
+        )
+
+
+EMPTY_TEXT = TextState()
+EMPTY_STATE = LayerState()
@@ -0,0 +1,96 @@
+"""图层树缓存: 把模板的图层树保存到旁路文件, 再次打开相同模板时不再遍历图层"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from loguru import logger
+
+from .render_cache import file_sha256
+
+# 缓存格式版本, 图层树内容变化导致旧缓存失效时递增
+LAYER_TREE_VERSION = 1
+
+
+class LayerTreeCache:
+    """
+    图层树缓存: 每个模板一个 JSON 文件, 记录文档尺寸、图层名、每个图层的位置索引和打开时的状态
+    按文件大小和修改时间校验, 修改时间变化但内容相同(如复制模板)时按 sha256 校验后继续使用
+    """
+
+    def __init__(self, cache_dir: str | None = None):
+        """
+        :param cache_dir: 缓存目录, 为空时保存在模板旁边的 <模板文件名>.layers.json
+        """
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, psd_file_path: str) -> str:
+        """模板对应的缓存文件路径"""
+        if self.cache_dir is None:
+            return f"{psd_file_path}.layers.json"
+        # 不同目录下的同名模板使用不同的缓存文件
+        path_hash = hashlib.sha256(os.path.abspath(psd_file_path).encode("utf-8")).hexdigest()
+        return os.path.join(
+            self.cache_dir, f"{os.path.basename(psd_file_path)}.{path_hash[:16]}.json"
+        )
+
+    def load(self, psd_file_path: str) -> dict | None:
+        """
+        读取模板的图层树
+        :return: 图层树, 没有缓存或模板已经变化时返回 None
+        """
+        cache_path = self.path_for(psd_file_path)
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(psd_file_path)
+        if data.get("version") != LAYER_TREE_VERSION or data.get("size") != stat.st_size:
+            logger.info(f"模板 {psd_file_path} 已变化, 重新建立图层树缓存")
+            return None
+        if data.get("mtime_ns") != stat.st_mtime_ns:
+            if data.get("sha256") != file_sha256(psd_file_path):
+                logger.info(f"模板 {psd_file_path} 已变化, 重新建立图层树缓存")
+                return None
+            # 内容没有变化, 记录新的修改时间, 下次不再计算哈希
+            data["mtime_ns"] = stat.st_mtime_ns
+            self._write(cache_path, data)
+        logger.info(f"从 {cache_path} 读取图层树")
+        return data["tree"]
+
+    def save(self, psd_file_path: str, tree: dict):
+        """
+        保存模板的图层树
+        :param tree: 图层树, 内容见 BaseCore._layer_tree
+        """
+        stat = os.stat(psd_file_path)
+        data = {
+            "version": LAYER_TREE_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(psd_file_path),
+            "tree": tree,
+        }
+        cache_path = self.path_for(psd_file_path)
+        try:
+            self._write(cache_path, data)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"写入图层树缓存失败: {e}")
+            return
+        logger.info(f"图层树已缓存到 {cache_path}")
+
+    @staticmethod
+    def _write(cache_path: str, data: dict):
+        """先写临时文件再替换, 中断时不会留下不完整的缓存"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
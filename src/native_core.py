@@ -0,0 +1,148 @@
+"""纯 Python 离线渲染引擎, 无需运行 Photoshop"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from loguru import logger
+
+from .base_core import BaseCore
+from .compositor import Compositor, TiledCompositor
+from .export_profile import ExportProfile
+from .export_queue import ExportWrite
+from .image_writer import PILLOW_FORMATS, write_image, write_png_rows, write_profile
+from .native_layer_factory import NativeLayerFactory
+from .psd_reader import read_psd
+
+
+class NativePhotoshop(BaseCore):
+    """离线渲染引擎：解析 PSD/PSB 文件, 在内存图层树上修改并用 NumPy 合成导出"""
+
+    def __init__(
+        self,
+        *args,
+        font_path: str = None,
+        export_workers: int = None,
+        group_cache_bytes: int = 256 << 20,
+        tile_size: int | None = None,
+        pixel_cache_bytes: int = 512 << 20,
+        **kwargs,
+    ):
+        """
+        初始化离线渲染引擎, 参数与 Photoshop 类一致
+        :param font_path: 重新渲染文本图层时使用的字体文件
+        :param export_workers: 多个导出配置时缩放和编码的线程数量
+        :param group_cache_bytes: 缓存没有变化的图层组合成结果的内存上限, 为 0 时不缓存
+        :param tile_size: 分块合成的块边长, 为 None 时 PSB 文件按 1024 分块, 为 0 时整张合成
+        :param pixel_cache_bytes: 已解码图层像素缓存的内存上限, 超过时淘汰最久未使用的图层
+        """
+        super().__init__(*args, **kwargs)
+        self.font_path = font_path
+        self.group_cache_bytes = group_cache_bytes
+        self.tile_size = tile_size
+        self.pixel_cache_bytes = pixel_cache_bytes
+        self.export_workers = export_workers or min(4, os.cpu_count() or 1)
+        self._export_executor: ThreadPoolExecutor | None = None
+        formats = {self.file_format} | {p.file_format for p in self.export_profiles}
+        for file_format in formats:
+            if file_format != "png" and file_format not in PILLOW_FORMATS:
+                raise ValueError(f"Unsupported file format: {file_format}")
+
+    def render_options(self) -> dict:
+        """文本图层重新渲染时使用的字体也影响导出图像"""
+        font_path = os.path.abspath(self.font_path) if self.font_path else None
+        return {**super().render_options(), "font_path": font_path}
+
+    def _release_resources(self):
+        """结束分块合成和导出线程"""
+        compositor = getattr(self, "compositor", None)
+        if isinstance(compositor, TiledCompositor):
+            compositor.close()
+        if self._export_executor is not None:
+            self._export_executor.shutdown()
+            self._export_executor = None
+
+    def _init_ps_session(self):
+        """
+        解析PSD文件并创建图层工厂
+        """
+        self.psd_file_path = self._get_psd_file_path()
+        if self.psd_file_path is None:
+            raise FileNotFoundError(f"找不到PSD文件: {self.psd_name}")
+        tile_size = self.tile_size
+        if tile_size is None:
+            tile_size = 1024 if self.psd_file_path.lower().endswith(".psb") else 0
+        # 打开时只索引图层, 图层像素在第一次可见并参与合成时解码
+        self.doc = read_psd(self.psd_file_path, lazy=True, cache_bytes=self.pixel_cache_bytes)
+        if tile_size:
+            # 大画布分块合成
+            self.compositor = TiledCompositor(
+                self.doc, tile_size, self.export_workers, self.group_cache_bytes
+            )
+        else:
+            self.compositor = Compositor(self.doc, self.group_cache_bytes)
+
+        self.layer_factory = NativeLayerFactory(
+            self.doc, font_path=self.font_path, compositor=self.compositor
+        )
+        # 打开文档时遍历一次图层树或读取图层树缓存, 之后的图层查找不再访问文档
+        self._prepare_layers()
+
+    def _restore_from_journal(self):
+        """每次打开都重新解析模板文件, 中断时的修改不会保留, 不需要恢复"""
+
+    def ps_saveas(self, export_name: str, export_profiles: list[ExportProfile] | None = None):
+        """合成当前图层树并保存文件到指定路径, 多个导出配置共用一次合成结果"""
+        if export_profiles:
+            self._save_profiles(export_name, export_profiles)
+            return
+        path = self._export_path(export_name)
+        try:
+            if isinstance(self.compositor, TiledCompositor) and self.file_format == "png":
+                # 分块合成时逐行块编码写出, 不拼接整张图像
+                write_png_rows(
+                    path, self.doc.width, self.doc.height, self.compositor.composite_rows()
+                )
+            else:
+                write_image(path, self.compositor.composite(), self.file_format)
+            logger.info(f"导出{path}成功")
+        except Exception as e:
+            logger.error(f"导出{path}失败")
+            raise Exception(f"保存文件到指定路径失败: {e}")
+
+    def _export_writes(
+        self, export_name: str, export_profiles: list[ExportProfile] | None = None
+    ) -> list[ExportWrite] | None:
+        """合成当前图层树, 写出函数只引用合成结果, 可以和之后的图层修改同时执行"""
+        if isinstance(self.compositor, TiledCompositor) and not export_profiles:
+            # 分块合成时不保留整张图像, 在 ps_saveas 中同步逐行写出
+            return None
+        pixels = self.compositor.composite()
+        if not export_profiles:
+            path = self._export_path(export_name)
+            return [(path, partial(write_image, path, pixels, self.file_format))]
+        return [
+            (path, partial(write_profile, path, pixels, profile))
+            for profile, path in self._export_targets(export_name, export_profiles)
+        ]
+
+    def _save_profiles(self, export_name: str, export_profiles: list[ExportProfile]):
+        """在线程池中按每个导出配置缩放和编码, 全部完成后返回"""
+        if self._export_executor is None:
+            self._export_executor = ThreadPoolExecutor(
+                self.export_workers, thread_name_prefix="export"
+            )
+        futures = [
+            (path, self._export_executor.submit(write))
+            for path, write in self._export_writes(export_name, export_profiles)
+        ]
+        errors = []
+        for path, future in futures:
+            try:
+                future.result()
+                logger.info(f"导出{path}成功")
+            except Exception as e:
+                logger.error(f"导出{path}失败")
+                errors.append(f"{path}: {e}")
+        if errors:
+            raise Exception(f"保存文件到指定路径失败: {'; '.join(errors)}")
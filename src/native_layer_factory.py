@@ -0,0 +1,222 @@
+"""离线渲染引擎的图层工厂"""
+
+import math
+
+import numpy as np
+from loguru import logger
+
+from .base_layer_factory import BaseLayerFactory
+from .compositor import Compositor
+from .layer_state import LayerState, TextState
+from .psd_reader import PsdDocument, PsdLayer
+
+
+class NativeLayerFactory(BaseLayerFactory):
+    """工厂类：在内存图层树上创建和管理图层状态"""
+
+    # 恢复快照只替换图层属性的引用, 比修改一次属性还便宜
+    snapshot_revert_cost = 1
+
+    def __init__(
+        self, document: PsdDocument, font_path: str = None, compositor: Compositor | None = None
+    ):
+        """
+        :param document: 解析后的 PSD 文档
+        :param font_path: 重新渲染文本图层时使用的字体文件
+        :param compositor: 文档的合成器, 修改图层时标记需要重新合成的区域
+        """
+        super().__init__()
+        self._document = document
+        self.font_path = font_path
+        self.compositor = compositor
+        self._snapshot: list[tuple] = []
+
+    @property
+    def document(self) -> PsdDocument:
+        """当前文档"""
+        return self._document
+
+    def _describe_layer(self, layer: PsdLayer) -> dict:
+        """读取图层打开时的状态"""
+        return {
+            "visible": layer.visible,
+            "bounds": [int(value) for value in layer.bounds],
+            "text": dict(layer.text) if layer.text is not None else None,
+        }
+
+    def _create_layer_state(self, layer: PsdLayer, layer_info: LayerState) -> LayerState:
+        """
+        记录图层状态信息
+        :param layer: 图层对象
+        :param layer_info: 需要记录的属性
+        :return: 初始状态
+        """
+        visible = layer.visible if layer_info.visible is not None else None
+        move = layer.bounds[:2] if layer_info.move is not None else None
+        # 打开时的方向即 0 度
+        rotate = 0 if layer_info.rotate is not None else None
+        text = None
+        if layer_info.text is not None and layer.text is not None:
+            text = TextState(
+                layer.text["contents"], layer.text["size"], layer.text["color"]
+            )
+        return LayerState(visible, move, rotate, text)
+
+    def _change_layer_state(self, layer: PsdLayer, change_state: LayerState):
+        """
+        修改图层状态
+        :param layer: 图层对象
+        :param change_state: 需要修改的属性
+        """
+        # 修改前后的图层边界都需要重新合成
+        self._mark_dirty(layer)
+        if change_state.visible is not None:
+            layer.visible = change_state.visible
+        if change_state.move is not None:
+            x, y = layer.bounds[:2]
+            _translate(layer, change_state.move[0] - x, change_state.move[1] - y)
+        if change_state.rotate is not None:
+            _rotate(layer, change_state.rotate)
+        # 如果是文本图层，修改文本属性后重新栅格化
+        if change_state.text is not None and layer.text is not None:
+            layer.text.update(change_state.text.items())
+            self._rasterize_text(layer)
+        self._mark_dirty(layer)
+
+    def _mark_dirty(self, layer: PsdLayer):
+        """标记图层(图层组为所有子图层)当前所在的区域需要重新合成"""
+        if self.compositor is not None:
+            self.compositor.mark_dirty(layer.bounds)
+
+    def _capture_snapshot(self):
+        """记录所有图层的位置、像素、可见性和文本, 像素数组只在修改时替换, 可以直接引用"""
+        self._snapshot = [
+            (
+                layer,
+                layer.left,
+                layer.top,
+                layer.pixels,
+                layer.visible,
+                layer.opacity,
+                dict(layer.text) if layer.text is not None else None,
+            )
+            for layer in self.document.descendants()
+        ]
+
+    def _restore_snapshot(self):
+        """把所有图层恢复到快照, 只有与快照不同的图层需要重新合成"""
+        for layer, left, top, pixels, visible, opacity, text in self._snapshot:
+            current = (layer.left, layer.top, layer.visible, layer.opacity)
+            changed = current != (left, top, visible, opacity) or layer.pixels is not pixels
+            if changed:
+                self._mark_dirty(layer)
+            layer.left, layer.top, layer.pixels = left, top, pixels
+            layer.visible, layer.opacity = visible, opacity
+            layer.text = dict(text) if text is not None else None
+            if changed:
+                self._mark_dirty(layer)
+
+    def _rasterize_text(self, layer: PsdLayer):
+        """使用 Pillow 重新渲染文本图层的像素"""
+        try:
+            from PIL import Image, ImageDraw, ImageFont
+        except ImportError:
+            logger.warning(f"未安装 Pillow, 文本图层 {layer.name} 保持原有像素")
+            return
+
+        size = int(round(layer.text["size"] or 12))
+        if self.font_path:
+            font = ImageFont.truetype(self.font_path, size)
+        else:
+            font = ImageFont.load_default(size)
+        contents = str(layer.text["contents"])
+        left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox(
+            (0, 0), contents, font=font
+        )
+        width, height = max(right - left, 1), max(bottom - top, 1)
+
+        image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        color = hex_to_rgb(layer.text["color"] or "#000000")
+        ImageDraw.Draw(image).text((-left, -top), contents, font=font, fill=color)
+        layer.pixels = np.asarray(image, dtype=np.uint8).copy()
+
+
+def hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
+    """
+    将十六进制颜色值转换为RGB元组
+    :param hex_color: 16进制颜色值
+    :return: (r, g, b)
+    """
+    hex_color = hex_color.lstrip("#")
+    return tuple(int(hex_color[i : i + 2], 16) for i in (0, 2, 4))
+
+
+def _pixel_layers(layer: PsdLayer) -> list[PsdLayer]:
+    """返回图层本身或图层组下所有带像素的图层"""
+    if not layer.is_group:
+        return [layer]
+    return [child for child in layer.descendants() if not child.is_group]
+
+
+def _translate(layer: PsdLayer, dx: int, dy: int):
+    """平移图层(图层组会平移所有子图层)"""
+    for target in _pixel_layers(layer):
+        target.left += int(round(dx))
+        target.top += int(round(dy))
+
+
+def _rotate(layer: PsdLayer, angle: float):
+    """
+    以图层边界中心为轴顺时针旋转图层, 与 Photoshop 的 rotate 一致
+    :param layer: 图层对象
+    :param angle: 在当前方向上再旋转的角度, 由 BaseLayerFactory 从目标角度换算
+    """
+    left, top, right, bottom = layer.bounds
+    center_x, center_y = (left + right) / 2, (top + bottom) / 2
+    radians = math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+
+    for target in _pixel_layers(layer):
+        if target.load_pixels() is None:
+            continue
+        height, width = target.pixels.shape[:2]
+        offset_x = target.left + width / 2 - center_x
+        offset_y = target.top + height / 2 - center_y
+        new_center_x = center_x + offset_x * cos - offset_y * sin
+        new_center_y = center_y + offset_x * sin + offset_y * cos
+
+        target.pixels = rotate_pixels(target.pixels, angle)
+        new_height, new_width = target.pixels.shape[:2]
+        target.left = int(round(new_center_x - new_width / 2))
+        target.top = int(round(new_center_y - new_height / 2))
+
+
+def rotate_pixels(pixels: np.ndarray, angle: float) -> np.ndarray:
+    """
+    顺时针旋转 RGBA 像素, 画布自动扩展
+    :param pixels: (height, width, 4) uint8
+    :param angle: 旋转角度
+    :return: 旋转后的像素
+    """
+    quarter_turns = angle / 90
+    if quarter_turns == int(quarter_turns):
+        # 90 度的整数倍直接转置, 结果无损
+        return np.ascontiguousarray(np.rot90(pixels, k=-int(quarter_turns) % 4))
+
+    height, width = pixels.shape[:2]
+    radians = math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    new_width = int(math.ceil(abs(width * cos) + abs(height * sin)))
+    new_height = int(math.ceil(abs(width * sin) + abs(height * cos)))
+
+    # 逆向映射: 对每个输出像素求其在源图中的位置(最近邻采样)
+    ys, xs = np.mgrid[0:new_height, 0:new_width].astype(np.float32)
+    xs -= new_width / 2 - 0.5
+    ys -= new_height / 2 - 0.5
+    src_x = np.floor(xs * cos + ys * sin + width / 2).astype(np.intp)
+    src_y = np.floor(-xs * sin + ys * cos + height / 2).astype(np.intp)
+    inside = (src_x >= 0) & (src_x < width) & (src_y >= 0) & (src_y < height)
+
+    result = np.zeros((new_height, new_width, 4), dtype=np.uint8)
+    result[inside] = pixels[src_y[inside], src_x[inside]]
+    return result
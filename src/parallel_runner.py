@@ -0,0 +1,150 @@
+"""多进程并行渲染"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from .export_queue import ExportError
+from .ps_factory import PSFactory
+from .task_dedup import duplicate_names
+from .task_planner import plan_task_order
+
+
+def split_shards(tasks: List[Dict[str, Any]], workers: int) -> List[List[Dict[str, Any]]]:
+    """
+    把任务按顺序切分为连续的分片, 各分片大小相差不超过 1
+    :param tasks: 任务列表
+    :param workers: 分片数量
+    :return: 非空分片列表
+    """
+    count = len(tasks)
+    shards = [tasks[i * count // workers : (i + 1) * count // workers] for i in range(workers)]
+    return [shard for shard in shards if shard]
+
+
+def plan_shards(tasks: List[Dict[str, Any]], workers: int) -> List[List[Dict[str, Any]]]:
+    """
+    先排序任务再切分, 使每个进程拿到连续且相似的任务, 进程内相邻任务之间的图层修改更少
+    :param tasks: 任务列表
+    :param workers: 分片数量
+    :return: 非空分片列表
+    """
+    if len(tasks) > 1:
+        tasks, _ = plan_task_order(tasks)
+    return split_shards(tasks, workers)
+
+
+def run_parallel(
+    tasks: List[Dict[str, Any]],
+    suffix: str = "",
+    engine_type: str = "native",
+    engine_args: tuple = (),
+    engine_kwargs: dict | None = None,
+    workers: int | None = None,
+) -> Dict[str, Any]:
+    """
+    把任务分片到多个进程并行渲染, 每个进程打开自己的文档并维护自己的图层状态
+    :param tasks: selected_skus 返回的任务列表
+    :param suffix: 导出文件名后缀
+    :param engine_type: 图像处理引擎, 只支持离线引擎
+    :param engine_args: 创建引擎的位置参数
+    :param engine_kwargs: 创建引擎的关键字参数
+    :param workers: 进程数量, 默认为 CPU 核数
+    :return: 合并后的运行结果
+    """
+    if engine_type.lower() == "photoshop":
+        raise ValueError("photoshop 引擎只能在单进程中运行")
+    engine_kwargs = engine_kwargs or {}
+    workers = max(1, workers or os.cpu_count() or 1)
+    # 在主进程中创建一次引擎, 校验参数并提前创建导出文件夹
+    PSFactory.create_engine(engine_type, *engine_args, **engine_kwargs)
+
+    shards = plan_shards(tasks, workers)
+
+    result = {
+        "outputs": [],
+        "errors": {},
+        "run_time_record": {},
+        "shards": [],
+    }
+    if not shards:
+        return result
+
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [
+            executor.submit(
+                _render_shard, index, engine_type, engine_args, engine_kwargs, shard, suffix
+            )
+            for index, shard in enumerate(shards)
+        ]
+        for future in futures:
+            shard_result = future.result()
+            result["outputs"].extend(shard_result["outputs"])
+            result["errors"].update(shard_result["errors"])
+            result["run_time_record"].update(shard_result["run_time_record"])
+            # 子进程的耗时统计合并到调用方传入的 profiler
+            if engine_kwargs.get("profiler") is not None:
+                engine_kwargs["profiler"].merge(shard_result["profiler"])
+            result["shards"].append(
+                {
+                    "shard": shard_result["shard"],
+                    "task_count": shard_result["task_count"],
+                    "elapsed": shard_result["elapsed"],
+                }
+            )
+
+    logger.info(
+        f"并行渲染完成: {len(tasks)} 个任务, {len(shards)} 个进程, "
+        f"失败 {len(result['errors'])} 个, 用时 {time.time() - start_time:.2f}s"
+    )
+    return result
+
+
+def _render_shard(
+    shard_index: int,
+    engine_type: str,
+    engine_args: tuple,
+    engine_kwargs: dict,
+    tasks: List[Dict[str, Any]],
+    suffix: str,
+) -> Dict[str, Any]:
+    """子进程: 打开文档并依次渲染一个分片的任务"""
+    start_time = time.time()
+    ps = PSFactory.create_engine(engine_type, *engine_args, **engine_kwargs)
+    # 传入的 profiler 是主进程中的副本, 只返回本进程的统计
+    ps.profiler.clear()
+    outputs, errors = [], {}
+    # {相同内容的任务的导出文件名: 渲染任务的导出文件名}
+    leaders = {}
+    with ps:
+        for task in tasks:
+            export_name = task["任务名"] + suffix
+            duplicates = duplicate_names(task, suffix)
+            try:
+                ps.core(export_name, task["内容"], duplicates=duplicates)
+                outputs.append(export_name)
+                outputs.extend(duplicates)
+                leaders.update(dict.fromkeys(duplicates, export_name))
+            except Exception as e:
+                logger.error(f"任务 {export_name} 渲染失败: {e}")
+                errors[export_name] = str(e)
+        # 异步导出时等待写出, 导出失败的任务记为失败
+        try:
+            ps.flush_exports()
+        except ExportError as e:
+            for export_name, failed in e.errors.items():
+                errors[export_name] = "; ".join(failed.values())
+            outputs = [name for name in outputs if leaders.get(name, name) not in e.errors]
+    return {
+        "shard": shard_index,
+        "task_count": len(tasks),
+        "elapsed": round(time.time() - start_time, 2),
+        "outputs": outputs,
+        "errors": errors,
+        "run_time_record": ps.run_time_record,
+        "profiler": ps.profiler,
+    }
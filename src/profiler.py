@@ -0,0 +1,195 @@
+"""分层耗时统计: 任务 -> 阶段 -> 图层, 输出分位数、直方图和 Chrome trace"""
+
+import json
+import os
+import threading
+from time import perf_counter_ns
+from typing import Any, Dict, List, Tuple
+
+
+class _Span:
+    """一次计时, 退出时记录到 Profiler"""
+
+    __slots__ = ("profiler", "name", "category", "args", "start")
+
+    def __init__(self, profiler: "Profiler", name: str, category: str, args: dict):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler._record(
+            self.category, self.name, self.start, perf_counter_ns() - self.start, self.args
+        )
+
+
+class _NullSpan:
+    """关闭统计时使用的空计时, 不做任何事"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _percentile(sorted_values: List[int], percent: float) -> int:
+    """最近秩分位数"""
+    index = max(0, min(len(sorted_values) - 1, -(-len(sorted_values) * percent // 100) - 1))
+    return sorted_values[int(index)]
+
+
+class Profiler:
+    """
+    耗时统计: 按 "类别:名称" 汇总每次计时的纳秒数, 同时保存时间线用于 Chrome trace
+    类别为 task(一个任务)、phase(恢复、记录初始状态、修改、导出等阶段)、layer(一个图层的一次修改)
+    关闭时 span 返回空计时, 几乎没有开销
+    """
+
+    def __init__(self, enabled: bool = True, max_events: int = 1_000_000):
+        """
+        :param enabled: 是否统计
+        :param max_events: 时间线最多保存的计时数量, 超过后只汇总不保存时间线
+        """
+        self.enabled = enabled
+        self.max_events = max_events
+        # {"类别:名称": [纳秒, ...]}
+        self.durations: Dict[str, List[int]] = {}
+        # [(类别, 名称, 开始纳秒, 纳秒, 进程 id, 线程 id, 参数)]
+        self.events: List[Tuple[str, str, int, int, int, int, dict]] = []
+        self.dropped_events = 0
+        self.pid = os.getpid()
+
+    def __setstate__(self, state: dict):
+        """传递到子进程后记录子进程的 id, 合并后时间线按进程区分"""
+        self.__dict__.update(state)
+        self.pid = os.getpid()
+
+    def span(self, name: str, category: str = "phase", **args):
+        """
+        计时上下文
+        :param name: 名称, 相同类别和名称的计时汇总在一起
+        :param category: task / phase / layer
+        :param args: 写入 Chrome trace 的参数, 如图层名
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def _record(self, category: str, name: str, start: int, duration: int, args: dict):
+        key = f"{category}:{name}"
+        values = self.durations.get(key)
+        if values is None:
+            values = self.durations[key] = []
+        values.append(duration)
+        if len(self.events) < self.max_events:
+            self.events.append(
+                (category, name, start, duration, self.pid, threading.get_ident(), args)
+            )
+        else:
+            self.dropped_events += 1
+
+    def merge(self, other: "Profiler"):
+        """合并其他进程或引擎的统计数据"""
+        for key, values in other.durations.items():
+            self.durations.setdefault(key, []).extend(values)
+        room = self.max_events - len(self.events)
+        self.events.extend(other.events[:room])
+        self.dropped_events += other.dropped_events + max(0, len(other.events) - room)
+
+    def clear(self):
+        self.durations = {}
+        self.events = []
+        self.dropped_events = 0
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        每个 "类别:名称" 的统计
+        :return: {键: {"count", "total_ms", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"}}
+        """
+        result = {}
+        for key, values in self.durations.items():
+            ordered = sorted(values)
+            total = sum(ordered)
+            result[key] = {
+                "count": len(ordered),
+                "total_ms": total / 1e6,
+                "mean_ms": total / len(ordered) / 1e6,
+                "p50_ms": _percentile(ordered, 50) / 1e6,
+                "p90_ms": _percentile(ordered, 90) / 1e6,
+                "p99_ms": _percentile(ordered, 99) / 1e6,
+                "max_ms": ordered[-1] / 1e6,
+            }
+        return result
+
+    def histogram(self, key: str) -> List[Tuple[float, int]]:
+        """
+        按 2 的幂划分的耗时直方图
+        :param key: "类别:名称"
+        :return: [(区间上限毫秒, 次数)], 从最小的非空区间到最大的非空区间
+        """
+        counts: Dict[int, int] = {}
+        for value in self.durations.get(key, []):
+            # 区间 (2^(k-1), 2^k] 微秒
+            bucket = (value // 1000 - 1).bit_length() if value > 1000 else 0
+            counts[bucket] = counts.get(bucket, 0) + 1
+        if not counts:
+            return []
+        return [
+            ((1 << bucket) / 1000, counts.get(bucket, 0))
+            for bucket in range(min(counts), max(counts) + 1)
+        ]
+
+    def report(self) -> str:
+        """按总耗时排序的文本表格"""
+        lines = [
+            f"{'阶段':<28}{'次数':>8}{'总计ms':>12}{'平均ms':>10}"
+            f"{'p50ms':>10}{'p90ms':>10}{'p99ms':>10}{'最大ms':>10}"
+        ]
+        rows = sorted(self.summary().items(), key=lambda item: -item[1]["total_ms"])
+        for key, stats in rows:
+            lines.append(
+                f"{key:<30}{stats['count']:>8}{stats['total_ms']:>12.2f}{stats['mean_ms']:>10.3f}"
+                f"{stats['p50_ms']:>10.3f}{stats['p90_ms']:>10.3f}"
+                f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace 格式(chrome://tracing 或 Perfetto 打开)"""
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start / 1000,
+                    "dur": duration / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+                for category, name, start, duration, pid, tid, args in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path: str):
+        """写出 Chrome trace JSON 文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+
+
+# 未指定统计时使用, 所有 span 都是空计时
+NULL_PROFILER = Profiler(enabled=False)
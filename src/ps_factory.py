@@ -0,0 +1,19 @@
+"""图像处理引擎工厂"""
+
+
+class PSFactory:
+    """Photoshop 工厂类，用于创建指定类型的图像处理引擎实例（支持扩展）"""
+
+    @staticmethod
+    def create_engine(engine_type: str, *args, **kwargs):
+        # 按需导入, 离线引擎所在的机器无需安装 Photoshop 相关依赖
+        if engine_type.lower() == "photoshop":
+            from .ps_core import Photoshop
+
+            return Photoshop(*args, **kwargs)
+        elif engine_type.lower() == "native":
+            from .native_core import NativePhotoshop
+
+            return NativePhotoshop(*args, **kwargs)
+        else:
+            raise ValueError(f"不支持的图像处理引擎: {engine_type}")
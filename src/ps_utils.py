@@ -15,6 +15,8 @@ from photoshop.api import (
     TiffSaveOptions,
 )
 
+from .export_profile import ExportProfile
+
 
 class ExportOptionsFactory:
     """Factory class for creating export options based on file format"""
@@ -52,6 +54,22 @@ class ExportOptionsFactory:
         else:
             raise ValueError(f"Unsupported file format: {file_format}")
 
+    @staticmethod
+    def create_profile_options(profile: ExportProfile) -> Any:
+        """
+        Create export options described by an export profile
+
+        Args:
+            profile (ExportProfile): Format and quality of the output
+
+        Returns:
+            Export options object with the profile's quality applied
+        """
+        options = ExportOptionsFactory.create_export_options(profile.file_format)
+        if profile.photoshop_quality is not None and profile.file_format in ("jpg", "jpeg"):
+            options.quality = profile.photoshop_quality
+        return options
+
 
 class ColorFactory:
     """Factory class for creating color objects"""
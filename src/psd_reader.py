@@ -0,0 +1,660 @@
+"""PSD/PSB 文件解析器，供离线渲染引擎使用"""
+
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# 图层分组标记 (lsct / lsdk)
+SECTION_OPEN_FOLDER = 1
+SECTION_CLOSED_FOLDER = 2
+SECTION_DIVIDER = 3
+
+# PSB 文件中长度字段为 8 字节的附加图层信息
+PSB_LONG_KEYS = {
+    b"LMsk",
+    b"Lr16",
+    b"Lr32",
+    b"Layr",
+    b"Mt16",
+    b"Mt32",
+    b"Mtrn",
+    b"Alph",
+    b"FMsk",
+    b"lnk2",
+    b"FEid",
+    b"FXid",
+    b"PxSD",
+}
+
+BLEND_MODES = {
+    b"pass": "pass_through",
+    b"norm": "normal",
+    b"mul ": "multiply",
+    b"scrn": "screen",
+    b"over": "overlay",
+}
+
+
+class PsdLayer:
+    """PSD 图层节点（图层或图层组）"""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        left: int = 0,
+        top: int = 0,
+        pixels: np.ndarray | None = None,
+        visible: bool = True,
+        opacity: int = 255,
+        blend_mode: str = "normal",
+        text: dict | None = None,
+        fill_opacity: int = 255,
+        source: "LayerChannels | None" = None,
+    ):
+        """
+        :param name: 图层名
+        :param kind: 图层类型, "group" / "pixel" / "text"
+        :param left: 像素左上角横坐标
+        :param top: 像素左上角纵坐标
+        :param pixels: RGBA 像素 (height, width, 4) uint8
+        :param visible: 是否可见
+        :param opacity: 不透明度 0-255
+        :param blend_mode: 混合模式
+        :param text: 文本属性 {"contents", "size", "color"}
+        :param fill_opacity: 填充不透明度 0-255
+        :param source: 没有解码的通道数据, pixels 为 None 时按需从中读取像素
+        """
+        self.name = name
+        self.kind = kind
+        self.left = left
+        self.top = top
+        self.pixels = pixels
+        self.visible = visible
+        self.opacity = opacity
+        self.blend_mode = blend_mode
+        self.text = text
+        self.fill_opacity = fill_opacity
+        self.source = source
+        self.parent: PsdLayer | None = None
+        self.children: list[PsdLayer] = []  # 由下到上排列
+
+    def __repr__(self) -> str:
+        return f"PsdLayer({self.kind}, {self.name!r})"
+
+    @property
+    def is_group(self) -> bool:
+        return self.kind == "group"
+
+    @property
+    def layerSets(self) -> list["PsdLayer"]:
+        """子图层组, 与 Photoshop 对象模型命名保持一致"""
+        return [layer for layer in self.children if layer.is_group]
+
+    @property
+    def artLayers(self) -> list["PsdLayer"]:
+        """子图层, 与 Photoshop 对象模型命名保持一致"""
+        return [layer for layer in self.children if not layer.is_group]
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """像素的 (height, width), 不需要解码通道数据"""
+        if self.pixels is not None:
+            return self.pixels.shape[:2]
+        if self.source is not None:
+            return self.source.height, self.source.width
+        return 0, 0
+
+    def load_pixels(self) -> np.ndarray | None:
+        """解码没有读取的像素, 修改像素之前调用"""
+        if self.pixels is None and self.source is not None:
+            self.pixels = self.source.decode()
+        return self.pixels
+
+    def read_rows(self, top: int, bottom: int) -> np.ndarray:
+        """
+        读取像素的一部分行, 没有解码的图层在这里第一次解码
+        :param top: 图层坐标中的起始行
+        :param bottom: 图层坐标中的结束行(不含)
+        :return: (bottom - top, width, 4) uint8
+        """
+        if self.pixels is not None:
+            return self.pixels[top:bottom]
+        return self.source.read_rows(top, bottom)
+
+    @property
+    def bounds(self) -> tuple[int, int, int, int]:
+        """图层边界 (left, top, right, bottom)，图层组为所有子图层的并集"""
+        if not self.is_group:
+            height, width = self.shape
+            if not height or not width:
+                return (self.left, self.top, self.left, self.top)
+            return (self.left, self.top, self.left + width, self.top + height)
+        child_bounds = [
+            child.bounds for child in self.descendants() if not child.is_group
+        ]
+        child_bounds = [b for b in child_bounds if b[2] > b[0] and b[3] > b[1]]
+        if not child_bounds:
+            return (0, 0, 0, 0)
+        return (
+            min(b[0] for b in child_bounds),
+            min(b[1] for b in child_bounds),
+            max(b[2] for b in child_bounds),
+            max(b[3] for b in child_bounds),
+        )
+
+    def descendants(self):
+        """深度优先遍历所有子孙图层"""
+        for child in self.children:
+            yield child
+            if child.is_group:
+                yield from child.descendants()
+
+
+class PsdDocument(PsdLayer):
+    """PSD 文档，作为图层树的根节点"""
+
+    def __init__(self, name: str, path: str, width: int, height: int, version: int):
+        super().__init__(name, "group")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.version = version
+        # 延迟解码时内存映射的文件和已解码像素的缓存
+        self.mapping: mmap.mmap | None = None
+        self.pixel_cache: PixelCache | None = None
+
+    def __repr__(self) -> str:
+        return f"PsdDocument({self.name!r}, {self.width}x{self.height})"
+
+    def close(self):
+        """释放图层像素数据和内存映射的文件"""
+        for layer in self.descendants():
+            layer.pixels = None
+            layer.source = None
+        self.children = []
+        if self.pixel_cache is not None:
+            self.pixel_cache.clear()
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+
+class _Reader:
+    """带游标的大端二进制读取器"""
+
+    def __init__(self, data: bytes, is_psb: bool):
+        self.data = data
+        self.pos = 0
+        self.is_psb = is_psb
+
+    def read(self, size: int) -> bytes:
+        chunk = self.data[self.pos : self.pos + size]
+        if len(chunk) != size:
+            raise ValueError("PSD 文件数据不完整")
+        self.pos += size
+        return chunk
+
+    def unpack(self, fmt: str):
+        size = struct.calcsize(">" + fmt)
+        values = struct.unpack(">" + fmt, self.read(size))
+        return values[0] if len(values) == 1 else values
+
+    def length(self) -> int:
+        """读取 PSD(4字节) / PSB(8字节) 长度字段"""
+        return self.unpack("Q" if self.is_psb else "I")
+
+
+class LayerChannels:
+    """
+    图层通道数据在文件中的位置, 按行解码
+    RAW 和 RLE 通道只解码需要的行; ZIP 通道不能跳转, 从头解压到需要的行, 之前的行解压后立即丢弃
+    有缓存时整个图层解码一次放入缓存, 超过缓存上限的图层每次只解码需要的行
+    """
+
+    def __init__(
+        self,
+        data: bytes | mmap.mmap,
+        is_psb: bool,
+        width: int,
+        height: int,
+        channels: list[tuple[int, int, int]],
+        cache: "PixelCache | None" = None,
+    ):
+        """
+        :param data: 文件内容或内存映射的文件
+        :param is_psb: 是否为 PSB 文件, RLE 行长度为 4 字节
+        :param channels: [(通道 id, 通道数据在文件中的偏移, 长度)], 通道数据以压缩方式字段开头
+        :param cache: 已解码像素的缓存
+        """
+        self.data = data
+        self.is_psb = is_psb
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.cache = cache
+        # {通道 id: RLE 通道每行数据的起止偏移}
+        self._row_offsets: dict[int, np.ndarray] = {}
+
+    @property
+    def nbytes(self) -> int:
+        """解码后像素的大小"""
+        return self.width * self.height * 4
+
+    def decode(self) -> np.ndarray:
+        """解码全部像素 (height, width, 4) uint8, 有缓存时返回缓存中的只读数组"""
+        if self.cache is not None:
+            return self.cache.get(self)
+        return self.decode_rows(0, self.height)
+
+    def read_rows(self, top: int, bottom: int) -> np.ndarray:
+        """
+        读取 [top, bottom) 行, 图层能放入缓存时从缓存的整个图层中取
+        :return: (bottom - top, width, 4) uint8
+        """
+        if self.cache is not None and self.nbytes <= self.cache.max_bytes:
+            return self.cache.get(self)[max(top, 0) : bottom]
+        return self.decode_rows(top, bottom)
+
+    def decode_rows(self, top: int, bottom: int) -> np.ndarray:
+        """
+        不经过缓存解码 [top, bottom) 行
+        :return: (bottom - top, width, 4) uint8
+        """
+        top, bottom = max(top, 0), min(bottom, self.height)
+        planes = {
+            channel_id: self._read_plane(channel_id, offset, length, top, bottom)
+            for channel_id, offset, length in self.channels
+        }
+        return _planes_to_rgba(planes, self.width, max(bottom - top, 0))
+
+    def _read_plane(
+        self, channel_id: int, offset: int, length: int, top: int, bottom: int
+    ) -> np.ndarray:
+        """解码单个通道的 [top, bottom) 行"""
+        width, rows = self.width, max(bottom - top, 0)
+        compression = struct.unpack_from(">H", self.data, offset)[0]
+        start, end = offset + 2, offset + length
+        if compression == 0:
+            raw = self.data[start + top * width : start + bottom * width]
+        elif compression == 1:
+            offsets = self._rle_offsets(channel_id, start)
+            raw = b"".join(
+                _unpack_bits(self.data[offsets[row] : offsets[row + 1]], width)
+                for row in range(top, bottom)
+            )
+        elif compression in (2, 3):
+            raw = _inflate_rows(self.data[start:end], width, top, bottom)
+        else:
+            raise ValueError(f"不支持的通道压缩方式: {compression}")
+
+        if len(raw) < width * rows:
+            raise ValueError("PSD 文件数据不完整")
+        plane = np.frombuffer(raw, dtype=np.uint8, count=width * rows)
+        plane = plane.reshape(rows, width)
+        if compression == 3:
+            # ZIP with prediction: 按行做差分还原
+            plane = np.cumsum(plane, axis=1, dtype=np.uint8)
+        return plane
+
+    def _rle_offsets(self, channel_id: int, start: int) -> np.ndarray:
+        """读取 RLE 通道开头的每行长度, 换算为每行数据的起止偏移"""
+        offsets = self._row_offsets.get(channel_id)
+        if offsets is None:
+            row_format = np.dtype(">u4" if self.is_psb else ">u2")
+            # 复制出行长度表, 不引用内存映射的缓冲区
+            table = self.data[start : start + row_format.itemsize * self.height]
+            counts = np.frombuffer(table, row_format, count=self.height)
+            offsets = np.empty(self.height + 1, np.int64)
+            offsets[0] = start + counts.nbytes
+            np.cumsum(counts, out=offsets[1:])
+            offsets[1:] += offsets[0]
+            self._row_offsets[channel_id] = offsets
+        return offsets
+
+
+class PixelCache:
+    """
+    已解码图层像素的 LRU 缓存, 总大小不超过 max_bytes, 淘汰的图层下次使用时重新解码
+    缓存的数组只读, 可以在多个线程中同时使用
+    """
+
+    def __init__(self, max_bytes: int = 512 << 20):
+        """
+        :param max_bytes: 缓存的像素总大小上限
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[LayerChannels, np.ndarray] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, channels: LayerChannels) -> bool:
+        return channels in self._entries
+
+    def get(self, channels: LayerChannels) -> np.ndarray:
+        """
+        返回图层解码后的像素, 没有缓存时解码并缓存
+        :return: (height, width, 4) uint8, 只读
+        """
+        with self._lock:
+            pixels = self._entries.get(channels)
+            if pixels is not None:
+                self._entries.move_to_end(channels)
+                self.hits += 1
+                return pixels
+            self.misses += 1
+        # 解码不持有锁, 其他线程可以同时解码别的图层
+        pixels = channels.decode_rows(0, channels.height)
+        pixels.flags.writeable = False
+        if pixels.nbytes > self.max_bytes:
+            return pixels
+        with self._lock:
+            if channels not in self._entries:
+                self._entries[channels] = pixels
+                self.total_bytes += pixels.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+        return pixels
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+def _inflate_rows(data: bytes, width: int, top: int, bottom: int) -> bytes:
+    """解压 ZIP 通道的 [top, bottom) 行, 之前的行分段解压后丢弃"""
+    inflater = zlib.decompressobj()
+    skip = top * width
+    while skip > 0:
+        chunk = inflater.decompress(data, min(skip, 1 << 20))
+        if not chunk:
+            break
+        data = inflater.unconsumed_tail
+        skip -= len(chunk)
+    return inflater.decompress(data, (bottom - top) * width)
+
+
+def read_psd(path: str, lazy: bool = False, cache_bytes: int = 512 << 20) -> PsdDocument:
+    """
+    读取 PSD/PSB 文件并构建图层树, 文件通过内存映射读取
+    :param path: 文件路径
+    :param lazy: 为 True 时打开时只索引图层记录和通道数据的位置, 图层像素在第一次合成时解码,
+        文件保持映射直到关闭文档
+    :param cache_bytes: 延迟解码时已解码像素缓存的大小上限
+    :return: PsdDocument 文档对象
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise ValueError(f"不是有效的PSD/PSB文件: {path}")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    cache = PixelCache(cache_bytes) if lazy else None
+    try:
+        document = _read_document(path, data, cache)
+    except Exception:
+        data.close()
+        raise
+    if lazy:
+        document.mapping, document.pixel_cache = data, cache
+    else:
+        data.close()
+    return document
+
+
+def _read_document(path: str, data: mmap.mmap, cache: PixelCache | None) -> PsdDocument:
+    """
+    解析文件头和图层信息
+    :param cache: 已解码像素的缓存, 为 None 时直接解码所有图层像素
+    """
+    signature, version = struct.unpack(">4sH", data[:6])
+    if signature != b"8BPS" or version not in (1, 2):
+        raise ValueError(f"不是有效的PSD/PSB文件: {path}")
+    reader = _Reader(data, is_psb=version == 2)
+    reader.pos = 12
+    channels, height, width, depth, color_mode = reader.unpack("HIIHH")
+    if depth != 8 or color_mode != 3:
+        raise ValueError(f"仅支持8位RGB文档, 当前 depth={depth}, mode={color_mode}")
+
+    # 跳过颜色模式数据和图像资源
+    for _ in range(2):
+        skip = reader.unpack("I")
+        reader.pos += skip
+
+    document = PsdDocument(
+        os.path.basename(path), path, width=width, height=height, version=version
+    )
+
+    layer_and_mask_end = reader.length()
+    layer_and_mask_end += reader.pos
+    records = []
+    if layer_and_mask_end > reader.pos:
+        layer_info_length = reader.length()
+        if layer_info_length:
+            records = _read_layer_info(reader, cache)
+    reader.pos = layer_and_mask_end
+
+    if records:
+        _build_tree(document, records)
+    else:
+        # 没有图层的文档, 使用合并图像作为背景图层
+        pixels = _read_merged_image(reader, channels, width, height)
+        document.children.append(PsdLayer("背景", "pixel", pixels=pixels))
+        document.children[0].parent = document
+    return document
+
+
+def _read_layer_info(reader: _Reader, cache: PixelCache | None = None) -> list[dict]:
+    """
+    读取图层记录及其通道数据
+    :param cache: 已解码像素的缓存, 指定时只记录通道数据的位置, 不解码
+    """
+    layer_count = abs(reader.unpack("h"))
+    records = []
+    for _ in range(layer_count):
+        records.append(_read_layer_record(reader))
+
+    for record in records:
+        top, left, bottom, right = record["rect"]
+        width, height = right - left, bottom - top
+        channels = []
+        for channel_id, channel_length in record["channels"]:
+            if channel_id >= -1 and channel_length >= 2:
+                channels.append((channel_id, reader.pos, channel_length))
+            reader.pos += channel_length
+        if reader.pos > len(reader.data):
+            raise ValueError("PSD 文件数据不完整")
+        if width > 0 and height > 0:
+            source = LayerChannels(
+                reader.data, reader.is_psb, width, height, channels, cache
+            )
+            if cache is not None:
+                record["source"] = source
+            else:
+                record["pixels"] = source.decode()
+    return records
+
+
+def _read_layer_record(reader: _Reader) -> dict:
+    """读取单个图层记录"""
+    top, left, bottom, right = reader.unpack("iiii")
+    channel_count = reader.unpack("H")
+    channels = [(reader.unpack("h"), reader.length()) for _ in range(channel_count)]
+    _, blend_key, opacity, clipping, flags, _ = reader.unpack("4s4sBBBB")
+    extra_end = reader.unpack("I")
+    extra_end += reader.pos
+
+    for _ in range(2):
+        # 图层蒙版和混合范围
+        skip = reader.unpack("I")
+        reader.pos += skip
+    name_length = reader.unpack("B")
+    raw_name = reader.read(name_length)
+    reader.pos += (4 - (name_length + 1) % 4) % 4
+
+    record = {
+        "rect": (top, left, bottom, right),
+        "channels": channels,
+        "blend_mode": BLEND_MODES.get(blend_key, "normal"),
+        "opacity": opacity,
+        "fill_opacity": 255,
+        "clipping": clipping,
+        "visible": not flags & 0x02,
+        "name": raw_name.decode("gbk", errors="replace"),
+        "section": 0,
+        "text": None,
+        "pixels": None,
+        "source": None,
+    }
+
+    while reader.pos + 12 <= extra_end:
+        _, key = reader.unpack("4s4s")
+        if reader.is_psb and key in PSB_LONG_KEYS:
+            length = reader.unpack("Q")
+        else:
+            length = reader.unpack("I")
+        block = reader.read(length)
+        if key == b"luni":
+            count = struct.unpack(">I", block[:4])[0]
+            record["name"] = block[4 : 4 + count * 2].decode("utf-16-be")
+        elif key in (b"lsct", b"lsdk"):
+            record["section"] = struct.unpack(">I", block[:4])[0]
+            if len(block) >= 12:
+                record["blend_mode"] = BLEND_MODES.get(block[8:12], "normal")
+        elif key == b"iOpa":
+            record["fill_opacity"] = block[0]
+        elif key == b"TySh":
+            record["text"] = _parse_text_engine_data(block)
+    reader.pos = extra_end
+    return record
+
+
+def _unpack_bits(data: bytes, width: int) -> bytes:
+    """PackBits 解压单行数据"""
+    result = bytearray()
+    i = 0
+    while i < len(data):
+        header = data[i]
+        i += 1
+        if header < 128:
+            result += data[i : i + header + 1]
+            i += header + 1
+        elif header > 128:
+            result += bytes([data[i]]) * (257 - header)
+            i += 1
+    return bytes(result[:width]).ljust(width, b"\x00")
+
+
+def _planes_to_rgba(planes: dict, width: int, height: int) -> np.ndarray:
+    """将通道平面组合为 RGBA 像素"""
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    for index, channel_id in enumerate((0, 1, 2, -1)):
+        plane = planes.get(channel_id)
+        pixels[..., index] = 255 if plane is None else plane
+    return pixels
+
+
+def _read_merged_image(
+    reader: _Reader, channels: int, width: int, height: int
+) -> np.ndarray:
+    """读取文档末尾的合并图像数据"""
+    compression = reader.unpack("H")
+    planes = {}
+    if compression == 1:
+        row_format = "I" if reader.is_psb else "H"
+        counts = [reader.unpack(row_format) for _ in range(channels * height)]
+        for channel in range(channels):
+            rows = counts[channel * height : (channel + 1) * height]
+            raw = b"".join(_unpack_bits(reader.read(count), width) for count in rows)
+            planes[channel] = np.frombuffer(raw, dtype=np.uint8).reshape(height, width)
+    elif compression == 0:
+        for channel in range(channels):
+            raw = reader.read(width * height)
+            planes[channel] = np.frombuffer(raw, dtype=np.uint8).reshape(height, width)
+    else:
+        raise ValueError(f"不支持的合并图像压缩方式: {compression}")
+    if 3 in planes:
+        planes[-1] = planes.pop(3)
+    return _planes_to_rgba(planes, width, height)
+
+
+def _build_tree(document: PsdDocument, records: list[dict]):
+    """根据分组标记把图层记录(由下到上)组装为图层树"""
+    stack = [document]
+    for record in records:
+        section = record["section"]
+        if section == SECTION_DIVIDER:
+            group = PsdLayer("", "group")
+            group.parent = stack[-1]
+            stack.append(group)
+            continue
+
+        if section in (SECTION_OPEN_FOLDER, SECTION_CLOSED_FOLDER):
+            layer = stack.pop() if len(stack) > 1 else PsdLayer("", "group")
+            layer.name = record["name"]
+        else:
+            top, left = record["rect"][:2]
+            kind = "text" if record["text"] is not None else "pixel"
+            layer = PsdLayer(
+                record["name"],
+                kind,
+                left=left,
+                top=top,
+                pixels=record["pixels"],
+                source=record["source"],
+            )
+            layer.text = record["text"]
+        layer.visible = record["visible"]
+        layer.opacity = record["opacity"]
+        layer.fill_opacity = record["fill_opacity"]
+        layer.blend_mode = record["blend_mode"]
+        layer.parent = stack[-1]
+        stack[-1].children.append(layer)
+
+
+def _parse_text_engine_data(block: bytes) -> dict:
+    """从 TySh 图层信息中提取文本内容、字号和颜色"""
+    text = {"contents": "", "size": None, "color": None}
+    # TySh 头部包含 6 个 double 的变换矩阵, yy 分量即纵向缩放
+    transform = struct.unpack(">6d", block[2:50]) if len(block) >= 50 else None
+
+    start = block.find(b"/Text (")
+    if start != -1:
+        raw = bytearray()
+        i = start + len(b"/Text (")
+        while i < len(block) and block[i : i + 1] != b")":
+            if block[i : i + 1] == b"\\":
+                i += 1
+            raw += block[i : i + 1]
+            i += 1
+        encoded = bytes(raw)
+        if encoded.startswith(b"\xfe\xff"):
+            contents = encoded[2:].decode("utf-16-be", errors="replace")
+        else:
+            contents = encoded.decode("latin-1")
+        text["contents"] = contents.rstrip("\r").replace("\r", "\n")
+
+    size_match = re.search(rb"/FontSize\s+([\d.]+)", block)
+    if size_match:
+        size = float(size_match.group(1))
+        if transform:
+            size *= transform[3]
+        text["size"] = round(size, 2)
+
+    color_match = re.search(
+        rb"/FillColor\s*<<\s*/Type\s+1\s*/Values\s*\[\s*"
+        rb"([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*\]",
+        block,
+    )
+    if color_match:
+        r, g, b = (round(float(v) * 255) for v in color_match.groups()[1:])
+        text["color"] = f"#{r:02x}{g:02x}{b:02x}"
+    return text
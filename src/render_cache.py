@@ -0,0 +1,204 @@
+"""基于内容寻址的导出结果缓存, 跨运行跳过未变化任务的渲染和导出"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from loguru import logger
+
+from .layer_state import LayerState
+
+# 缓存键格式版本, 渲染逻辑变化导致旧缓存失效时递增
+CACHE_VERSION = 2
+
+
+def _normalize_number(value):
+    """整数值的浮点数统一为整数, 避免 35 与 35.0 产生不同的键"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize_number(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize_number(v) for k, v in value.items()}
+    return value
+
+
+def file_sha256(path: str) -> str:
+    """计算文件的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# {(路径, 大小, 修改时间): sha256}
+_file_hashes: dict[tuple, str] = {}
+
+
+def file_hash(path: str) -> str:
+    """计算文件的 sha256, 按 (路径, 大小, 修改时间) 记忆"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        _file_hashes[memo_key] = file_sha256(path)
+    return _file_hashes[memo_key]
+
+
+def link_or_copy(src_path: str, dest_path: str, use_hardlink: bool = True):
+    """
+    把 src_path 放到 dest_path: 优先硬链接, 失败(跨磁盘、文件系统不支持)时复制
+    dest_path 已存在时先删除, 不会改写与它链接的其他文件
+    """
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    try:
+        if not use_hardlink:
+            raise OSError("hardlink disabled")
+        os.link(src_path, dest_path)
+    except OSError:
+        shutil.copyfile(src_path, dest_path)
+
+
+def normalize_input_data(input_data: dict) -> str:
+    """
+    把 input_data 规范化为稳定的 JSON 字符串
+    :param input_data: 图层属性数据
+    :return: 按键排序的 JSON
+    """
+    normalized = {
+        layer_name: _normalize_number(LayerState.coerce(layer_info).to_dict())
+        for layer_name, layer_info in input_data.items()
+    }
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+def content_key(
+    psd_file_path: str,
+    input_data: dict,
+    file_format: str,
+    export_options: dict | None = None,
+) -> str:
+    """
+    导出文件的内容键, 模板、图层数据、导出格式和导出参数都相同时导出文件相同,
+    用作渲染缓存键和批处理日志中完成记录的键
+    :param psd_file_path: 模板文件路径
+    :param input_data: 图层属性数据
+    :param file_format: 导出文件格式
+    :param export_options: 影响导出结果的其他参数
+    :return: sha256
+    """
+    payload = json.dumps(
+        [
+            CACHE_VERSION,
+            file_hash(psd_file_path),
+            normalize_input_data(input_data),
+            file_format.lower(),
+            export_options or {},
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    导出文件缓存: 键由 PSD 文件哈希、规范化的 input_data、导出格式和导出参数组成
+    缓存文件按修改时间做 LRU 淘汰, 总大小不超过 max_bytes
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 << 30, use_hardlink: bool = True):
+        """
+        :param cache_dir: 缓存目录
+        :param max_bytes: 缓存总大小上限
+        :param use_hardlink: 命中时优先用硬链接生成导出文件, 失败时复制
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.use_hardlink = use_hardlink
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    def make_key(
+        self,
+        psd_file_path: str,
+        input_data: dict,
+        file_format: str,
+        export_options: dict | None = None,
+    ) -> str:
+        """
+        生成缓存键
+        :param psd_file_path: 模板文件路径
+        :param input_data: 图层属性数据
+        :param file_format: 导出文件格式
+        :param export_options: 影响导出结果的其他参数
+        :return: 缓存键
+        """
+        return content_key(psd_file_path, input_data, file_format, export_options)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def materialize(self, key: str, dest_path: str) -> bool:
+        """
+        缓存命中时把缓存文件放到导出路径
+        :return: 是否命中
+        """
+        cached_path = self._path(key)
+        if not os.path.isfile(cached_path):
+            return False
+        link_or_copy(cached_path, dest_path, self.use_hardlink)
+        # 更新修改时间, 作为 LRU 的最近使用时间
+        os.utime(cached_path)
+        return True
+
+    def put(self, key: str, src_path: str):
+        """把导出文件写入缓存"""
+        cached_path = self._path(key)
+        if os.path.isfile(cached_path):
+            return
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path), suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+        except OSError as e:
+            logger.warning(f"写入渲染缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.total_bytes += os.path.getsize(cached_path)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰缓存, 直到总大小不超过上限"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self.total_bytes = total
+        logger.info(f"渲染缓存淘汰完成, 当前大小 {total} 字节")
+
+    def _entries(self):
+        """遍历缓存文件 (路径, 大小, 修改时间)"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,300 @@
+"""常驻渲染服务: 文档保持打开, 通过本地 HTTP 接口接收任务"""
+
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from .ps_factory import PSFactory
+from .task_planner import plan_task_order
+
+# 通知工作线程退出的任务
+_STOP = object()
+
+
+class RenderJob:
+    """一个渲染任务, 提交后由工作线程填写结果"""
+
+    __slots__ = ("export_name", "input_data", "submitted", "done", "result")
+
+    def __init__(self, export_name: str, input_data: dict):
+        self.export_name = export_name
+        self.input_data = input_data
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Dict[str, Any] = {}
+
+    def wait(self, timeout: float | None = None) -> Dict[str, Any]:
+        """
+        等待任务完成
+        :return: {"export_name", "path", "queue_ms", "render_ms"} 或 {"export_name", "error"}
+        """
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"任务 {self.export_name} 等待超时")
+        return self.result
+
+
+class RenderService:
+    """
+    常驻渲染服务: 一个工作线程持有打开的文档、图层索引和图层状态, 依次执行队列中的任务
+    工作线程每次取出队列中所有等待的任务(最多 batch_size 个), 排序后批量执行
+    """
+
+    def __init__(
+        self,
+        engine_type: str = "native",
+        engine_args: tuple = (),
+        engine_kwargs: dict | None = None,
+        batch_size: int = 64,
+        batch_wait: float = 0.002,
+        plan_order: bool = True,
+    ):
+        """
+        :param engine_type: 图像处理引擎, photoshop 或 native
+        :param engine_args: 创建引擎的位置参数
+        :param engine_kwargs: 创建引擎的关键字参数
+        :param batch_size: 每批最多执行的任务数量
+        :param batch_wait: 取到第一个任务后等待更多任务的时间(秒)
+        :param plan_order: 是否对每批任务排序, 减少相邻任务之间的图层修改
+        """
+        self.engine_type = engine_type
+        self.engine_args = engine_args
+        self.engine_kwargs = engine_kwargs or {}
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.plan_order = plan_order
+        self.jobs: queue.Queue = queue.Queue()
+        self.ps = None
+        self.stats = {"rendered": 0, "failed": 0, "batches": 0}
+        self._ready = threading.Event()
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="render-service", daemon=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self) -> "RenderService":
+        """启动工作线程, 等待文档打开完成"""
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise RuntimeError(f"渲染服务启动失败: {self._error}") from self._error
+        return self
+
+    def close(self, timeout: float | None = None):
+        """执行完已提交的任务后恢复图层并退出工作线程"""
+        if self._thread.is_alive():
+            self.jobs.put(_STOP)
+            self._thread.join(timeout)
+
+    def submit(self, export_name: str, input_data: dict) -> RenderJob:
+        """提交任务, 立即返回"""
+        if not self._thread.is_alive():
+            raise RuntimeError("渲染服务未运行")
+        job = RenderJob(export_name, input_data)
+        self.jobs.put(job)
+        return job
+
+    def render(self, export_name: str, input_data: dict, timeout: float | None = None) -> dict:
+        """提交任务并等待结果"""
+        return self.submit(export_name, input_data).wait(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        """服务状态"""
+        return {
+            "engine": self.engine_type,
+            "psd_file_path": getattr(self.ps, "psd_file_path", None),
+            "queued": self.jobs.qsize(),
+            **self.stats,
+        }
+
+    def _next_batch(self) -> List[RenderJob] | None:
+        """阻塞取出一批任务, 收到退出通知时返回 None"""
+        job = self.jobs.get()
+        if job is _STOP:
+            return None
+        batch = [job]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                remaining = deadline - time.perf_counter()
+                job = self.jobs.get(timeout=remaining) if remaining > 0 else self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                # 放回退出通知, 执行完本批任务后退出
+                self.jobs.put(_STOP)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        """工作线程: 打开文档后循环执行任务"""
+        try:
+            if self.engine_type.lower() == "photoshop":
+                # COM 对象只能在初始化过 COM 的线程中使用
+                import comtypes
+
+                comtypes.CoInitialize()
+            self.ps = PSFactory.create_engine(
+                self.engine_type, *self.engine_args, **self.engine_kwargs
+            )
+            self.ps.__enter__()
+        except BaseException as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        logger.info(f"渲染服务已启动: {self.ps.psd_file_path}")
+
+        try:
+            while (batch := self._next_batch()) is not None:
+                self._render_batch(batch)
+        finally:
+            self.ps.__exit__(None, None, None)
+            logger.info("渲染服务已退出, 图层已恢复到初始状态")
+
+    def _render_batch(self, batch: List[RenderJob]):
+        """执行一批任务"""
+        if self.plan_order and len(batch) > 1:
+            tasks, _ = plan_task_order([{"内容": job.input_data, "job": job} for job in batch])
+            batch = [task["job"] for task in tasks]
+        self.stats["batches"] += 1
+        # 异步导出的任务在本批所有任务修改完后再等待写出, 编码和后面任务的图层修改同时进行
+        exporting = []
+        for job in batch:
+            start = time.perf_counter()
+            try:
+                ticket = self.ps.core(job.export_name, job.input_data)
+                job.result = {
+                    "export_name": job.export_name,
+                    "path": self.ps._export_path(job.export_name),
+                    "queue_ms": round((start - job.submitted) * 1000, 2),
+                    "render_ms": round((time.perf_counter() - start) * 1000, 2),
+                }
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            if ticket is None:
+                self._finish(job)
+            else:
+                exporting.append((job, ticket))
+        for job, ticket in exporting:
+            try:
+                ticket.wait()
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            self._finish(job)
+        if exporting:
+            # 失败的文件已经返回给各自的任务, 退出时不再重复报告
+            self.ps._flush_export_queue()
+
+    def _finish(self, job: RenderJob):
+        self.stats["rendered"] += 1
+        job.done.set()
+
+    def _fail(self, job: RenderJob, error: Exception):
+        logger.error(f"任务 {job.export_name} 渲染失败: {error}")
+        job.result = {"export_name": job.export_name, "error": str(error)}
+        self.stats["failed"] += 1
+        job.done.set()
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP 接口
+    POST /render  {"export_name", "input_data"} 或 {"jobs": [...]}, 返回 {"results": [...]}
+    GET  /status  返回服务状态
+    """
+
+    service: RenderService
+    timeout_seconds: float | None = None
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/status":
+            self._send_json(200, self.service.status())
+        else:
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/render":
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            specs = payload["jobs"] if "jobs" in payload else [payload]
+            jobs = [self.service.submit(spec["export_name"], spec["input_data"]) for spec in specs]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"请求格式错误: {e}"})
+            return
+        except RuntimeError as e:
+            self._send_json(503, {"error": str(e)})
+            return
+        try:
+            results = [job.wait(self.timeout_seconds) for job in jobs]
+        except TimeoutError as e:
+            self._send_json(504, {"error": str(e)})
+            return
+        self._send_json(200, {"results": results})
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def create_server(
+    service: RenderService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    timeout: float | None = None,
+) -> ThreadingHTTPServer:
+    """
+    创建绑定到渲染服务的 HTTP 服务器, 调用 serve_forever 开始处理请求
+    :param service: 已启动的渲染服务
+    :param host: 监听地址
+    :param port: 监听端口, 0 表示自动分配
+    :param timeout: 单个请求等待渲染结果的最长时间(秒)
+    """
+    handler = type(
+        "BoundRenderRequestHandler",
+        (RenderRequestHandler,),
+        {"service": service, "timeout_seconds": timeout},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    engine_type: str = "native",
+    engine_args: tuple = (),
+    engine_kwargs: dict | None = None,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+):
+    """启动渲染服务并处理请求, 直到 Ctrl+C"""
+    with RenderService(engine_type, engine_args, engine_kwargs) as service:
+        server = create_server(service, host, port)
+        logger.info(f"渲染服务监听 http://{host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
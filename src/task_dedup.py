@@ -0,0 +1,67 @@
+"""任务去重: 内容相同、只有导出文件名不同的任务只渲染一次, 其他导出文件用硬链接或复制生成"""
+
+import hashlib
+import json
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from .render_cache import normalize_input_data
+
+# 渲染任务中记录同内容任务名的键
+DUPLICATES_KEY = "副本"
+
+
+def task_content_hash(
+    task: Dict[str, Any], content_key: str = "内容", template_key: str = "模板"
+) -> str:
+    """
+    任务内容的规范化哈希: 模板和规范化后的 input_data, 与导出文件名无关
+    :param task: selected_skus 返回的任务
+    :param content_key: 任务中 input_data 所在的键
+    :param template_key: 任务中模板所在的键
+    """
+    payload = json.dumps(
+        [task.get(template_key) or "", normalize_input_data(task[content_key])],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def dedupe_tasks(
+    tasks: List[Dict[str, Any]], content_key: str = "内容", template_key: str = "模板"
+) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    按内容哈希分组, 每组保留第一个任务渲染, 其余任务名记录在渲染任务的 "副本" 键中
+    :param tasks: selected_skus 返回的任务列表
+    :param content_key: 任务中 input_data 所在的键
+    :param template_key: 任务中模板所在的键, 模板不同的任务不合并
+    :return: (需要渲染的任务列表, {"task_count", "render_count", "renders_saved"})
+    """
+    unique: Dict[str, Dict[str, Any]] = {}
+    for task in tasks:
+        key = task_content_hash(task, content_key, template_key)
+        first = unique.get(key)
+        if first is None:
+            unique[key] = {**task, DUPLICATES_KEY: []}
+        else:
+            first[DUPLICATES_KEY].append(task["任务名"])
+    unique_tasks = list(unique.values())
+    for task in unique_tasks:
+        if not task[DUPLICATES_KEY]:
+            del task[DUPLICATES_KEY]
+    report = {
+        "task_count": len(tasks),
+        "render_count": len(unique_tasks),
+        "renders_saved": len(tasks) - len(unique_tasks),
+    }
+    logger.info(
+        f"任务去重完成: {len(tasks)} 个任务, 需要渲染 {len(unique_tasks)} 个, "
+        f"节省 {report['renders_saved']} 次渲染"
+    )
+    return unique_tasks, report
+
+
+def duplicate_names(task: Dict[str, Any], suffix: str = "") -> List[str]:
+    """渲染任务对应的同内容任务的导出文件名"""
+    return [name + suffix for name in task.get(DUPLICATES_KEY, [])]
@@ -0,0 +1,297 @@
+"""直接读取 .xlsx/.xlsm 压缩包中的表格、表头和命名单元格, 不依赖运行中的 Excel"""
+
+import posixpath
+import re
+import zipfile
+from typing import Any, Dict, Iterator, List, Tuple
+from xml.etree.ElementTree import fromstring, iterparse
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_CELL_RE = re.compile(r"^\$?([A-Z]+)\$?(\d+)$")
+# 表格列名中转义的特殊字符, 如换行写为 _x000a_
+_ESCAPE_RE = re.compile(r"_x([0-9A-Fa-f]{4})_")
+
+
+def column_index(letters: str) -> int:
+    """列字母转换为从 1 开始的列号"""
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def parse_cell_ref(ref: str) -> Tuple[int, int]:
+    """
+    解析单元格地址
+    :param ref: 如 B10 或 $B$10
+    :return: (行号, 列号), 均从 1 开始
+    """
+    match = _CELL_RE.match(ref.upper())
+    if match is None:
+        raise ValueError(f"无法解析单元格地址: {ref}")
+    return int(match.group(2)), column_index(match.group(1))
+
+
+def parse_range_ref(ref: str) -> Tuple[int, int, int, int]:
+    """
+    解析区域地址
+    :param ref: 如 B10:Q245
+    :return: (首行, 首列, 末行, 末列)
+    """
+    first, _, last = ref.partition(":")
+    top, left = parse_cell_ref(first)
+    bottom, right = parse_cell_ref(last or first)
+    return top, left, bottom, right
+
+
+def _unescape(text: str) -> str:
+    return _ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)), text)
+
+
+def _text_of(element) -> str:
+    """拼接 <si> / <is> 下的文本, 忽略注音 <rPh>"""
+    parts = []
+    for child in element:
+        if child.tag == NS_MAIN + "t":
+            parts.append(child.text or "")
+        elif child.tag == NS_MAIN + "r":
+            parts.extend(t.text or "" for t in child.iter(NS_MAIN + "t"))
+    return _unescape("".join(parts))
+
+
+class XlsmWorkbook:
+    """
+    只读工作簿: 打开时只解析工作簿结构和共享字符串, 工作表数据按行流式读取
+    单元格的值与 xlwings 一致: 数字为 float, 布尔为 bool, 空单元格、空文本和错误值为 None
+    """
+
+    def __init__(self, file_path: str):
+        """
+        :param file_path: .xlsx / .xlsm 文件路径
+        """
+        self.file_path = file_path
+        self.zip = zipfile.ZipFile(file_path)
+        workbook = fromstring(self.zip.read("xl/workbook.xml"))
+        rels = self._read_rels("xl/workbook.xml")
+
+        # 工作表名称 -> 压缩包内的路径, 保持工作簿中的顺序
+        self.sheets: Dict[str, str] = {}
+        for sheet in workbook.iter(NS_MAIN + "sheet"):
+            self.sheets[sheet.get("name")] = rels[sheet.get(NS_REL + "id")]
+        sheet_names = list(self.sheets)
+
+        view = workbook.find(f"{NS_MAIN}bookViews/{NS_MAIN}workbookView")
+        active_tab = int(view.get("activeTab", 0)) if view is not None else 0
+        self.active_sheet = sheet_names[min(active_tab, len(sheet_names) - 1)]
+
+        # 命名单元格: {(名称, 所属工作表或 None): 引用}
+        self.defined_names: Dict[Tuple[str, str | None], str] = {}
+        for defined in workbook.iter(NS_MAIN + "definedName"):
+            local_id = defined.get("localSheetId")
+            scope = sheet_names[int(local_id)] if local_id is not None else None
+            self.defined_names[(defined.get("name"), scope)] = defined.text or ""
+
+        self.shared_strings: List[str] = []
+        if "xl/sharedStrings.xml" in self.zip.namelist():
+            with self.zip.open("xl/sharedStrings.xml") as f:
+                for _, element in iterparse(f):
+                    if element.tag == NS_MAIN + "si":
+                        self.shared_strings.append(_text_of(element))
+                        element.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def _read_rels(self, part: str) -> Dict[str, str]:
+        """读取部件的关系文件, 返回 {关系 id: 压缩包内路径}"""
+        folder, name = posixpath.split(part)
+        rels_path = posixpath.join(folder, "_rels", name + ".rels")
+        if rels_path not in self.zip.namelist():
+            return {}
+        result = {}
+        for rel in fromstring(self.zip.read(rels_path)).iter(NS_PKG_REL + "Relationship"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            result[rel.get("Id")] = target
+        return result
+
+    def _sheet_part(self, sheet_name: str) -> str:
+        try:
+            return self.sheets[sheet_name]
+        except KeyError:
+            raise KeyError(f"工作表不存在: {sheet_name}") from None
+
+    def tables(self, sheet_name: str) -> List[Dict[str, Any]]:
+        """
+        工作表中的表格
+        :return: [{"name", "ref", "header_rows", "totals_rows", "columns"}]
+        """
+        result = []
+        for part in self._read_rels(self._sheet_part(sheet_name)).values():
+            if not part.startswith("xl/tables/"):
+                continue
+            table = fromstring(self.zip.read(part))
+            result.append(
+                {
+                    "id": int(table.get("id", 0)),
+                    "name": table.get("displayName") or table.get("name"),
+                    "ref": table.get("ref"),
+                    "header_rows": int(table.get("headerRowCount", 1)),
+                    "totals_rows": int(table.get("totalsRowCount", 0)),
+                    "columns": [
+                        _unescape(column.get("name"))
+                        for column in table.iter(NS_MAIN + "tableColumn")
+                    ],
+                }
+            )
+        result.sort(key=lambda table: table["id"])
+        return result
+
+    def table(self, sheet_name: str, table_name: str | int = 0) -> Dict[str, Any]:
+        """按名称或索引取工作表中的表格"""
+        tables = self.tables(sheet_name)
+        if isinstance(table_name, int):
+            return tables[table_name]
+        for table in tables:
+            if table["name"] == table_name:
+                return table
+        raise KeyError(f"表格不存在: {sheet_name}!{table_name}")
+
+    def _cell_value(self, cell):
+        cell_type = cell.get("t", "n")
+        if cell_type == "inlineStr":
+            inline = cell.find(NS_MAIN + "is")
+            return (_text_of(inline) or None) if inline is not None else None
+        value = cell.findtext(NS_MAIN + "v")
+        if value is None or cell_type == "e":
+            return None
+        if cell_type == "s":
+            return self.shared_strings[int(value)] or None
+        if cell_type == "b":
+            return value == "1"
+        if cell_type in ("str", "d"):
+            return value or None
+        return float(value)
+
+    def iter_rows(
+        self, sheet_name: str, min_row: int = 1, max_row: int | None = None
+    ) -> Iterator[Tuple[int, Dict[int, Any]]]:
+        """
+        流式读取工作表, 读完 max_row 后立即停止
+        :return: 迭代 (行号, {列号: 值}), 只包含文件中存在的行
+        """
+        row_tag, cell_tag = NS_MAIN + "row", NS_MAIN + "c"
+        with self.zip.open(self._sheet_part(sheet_name)) as f:
+            next_row = 1
+            for _, element in iterparse(f):
+                if element.tag != row_tag:
+                    continue
+                row_number = int(element.get("r", next_row))
+                next_row = row_number + 1
+                if max_row is not None and row_number > max_row:
+                    break
+                if row_number >= min_row:
+                    cells = {}
+                    next_column = 1
+                    for cell in element.iter(cell_tag):
+                        ref = cell.get("r")
+                        column = parse_cell_ref(ref)[1] if ref else next_column
+                        next_column = column + 1
+                        cells[column] = self._cell_value(cell)
+                    yield row_number, cells
+                element.clear()
+
+    def read_cells(self, sheet_name: str, refs: List[str]) -> Dict[str, Any]:
+        """
+        读取多个单元格的值, 读到其中最大的行号后停止
+        :param refs: 单元格地址列表
+        :return: {地址: 值}, 不存在的单元格为 None
+        """
+        positions = {ref: parse_cell_ref(ref) for ref in refs}
+        if not positions:
+            return {}
+        wanted_rows = {row for row, _ in positions.values()}
+        rows = {}
+        for row_number, cells in self.iter_rows(
+            sheet_name, min(wanted_rows), max(wanted_rows)
+        ):
+            if row_number in wanted_rows:
+                rows[row_number] = cells
+        return {
+            ref: rows.get(row, {}).get(column) for ref, (row, column) in positions.items()
+        }
+
+    def resolve_name(self, name: str, sheet_name: str | None = None) -> Tuple[str, str]:
+        """
+        解析命名单元格, 工作表级名称优先于工作簿级名称
+        :return: (工作表名称, 单元格地址)
+        """
+        ref = self.defined_names.get((name, sheet_name)) or self.defined_names.get((name, None))
+        if not ref:
+            raise ValueError(f"未定义名称: {name}")
+        sheet, _, cell = ref.rpartition("!")
+        sheet = sheet.strip("'").replace("''", "'") or sheet_name
+        return sheet, cell.split(":")[0]
+
+    def read_names(self, names: List[str], sheet_name: str | None = None) -> Dict[str, Any]:
+        """
+        读取多个命名单元格的值
+        :param names: 名称列表
+        :param sheet_name: 名称所属的工作表
+        :return: {名称: 值}
+        """
+        by_sheet: Dict[str, Dict[str, str]] = {}
+        for name in names:
+            sheet, cell = self.resolve_name(name, sheet_name)
+            by_sheet.setdefault(sheet, {})[name] = cell
+        result = {}
+        for sheet, cells in by_sheet.items():
+            values = self.read_cells(sheet, list(cells.values()))
+            result.update({name: values[cell] for name, cell in cells.items()})
+        return result
+
+    def iter_table(
+        self, sheet_name: str, table_name: str | int = 0
+    ) -> Tuple[List[Any], Iterator[List[Any]]]:
+        """
+        流式读取表格
+        :return: (表头, 数据行迭代器), 每行为与表头等长的值列表, 空行全为 None
+        """
+        table = self.table(sheet_name, table_name)
+        top, left, bottom, right = parse_range_ref(table["ref"])
+        width = right - left + 1
+        header_row = top + table["header_rows"] - 1
+        first_row, last_row = header_row + 1, bottom - table["totals_rows"]
+
+        header = list(table["columns"])
+        if table["header_rows"]:
+            for _, cells in self.iter_rows(sheet_name, header_row, header_row):
+                for offset in range(width):
+                    value = cells.get(left + offset)
+                    if value is not None:
+                        header[offset] = value if isinstance(value, str) else str(value)
+
+        def rows() -> Iterator[List[Any]]:
+            expected = first_row
+            for row_number, cells in self.iter_rows(sheet_name, first_row, last_row):
+                # 文件中省略的空行补为全 None, 与 xlwings 读取的区域一致
+                for _ in range(expected, row_number):
+                    yield [None] * width
+                expected = row_number + 1
+                yield [cells.get(column) for column in range(left, right + 1)]
+            for _ in range(expected, last_row + 1):
+                yield [None] * width
+
+        return header, rows()
@@ -1,6 +1,7 @@
 import unittest
 from pprint import pprint
 
+from src.profiler import Profiler
 from src.ps_core import Photoshop
 
 
@@ -11,6 +12,7 @@ class TestBaseModule(unittest.TestCase):
             psd_name="测试",
             export_folder="./test_export",
             colse_ps=True,
+            profiler=Profiler(),
         )
         print("\n")
 
@@ -67,7 +69,8 @@ class TestBaseModule(unittest.TestCase):
                 矩形: {
                     "visible": True,
                     # "move": (0, 0),
-                    "rotate": -180,
+                    # rotate 是相对打开时方向的角度, 0 为转回打开时的方向
+                    "rotate": 0,
                 },
             },
             "No3": {
@@ -103,7 +106,7 @@ class TestBaseModule(unittest.TestCase):
             for export_name, input_data in self.dict_for_test().items():
                 self.ps.core(export_name, input_data)
             pprint(self.ps.run_time_record)
-            pprint(self.ps.layer_factory.run_time_record)
+            pprint(self.ps.profiler.summary())
         pprint("测试结束")
 
 
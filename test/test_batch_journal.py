@@ -0,0 +1,186 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import fake_photoshop
+from src.batch_journal import BatchJournal
+from src.layer_state import LayerState
+from src.native_core import NativePhotoshop
+from src.render_cache import RenderCache
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestBatchJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "batch.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_replay(self):
+        """测试重新打开日志后读取完成的任务和没有恢复的初始状态, 跳过不完整的最后一行"""
+        output = os.path.join(self.tmp, "SKU1.png")
+        open(output, "wb").close()
+        state = LayerState.coerce({"visible": False, "textItem": {"contents": "原文"}})
+        with BatchJournal(self.path) as journal:
+            journal.record_initial("a.psd", {"标题": state})
+            journal.record_initial("b.psd", {"标题": state})
+            journal.record_done("SKU1", {output: "key1"})
+            journal.record_done("SKU2", {os.path.join(self.tmp, "SKU2.png"): "key2"})
+            journal.record_restored("b.psd")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"type": "done", "task": "SKU3", "outp')
+
+        with BatchJournal(self.path) as journal:
+            self.assertTrue(journal.is_done({output: "key1"}))
+            # 任务内容变化或者导出文件已经不存在时重新渲染
+            self.assertFalse(journal.is_done({output: "changed"}))
+            self.assertFalse(journal.is_done({os.path.join(self.tmp, "SKU2.png"): "key2"}))
+            self.assertEqual(journal.initial_states("a.psd"), {"标题": state})
+            self.assertEqual(journal.initial_states("b.psd"), {})
+
+    def test_batched_fsync(self):
+        """测试完成记录按间隔写入, 初始状态立即写入"""
+        journal = BatchJournal(self.path, fsync_interval=3600)
+        journal.record_done("SKU1", {os.path.join(self.tmp, "SKU1.png"): "key1"})
+        self.assertEqual(os.path.getsize(self.path), 0)
+        journal.record_initial("a.psd", {"标题": LayerState.coerce({"visible": True})})
+        size = os.path.getsize(self.path)
+        self.assertGreater(size, 0)
+        # 相同的初始状态不重复写入
+        journal.record_initial("a.psd", {"标题": LayerState.coerce({"visible": True})})
+        journal.record_done("SKU2", {os.path.join(self.tmp, "SKU2.png"): "key2"})
+        self.assertEqual(os.path.getsize(self.path), size)
+        journal.close()
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_skip_done_tasks(self):
+        """测试重新运行时跳过导出文件仍然存在的任务"""
+        export_folder = os.path.join(self.tmp, "export")
+        tasks = {"SKU1": {"图片/图片1": {"visible": True}}, "SKU2": {"图片/图片1": {"visible": False}}}
+        with BatchJournal(self.path) as journal:
+            ps = NativePhotoshop("测试", PSD_DIR, export_folder, journal=journal)
+            with ps:
+                ps.core("SKU1", tasks["SKU1"])
+        with BatchJournal(self.path) as journal:
+            ps = NativePhotoshop("测试", PSD_DIR, export_folder, journal=journal)
+            with ps, mock.patch.object(ps, "ps_saveas", wraps=ps.ps_saveas) as saveas:
+                for export_name, task in tasks.items():
+                    ps.core(export_name, task)
+            self.assertEqual([call.args[0] for call in saveas.call_args_list], ["SKU2"])
+            self.assertEqual(journal.initial_states(os.path.join(PSD_DIR, "测试.psd")), {})
+            self.assertEqual(journal.skipped, 1)
+
+    def test_changed_input_rerendered(self):
+        """测试重复使用日志时, 输入数据变化的任务即使导出文件仍然存在也重新渲染"""
+        export_folder = os.path.join(self.tmp, "export")
+        tasks = {"SKU1": {"图片/图片1": {"visible": True}}, "SKU2": {"图片/图片1": {"visible": False}}}
+        with BatchJournal(self.path) as journal:
+            ps = NativePhotoshop("测试", PSD_DIR, export_folder, journal=journal)
+            with ps:
+                for export_name, task in tasks.items():
+                    ps.core(export_name, task)
+        tasks["SKU2"] = {"图片/图片1": {"visible": True}}
+        with BatchJournal(self.path) as journal:
+            ps = NativePhotoshop("测试", PSD_DIR, export_folder, journal=journal)
+            with ps, mock.patch.object(ps, "ps_saveas", wraps=ps.ps_saveas) as saveas:
+                for export_name, task in tasks.items():
+                    ps.core(export_name, task)
+            self.assertEqual([call.args[0] for call in saveas.call_args_list], ["SKU2"])
+            self.assertEqual(journal.skipped, 1)
+
+    def test_cache_hits_recorded(self):
+        """测试命中渲染缓存的任务和内容相同的任务也记录为完成, 重新运行时直接跳过"""
+        export_folder = os.path.join(self.tmp, "export")
+        cache = RenderCache(os.path.join(self.tmp, "cache"))
+        task = {"图片/图片1": {"visible": True}}
+        ps = NativePhotoshop("测试", PSD_DIR, os.path.join(self.tmp, "warm"), render_cache=cache)
+        with ps:
+            ps.core("SKU0", task)
+        for run in range(2):
+            with BatchJournal(self.path) as journal:
+                ps = NativePhotoshop(
+                    "测试", PSD_DIR, export_folder, render_cache=cache, journal=journal
+                )
+                with ps, mock.patch.object(
+                    cache, "materialize", wraps=cache.materialize
+                ) as materialize:
+                    ps.core("SKU1", task, duplicates=["SKU2"])
+                # 第一次运行命中缓存, 第二次运行按日志跳过
+                self.assertEqual(materialize.call_count, 1 - run)
+                self.assertEqual(
+                    sorted(journal.done),
+                    [os.path.join(export_folder, f"{name}.png") for name in ("SKU1", "SKU2")],
+                )
+
+
+# 替换 photoshop 包只在本模块的测试中生效, 结束后恢复 sys.modules, 不影响其他测试
+_modules = mock.patch.dict(sys.modules)
+
+
+def setUpModule():
+    global ps_core
+    _modules.start()
+    fake_photoshop.install()
+    ps_core = importlib.import_module("src.ps_core")
+
+
+def tearDownModule():
+    _modules.stop()
+
+
+class TestResumeAfterCrash(unittest.TestCase):
+    def test_resume(self):
+        """测试中断后重新运行: 按日志恢复仍被修改的模板, 跳过已完成的任务, 结束时模板为初始状态"""
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 2, 3, text_ratio=1.0)
+        fake_photoshop.open_document(document, counter)
+        layers = [layer for layer_set in document._layerSets.items for layer in layer_set._artLayers.items]
+        initial = [(layer._visible, layer._textItem._contents) for layer in layers]
+        tasks = [
+            (f"SKU{index}", {"组0/图层0": {"visible": index % 2 == 0, "textItem": {"contents": f"T{index}"}}})
+            for index in range(6)
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            export_folder = os.path.join(tmp, "out")
+            journal_path = os.path.join(tmp, "batch.jsonl")
+
+            def save(export_name, *_):
+                open(os.path.join(export_folder, f"{export_name}.png"), "wb").close()
+
+            # 第一次运行在第 3 个任务后中断, 不恢复图层, 日志也没有关闭
+            journal = BatchJournal(journal_path, fsync_interval=0)
+            ps = ps_core.Photoshop("bench", tmp, export_folder, journal=journal)
+            ps.__enter__()
+            with mock.patch.object(ps, "ps_saveas", side_effect=save):
+                for export_name, task in tasks[:3]:
+                    ps.core(export_name, task)
+            self.assertEqual(layers[0]._textItem._contents, "T2")
+
+            journal = BatchJournal(journal_path)
+            ps = ps_core.Photoshop("bench", tmp, export_folder, journal=journal)
+            with ps, mock.patch.object(ps, "ps_saveas", side_effect=save) as saveas:
+                # 打开后模板已经恢复
+                self.assertEqual((layers[0]._visible, layers[0]._textItem._contents), initial[0])
+                for export_name, task in tasks:
+                    ps.core(export_name, task)
+                    if export_name == "SKU4":
+                        self.assertEqual(layers[0]._textItem._contents, "T4")
+            journal.close()
+            self.assertEqual([call.args[0] for call in saveas.call_args_list], ["SKU3", "SKU4", "SKU5"])
+            self.assertEqual([(layer._visible, layer._textItem._contents) for layer in layers], initial)
+            with BatchJournal(journal_path) as journal:
+                self.assertEqual(journal.initial, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
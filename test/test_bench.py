@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import fake_photoshop
+from src.jsx_compiler import JSX_OK, JsxCompiler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestFakePhotoshopModule(unittest.TestCase):
+    def setUp(self):
+        self.counter = fake_photoshop.CallCounter()
+        self.document = fake_photoshop.build_document(self.counter, 2, 3, text_ratio=1.0)
+
+    def test_call_count(self):
+        """测试属性读写、方法调用和集合遍历都计为 COM 调用"""
+        layer_set = self.document.layerSets.getByName("组1")
+        layer = layer_set.artLayers[0]
+        layer.visible = not layer.visible
+        layer.translate(10, 0)
+        self.assertEqual(layer.bounds[0], 10)
+        self.assertEqual(
+            dict(self.counter.calls),
+            {
+                "FakeDocument.layerSets": 1,
+                "FakeLayers.getByName()": 1,
+                "FakeLayerSet.artLayers": 1,
+                "FakeLayers.item()": 1,
+                "FakeArtLayer.visible": 1,
+                "FakeArtLayer.visible=": 1,
+                "FakeArtLayer.translate()": 1,
+                "FakeArtLayer.bounds": 1,
+            },
+        )
+        self.assertEqual(self.counter.total, 8)
+
+    def test_snapshot_script(self):
+        """测试识别快照脚本, 恢复快照后图层回到记录时的状态"""
+        app = fake_photoshop.FakeApplication(self.counter, self.document)
+        compiler = JsxCompiler()
+        compiler.create_snapshot()
+        self.assertEqual(app.doJavaScript(compiler.compile()), JSX_OK)
+        layer = self.document._layerSets.items[0]._artLayers.items[0]
+        visible = layer._visible
+        layer._visible = not visible
+        layer._textItem._contents = "修改后"
+        compiler.clear()
+        compiler.revert_snapshot()
+        app.doJavaScript(compiler.compile())
+        self.assertEqual(layer._visible, visible)
+        self.assertEqual(layer._textItem._contents, "文本0-0")
+
+
+class TestBenchmark(unittest.TestCase):
+    def _run(self, baseline_path: str, *args: str) -> subprocess.CompletedProcess:
+        # 替换 photoshop 包只在子进程中生效, 不影响其他测试
+        return subprocess.run(
+            [
+                sys.executable,
+                os.path.join(ROOT, "bench.py"),
+                "--scenario",
+                "visible_small",
+                "--latency-us",
+                "0",
+                "--output",
+                "",
+                "--baseline",
+                baseline_path,
+                *args,
+            ],
+            cwd=tempfile.gettempdir(),
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+        )
+
+    def test_baseline(self):
+        """测试更新基线后没有退化, 调用次数超过基线时返回非 0"""
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline_path = os.path.join(tmp, "baseline.json")
+            result = self._run(baseline_path, "--update-baseline")
+            self.assertEqual(result.returncode, 0, result.stderr)
+            with open(baseline_path, encoding="utf-8") as f:
+                baseline = json.load(f)
+            calls = baseline["scenarios"]["visible_small"]["calls_per_task"]
+            self.assertGreater(calls, 0)
+
+            result = self._run(baseline_path, "--tolerance", "1")
+            self.assertEqual(result.returncode, 0, result.stdout)
+
+            baseline["scenarios"]["visible_small"]["calls_per_task"] = calls / 2
+            with open(baseline_path, "w", encoding="utf-8") as f:
+                json.dump(baseline, f)
+            result = self._run(baseline_path, "--tolerance", "1")
+            self.assertEqual(result.returncode, 1)
+            self.assertIn("性能退化", result.stdout)
@@ -0,0 +1,95 @@
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from bench_blend import MODES, kernel_blend, random_layers, reference_blend, run
+from src.blend import BlendBuffers, blend, is_opaque, load_opaque, load_premultiplied
+from src.compositor import Compositor
+from src.psd_reader import PsdDocument, PsdLayer
+
+
+class TestBlendKernels(unittest.TestCase):
+    def setUp(self):
+        self.backdrop, self.source, self.opaque = random_layers(64)
+
+    def test_matches_reference(self):
+        """测试每种混合模式和不透明度的结果与参考实现相差不超过 1"""
+        for mode in MODES:
+            for opacity in (1.0, 0.5, 0.0):
+                with self.subTest(mode=mode, opacity=opacity):
+                    expected = reference_blend(self.backdrop, self.source, mode, opacity)
+                    actual = kernel_blend(self.backdrop, self.source, mode, opacity)
+                    self.assertLessEqual(np.abs(expected.astype(np.int16) - actual).max(), 1)
+
+    def test_opaque_fast_path(self):
+        """测试不透明图层的快速路径与一般路径结果完全一致"""
+        self.assertTrue(is_opaque(self.opaque))
+        self.assertFalse(is_opaque(self.source))
+        buffers = BlendBuffers()
+        fast = load_opaque(self.opaque, np.empty((4, 64, 64), np.float32))
+        canvas = load_premultiplied(self.backdrop, np.empty((4, 64, 64), np.float32))
+        source = load_premultiplied(self.opaque, np.empty((4, 64, 64), np.float32))
+        blend(canvas, source, "normal", 1.0, buffers)
+        self.assertTrue(np.array_equal(fast, canvas))
+
+    def test_no_allocation(self):
+        """测试缓冲区准备好之后判断不透明和混合都不再分配内存"""
+        buffers = BlendBuffers()
+        height, width = 256, 256
+        backdrop = np.tile(self.backdrop, (4, 4, 1))
+        canvas = load_premultiplied(backdrop, buffers.get("canvas", height, width))
+        layer = np.tile(self.source, (4, 4, 1))
+
+        def blend_all():
+            self.assertFalse(is_opaque(layer))
+            for mode in MODES:
+                source = load_premultiplied(layer, buffers.get("source", height, width))
+                blend(canvas, source, mode, 0.5, buffers)
+
+        blend_all()
+        tracemalloc.start()
+        try:
+            blend_all()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # 只有 NumPy 内部的少量迭代缓冲, 一个 float32 通道平面就有 256KB
+        self.assertLess(peak, 64 << 10)
+
+    def test_benchmark(self):
+        """测试微基准的每种情况都与参考实现一致"""
+        results = run(size=32, repeat=1)
+        self.assertEqual(len(results), 7)
+        self.assertTrue(all(result["max_diff"] <= 1 for result in results))
+
+
+class TestCompositorBlendModes(unittest.TestCase):
+    def make_document(self, top: PsdLayer) -> PsdDocument:
+        backdrop, source, _ = random_layers(16)
+        backdrop[..., 3] = 255
+        document = PsdDocument("测试", "", 16, 16, 1)
+        top.pixels = source
+        for layer in (PsdLayer("背景", "pixel", pixels=backdrop), top):
+            layer.parent = document
+            document.children.append(layer)
+        return document
+
+    def test_layer_modes(self):
+        """测试合成器按图层的混合模式、不透明度和填充不透明度合成"""
+        for mode in MODES:
+            for opacity, fill_opacity in ((255, 255), (128, 255), (255, 128)):
+                with self.subTest(mode=mode, opacity=opacity, fill_opacity=fill_opacity):
+                    top = PsdLayer("图层", "pixel", opacity=opacity, blend_mode=mode)
+                    top.fill_opacity = fill_opacity
+                    document = self.make_document(top)
+                    backdrop, source = (layer.pixels for layer in document.children)
+                    expected = reference_blend(
+                        backdrop, source, mode, opacity * fill_opacity / 255**2
+                    )
+                    actual = Compositor(document).composite()
+                    self.assertLessEqual(np.abs(expected.astype(np.int16) - actual).max(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+
+import numpy as np
+
+from src.compositor import Compositor, GroupRasterCache, TiledCompositor
+from src.native_core import NativePhotoshop
+from src.psd_reader import LayerChannels, PsdLayer
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+def decode_png(path: str) -> np.ndarray:
+    """解码不使用过滤的 8 位 RGBA PNG"""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos, idat = 8, b""
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        tag, body = data[pos + 4 : pos + 8], data[pos + 8 : pos + 8 + length]
+        if tag == b"IHDR":
+            width, height = struct.unpack(">II", body[:8])
+        elif tag == b"IDAT":
+            idat += body
+        pos += length + 12
+    raw = np.frombuffer(zlib.decompress(idat), np.uint8).reshape(height, width * 4 + 1)
+    return raw[:, 1:].reshape(height, width, 4)
+
+
+class TestIncrementalComposite(unittest.TestCase):
+    def setUp(self):
+        self.export_folder = tempfile.mkdtemp()
+        self.ps = NativePhotoshop("测试", PSD_DIR, self.export_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+    def assert_matches_full(self):
+        """增量合成结果与不使用任何缓存整张重新合成逐字节一致"""
+        incremental = self.ps.compositor.composite()
+        full = Compositor(self.ps.doc, group_cache_bytes=0).composite()
+        self.assertEqual(incremental.tobytes(), full.tobytes())
+
+    def test_matches_full_composite(self):
+        """测试每个任务之后的增量合成结果与整张重新合成一致"""
+        tasks = [
+            {"图片/图片1": {"visible": True}},
+            {"图片/图片1": {"visible": False}, "测试图层": {"visible": True}},
+            {"矩形/矩形1": {"visible": True, "move": (350, 350)}},
+            {"矩形/矩形1": {"visible": True, "move": (-20, 500), "rotate": 90}},
+            {"图片": {"visible": False}, "标题/标题1": {"textItem": {"contents": "修改后"}}},
+            {},
+        ]
+        with self.ps, mock.patch.object(self.ps, "ps_saveas"):
+            self.assert_matches_full()
+            for index, task in enumerate(tasks):
+                self.ps.core(f"No{index}", task)
+                self.assert_matches_full()
+            self.ps.layer_factory.revert_to_snapshot()
+            self.assert_matches_full()
+
+    def test_only_dirty_region(self):
+        """测试只重新合成修改过的图层所在的区域, 没有修改时不合成"""
+        with self.ps:
+            compositor = self.ps.compositor
+            compositor.composite()
+            layer = self.ps.layer_factory.get_layer_by_layername("图片/图片1")[0]
+            with mock.patch.object(
+                compositor, "_composite_region", wraps=compositor._composite_region
+            ) as region:
+                self.ps.layer_factory.change_layer_state("图片/图片1", {"visible": True})
+                compositor.composite()
+                compositor.composite()
+            left, top, right, bottom = layer.bounds
+            self.assertEqual(region.call_count, 1)
+            self.assertEqual(
+                region.call_args.args,
+                (max(left, 0), max(top, 0), min(right, 800), min(bottom, 800)),
+            )
+
+    def test_returned_result_unchanged(self):
+        """测试已经返回的合成结果不被之后的增量合成修改, 可以在后台线程中写出"""
+        with self.ps:
+            first = self.ps.compositor.composite()
+            expected = first.copy()
+            self.ps.layer_factory.change_layer_state("图片/图片1", {"visible": True})
+            second = self.ps.compositor.composite()
+            self.assertTrue(np.array_equal(first, expected))
+            self.assertFalse(np.array_equal(first, second))
+            self.assertFalse(second.flags.writeable)
+
+
+class TestGroupRasterCache(unittest.TestCase):
+    def test_unchanged_group_reused(self):
+        """测试子图层没有变化的图层组不重新合成, 修改过的图层组重新合成"""
+        export_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_folder, True)
+        ps = NativePhotoshop("测试", PSD_DIR, export_folder)
+        with ps:
+            compositor = ps.compositor
+            compositor.composite()
+            factory = ps.layer_factory
+            picture = factory.get_layer_by_layername("图片")[0]
+            rect = factory.get_layer_by_layername("矩形")[0]
+            factory.change_layer_state("图片/图片1", {"visible": True})
+            compositor.invalidate()
+            with mock.patch.object(
+                compositor, "_composite_group", wraps=compositor._composite_group
+            ) as composite_group:
+                result = compositor.composite()
+            groups = [call.args[0] for call in composite_group.call_args_list]
+            self.assertIn(picture, groups)
+            self.assertNotIn(rect, groups)
+            self.assertGreater(compositor.group_cache.hits, 0)
+            expected = Compositor(ps.doc, group_cache_bytes=0).composite()
+            self.assertEqual(result.tobytes(), expected.tobytes())
+
+    def test_lru_limit(self):
+        """测试超过大小上限时淘汰最久未使用的结果, 超过上限的结果不缓存"""
+        raster = np.zeros((10, 10, 4), np.float32)
+        cache = GroupRasterCache(max_bytes=raster.nbytes * 2)
+        group = PsdLayer("组", "group")
+        for key in ("a", "b"):
+            cache.put(key, group, raster.copy(), 0, 0)
+        cache.get("a")
+        cache.put("c", group, raster.copy(), 0, 0)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.total_bytes, raster.nbytes * 2)
+        cache.put("d", group, np.zeros((20, 20, 4), np.float32), 0, 0)
+        self.assertIsNone(cache.get("d"))
+
+
+class TestTiledComposite(unittest.TestCase):
+    def setUp(self):
+        self.export_folder = tempfile.mkdtemp()
+        self.ps = NativePhotoshop("测试", PSD_DIR, self.export_folder, tile_size=128)
+
+    def tearDown(self):
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+    def test_matches_full_composite(self):
+        """测试分块合成与整张合成逐字节一致, 导出的 PNG 逐行写出"""
+        tasks = [
+            {"图片/图片1": {"visible": True}},
+            {"矩形/矩形1": {"visible": True, "move": (-20, 500), "rotate": 90}},
+            {"图片": {"visible": False}, "测试图层": {"visible": True}},
+        ]
+        with self.ps:
+            self.assertIsInstance(self.ps.compositor, TiledCompositor)
+            for index, task in enumerate(tasks):
+                self.ps.core(f"No{index}", task)
+                expected = Compositor(self.ps.doc, group_cache_bytes=0).composite()
+                self.assertEqual(self.ps.compositor.composite().tobytes(), expected.tobytes())
+                exported = decode_png(os.path.join(self.export_folder, f"No{index}.png"))
+                self.assertEqual(exported.tobytes(), expected.tobytes())
+
+    def test_decodes_band_rows_only(self):
+        """测试只解码可见图层与当前一行块相交的行, 隐藏的图层不解码"""
+        calls = []
+        read_rows = LayerChannels.read_rows
+
+        def record(channels, top, bottom):
+            calls.append((channels, top, bottom))
+            return read_rows(channels, top, bottom)
+
+        with self.ps, mock.patch.object(LayerChannels, "read_rows", record):
+            hidden = self.ps.layer_factory.get_layer_by_layername("图片/图片1")[0]
+            self.ps.compositor.composite()
+        self.assertTrue(calls)
+        self.assertTrue(all(bottom - top <= 128 for _, top, bottom in calls))
+        self.assertNotIn(hidden.source, [channels for channels, _, _ in calls])
+
+    def test_psb_uses_tiles(self):
+        """测试 PSB 文件默认分块合成, PSD 文件默认整张合成"""
+        shutil.copy(os.path.join(PSD_DIR, "测试.psd"), os.path.join(self.export_folder, "大图.psb"))
+        psb = NativePhotoshop("大图", self.export_folder, self.export_folder)
+        with psb:
+            self.assertIsInstance(psb.compositor, TiledCompositor)
+            self.assertEqual(psb.compositor.tile_size, 1024)
+        with self.ps:
+            self.assertEqual(self.ps.compositor.tile_size, 128)
+        psd = NativePhotoshop("测试", PSD_DIR, self.export_folder)
+        with psd:
+            self.assertNotIsInstance(psd.compositor, TiledCompositor)
+
+
+if __name__ == "__main__":
+    unittest.main()
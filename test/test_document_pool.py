@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from src.batch_journal import BatchJournal
+from src.document_pool import DocumentPool
+from src.export_profile import ExportProfile
+from src.export_queue import ExportQueue
+
+PSD_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd", "测试.psd")
+
+
+class TestDocumentPoolModule(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.psd_dir = os.path.join(self.tmp, "psd")
+        os.makedirs(self.psd_dir)
+        for template in "ABC":
+            shutil.copyfile(PSD_PATH, os.path.join(self.psd_dir, f"{template}.psd"))
+        self.export_folder = os.path.join(self.tmp, "export")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_pool(self, max_open: int) -> DocumentPool:
+        return DocumentPool("native", ("A", self.psd_dir, self.export_folder), max_open=max_open)
+
+    def test_lru(self):
+        """测试模板保持打开, 超过上限时淘汰最久未使用的模板"""
+        with self.make_pool(2) as pool:
+            first = pool.get("A")
+            pool.get("B")
+            self.assertIs(pool.get("A"), first)
+            pool.get("C")
+            self.assertEqual(list(pool.engines), ["A", "C"])
+            self.assertEqual(pool.stats["opened"], 3)
+            self.assertEqual(pool.stats["evicted"], 1)
+            self.assertIs(pool.get(), first)
+        self.assertEqual(pool.engines, {})
+
+    def test_run(self):
+        """测试交替出现的模板任务被路由到各自的文档, 每个模板只打开一次"""
+        tasks = [
+            {"任务名": f"No{i}", "模板": "AB"[i % 2], "内容": {"图片/图片1": {"visible": i < 2}}}
+            for i in range(4)
+        ]
+        tasks.append({"任务名": "No4", "内容": {"矩形/矩形1": {"move": [10, 10]}}})
+        tasks.append({"任务名": "No5", "模板": "不存在", "内容": {}})
+        with self.make_pool(3) as pool:
+            result = pool.run(tasks)
+            # 每个模板有独立的图层状态
+            states = {name: set(ps.layer_factory.current_state) for name, ps in pool.engines.items()}
+            self.assertEqual(states, {"A": {"图片/图片1", "矩形/矩形1"}, "B": {"图片/图片1"}})
+        self.assertEqual(sorted(result["outputs"]), ["No0", "No1", "No2", "No3", "No4"])
+        self.assertEqual(list(result["errors"]), ["No5"])
+        self.assertEqual(pool.stats["opened"], 2)
+        self.assertEqual(pool.stats["switches"], 1)
+        for name in result["outputs"]:
+            self.assertTrue(os.path.isfile(os.path.join(self.export_folder, f"{name}.png")))
+
+    def test_evict_releases_engine(self):
+        """测试淘汰模板时结束引擎的导出线程和分块合成线程"""
+        pool = DocumentPool(
+            "native",
+            ("A", self.psd_dir, self.export_folder),
+            {"tile_size": 64, "export_profiles": [ExportProfile(), ExportProfile(suffix="_2")]},
+            max_open=1,
+        )
+        before = set(threading.enumerate())
+        with pool:
+            evicted = pool.get("A")
+            evicted.core("No0", {"图片/图片1": {"visible": True}})
+            self.assertIsNotNone(evicted._export_executor)
+            pool.get("B")
+            self.assertIsNone(evicted._export_executor)
+            self.assertIsNone(evicted.compositor._executor)
+        self.assertEqual(set(threading.enumerate()) - before, set())
+
+    def test_evict_flushes_exports(self):
+        """测试淘汰模板时先等待异步导出写完并记录完成"""
+        journal = BatchJournal(os.path.join(self.tmp, "batch.jsonl"))
+        export_queue = ExportQueue()
+        pool = DocumentPool(
+            "native",
+            ("A", self.psd_dir, self.export_folder),
+            {"export_queue": export_queue, "journal": journal},
+            max_open=1,
+        )
+        with journal, export_queue, pool:
+            pool.core("A", "No0", {"图片/图片1": {"visible": True}})
+            pool.get("B")
+            self.assertEqual(list(journal.done), [os.path.join(self.export_folder, "No0.png")])
+
+
+if __name__ == "__main__":
+    unittest.main()
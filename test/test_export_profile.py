@@ -0,0 +1,107 @@
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.export_profile import ExportProfile, parse_profile_spec, parse_profiles
+from src.image_writer import resize_pixels
+from src.native_core import NativePhotoshop
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+def png_size(path: str) -> tuple[int, int]:
+    """读取 PNG 文件头中的宽高"""
+    with open(path, "rb") as f:
+        return struct.unpack(">II", f.read(24)[16:24])
+
+
+class TestExportProfileModule(unittest.TestCase):
+    def test_parse(self):
+        """测试命令行导出配置和字典配置"""
+        profile = parse_profile_spec("JPG,quality=85,suffix=_web")
+        self.assertEqual(profile, ExportProfile("jpg", quality=85, suffix="_web"))
+        self.assertEqual(profile.file_name("No1"), "No1_web.jpg")
+        self.assertEqual(profile.photoshop_quality, 10)
+        self.assertEqual(profile.encode_options(), {"quality": 85})
+        self.assertEqual(ExportProfile.coerce({"format": "png", "width": 400}).width, 400)
+        with self.assertRaises(ValueError):
+            parse_profile_spec("png,size=400")
+        with self.assertRaises(ValueError):
+            ExportProfile("jpg", quality=0)
+
+    def test_hashable(self):
+        """测试相等的配置哈希值相同, 可以去重, 且不可修改"""
+        profile = ExportProfile("JPG", quality=85, suffix="_web")
+        self.assertEqual(hash(profile), hash(parse_profile_spec("jpg,quality=85,suffix=_web")))
+        self.assertEqual(len({profile, ExportProfile.coerce(profile.to_dict()), ExportProfile()}), 2)
+        self.assertEqual(pickle.loads(pickle.dumps(profile)), profile)
+        with self.assertRaises(AttributeError):
+            profile.quality = 90
+
+    def test_duplicate_file_name(self):
+        """测试相同格式没有后缀时报错"""
+        with self.assertRaises(ValueError):
+            parse_profiles(["png", {"format": "png", "width": 100}])
+        self.assertEqual(len(parse_profiles(["png", "jpg"])), 2)
+
+    def test_target_size(self):
+        """测试只指定一边时按比例缩放"""
+        self.assertEqual(ExportProfile(width=400).target_size(800, 600), (400, 300))
+        self.assertEqual(ExportProfile(height=100).target_size(800, 600), (133, 100))
+        self.assertEqual(ExportProfile(width=10, height=20).target_size(800, 600), (10, 20))
+        self.assertEqual(ExportProfile().target_size(800, 600), (800, 600))
+
+    def test_resize_pixels(self):
+        """测试面积重采样: 纯色保持不变, 缩小一半时取 2x2 平均值, 透明像素不影响颜色"""
+        solid = np.full((6, 9, 4), (10, 200, 30, 255), np.uint8)
+        self.assertTrue((resize_pixels(solid, 4, 3) == (10, 200, 30, 255)).all())
+
+        pixels = np.zeros((2, 2, 4), np.uint8)
+        pixels[0, 0] = (200, 100, 0, 255)
+        pixels[1, 1] = (100, 50, 0, 255)
+        # 透明像素的颜色不参与平均
+        pixels[0, 1] = (0, 0, 255, 0)
+        self.assertEqual(resize_pixels(pixels, 1, 1)[0, 0].tolist(), [150, 75, 0, 128])
+
+
+class TestMultiProfileExport(unittest.TestCase):
+    def setUp(self):
+        self.export_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+    def test_core(self):
+        """测试一次合成导出多个文件, 任务可以覆盖默认导出配置"""
+        ps = NativePhotoshop(
+            psd_name="测试",
+            psd_dir_path=PSD_DIR,
+            export_folder=self.export_folder,
+            export_profiles=[
+                ExportProfile("png"),
+                {"format": "png", "width": 100, "suffix": "_thumb"},
+            ],
+        )
+        with ps:
+            ps.core("No1", {"图片/图片1": {"visible": True}})
+            ps.core("No2", {"图片/图片1": {"visible": False}}, [{"format": "png", "height": 50}])
+        self.assertEqual(
+            sorted(os.listdir(self.export_folder)), ["No1.png", "No1_thumb.png", "No2.png"]
+        )
+        self.assertEqual(png_size(os.path.join(self.export_folder, "No1.png")), (800, 800))
+        self.assertEqual(png_size(os.path.join(self.export_folder, "No1_thumb.png")), (100, 100))
+        self.assertEqual(png_size(os.path.join(self.export_folder, "No2.png")), (50, 50))
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            NativePhotoshop(
+                psd_name="测试",
+                psd_dir_path=PSD_DIR,
+                export_folder=self.export_folder,
+                export_profiles=["psd"],
+            )
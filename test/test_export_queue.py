@@ -0,0 +1,125 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+
+from src.export_queue import ExportError, ExportQueue
+from src.native_core import NativePhotoshop
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestExportQueueModule(unittest.TestCase):
+    def test_backpressure(self):
+        """测试等待写出的任务达到上限时提交阻塞"""
+        release = threading.Event()
+        written = []
+        with ExportQueue(max_pending=1) as export_queue:
+            # 第一个任务被工作线程取出后阻塞, 第二个任务占满队列
+            export_queue.submit("No1", [("No1.png", lambda: release.wait())])
+            export_queue.submit("No2", [("No2.png", lambda: written.append("No2"))])
+            blocked = threading.Thread(
+                target=export_queue.submit,
+                args=("No3", [("No3.png", lambda: written.append("No3"))]),
+            )
+            blocked.start()
+            blocked.join(0.2)
+            self.assertTrue(blocked.is_alive())
+            release.set()
+            blocked.join()
+            self.assertEqual(export_queue.flush(), {})
+        self.assertEqual(written, ["No2", "No3"])
+        self.assertEqual(export_queue.stats["written"], 3)
+
+    def test_error(self):
+        """测试单个文件失败只影响所属任务, flush 时返回并清空"""
+
+        def fail():
+            raise OSError("磁盘已满")
+
+        export_queue = ExportQueue()
+        calls = []
+        ticket = export_queue.submit(
+            "No1", [("No1.png", fail), ("No1.jpg", lambda: None)], lambda: calls.append(1)
+        )
+        other = export_queue.submit("No2", [("No2.png", lambda: None)])
+        with self.assertRaises(ExportError) as raised:
+            ticket.wait()
+        self.assertEqual(raised.exception.errors, {"No1": {"No1.png": "磁盘已满"}})
+        other.wait()
+        # 有文件失败时不执行后处理
+        self.assertEqual(calls, [])
+        self.assertEqual(export_queue.flush(), {"No1": {"No1.png": "磁盘已满"}})
+        self.assertEqual(export_queue.flush(), {})
+        export_queue.close()
+
+    def test_pickle(self):
+        """测试多进程传递时只保留配置"""
+        export_queue = ExportQueue(3, 2)
+        export_queue.submit("No1", [("No1.png", lambda: None)])
+        copy = pickle.loads(pickle.dumps(export_queue))
+        self.assertEqual((copy.max_pending, copy.workers), (3, 2))
+        self.assertEqual(copy.stats["submitted"], 0)
+        export_queue.close()
+
+
+class TestAsyncExport(unittest.TestCase):
+    def setUp(self):
+        self.sync_folder = tempfile.mkdtemp()
+        self.async_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.sync_folder, ignore_errors=True)
+        shutil.rmtree(self.async_folder, ignore_errors=True)
+
+    def _render(self, export_folder: str, export_queue: ExportQueue | None):
+        tasks = {
+            "No1": {"图片/图片1": {"visible": True}, "矩形/矩形1": {"move": (350, 350)}},
+            "No2": {"图片/图片1": {"visible": False}},
+            "No3": {"矩形/矩形1": {"visible": True, "rotate": 180}},
+        }
+        ps = NativePhotoshop(
+            psd_name="测试",
+            psd_dir_path=PSD_DIR,
+            export_folder=export_folder,
+            export_queue=export_queue,
+        )
+        tickets = []
+        with ps:
+            for export_name, input_data in tasks.items():
+                tickets.append(ps.core(export_name, input_data))
+        return tickets
+
+    def test_same_output(self):
+        """测试异步导出的文件与同步导出一致, 退出时写完所有文件"""
+        self.assertEqual(self._render(self.sync_folder, None), [None, None, None])
+        with ExportQueue(max_pending=2, workers=2) as export_queue:
+            tickets = self._render(self.async_folder, export_queue)
+        self.assertTrue(all(ticket.done.is_set() for ticket in tickets))
+        names = sorted(os.listdir(self.sync_folder))
+        self.assertEqual(names, sorted(os.listdir(self.async_folder)))
+        for name in names:
+            with open(os.path.join(self.sync_folder, name), "rb") as f:
+                expected = f.read()
+            with open(os.path.join(self.async_folder, name), "rb") as f:
+                self.assertEqual(f.read(), expected, name)
+
+    def test_exit_raises(self):
+        """测试退出时报告导出失败的文件, 图层仍然恢复"""
+        ps = NativePhotoshop(
+            psd_name="测试",
+            psd_dir_path=PSD_DIR,
+            export_folder=self.async_folder,
+            export_queue=ExportQueue(),
+        )
+        with self.assertRaises(ExportError) as raised:
+            with ps:
+                # 导出路径是目录, 写出失败
+                os.makedirs(ps._export_path("No1"))
+                ps.core("No1", {"图片/图片1": {"visible": True}})
+        self.assertEqual(list(raised.exception.errors), ["No1"])
+        self.assertEqual(list(ps.export_errors), ["No1"])
+        self.assertEqual(ps.layer_factory.current_state, ps.layer_factory.initial_state)
+        ps.export_queue.close()
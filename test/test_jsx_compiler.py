@@ -0,0 +1,87 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from src.jsx_compiler import JsxCompiler
+from src.layer_state import LayerState
+
+
+class TestJsxCompilerModule(unittest.TestCase):
+    def setUp(self):
+        self.compiler = JsxCompiler()
+        self.compiler.change_layer_state(
+            "标题/标题1",
+            LayerState.from_dict(
+                {
+                    "visible": True,
+                    "textItem": {"contents": 123.0, "size": 35, "color": "#086D7A"},
+                }
+            ),
+        )
+        self.compiler.change_layer_state(
+            "矩形/矩形1",
+            LayerState.from_dict({"visible": True, "move": (350, 350), "rotate": 180}),
+        )
+        self.compiler.save_as("C:/导出图片/No1.png", "png")
+
+    def test_compile(self):
+        """测试一个任务的修改和导出被编译到同一个脚本中"""
+        script = self.compiler.compile()
+        self.assertEqual(len(self.compiler.statements), 3)
+        self.assertEqual(self.compiler.layer_names, {"标题/标题1", "矩形/矩形1"})
+        self.assertIn('_layers(["\\u6807\\u9898", "\\u6807\\u98981"])', script)
+        self.assertIn('layer.textItem["contents"] = "123";', script)
+        self.assertIn('layer.textItem.color = _color("#086D7A");', script)
+        self.assertIn("layer.translate(350 - layer.bounds[0].as('px')", script)
+        self.assertIn("layer.rotate(180);", script)
+        self.assertIn("new PNGSaveOptions(), true);", script)
+        # 脚本只包含 ASCII 字符, 可以直接传给 doJavaScript
+        script.encode("ascii")
+
+    def test_snapshot(self):
+        """测试恢复快照和其他修改编译到同一个脚本中"""
+        self.compiler.create_snapshot("base")
+        self.compiler.revert_snapshot("base")
+        self.assertTrue(self.compiler.reverted)
+        script = self.compiler.compile()
+        self.assertIn("executeAction(charIDToTypeID('Mk  '), desc, DialogModes.NO);", script)
+        self.assertIn('historyStates.getByName("base");', script)
+
+    def test_clear(self):
+        """测试执行后清空指令"""
+        self.compiler.revert_snapshot()
+        self.compiler.clear()
+        self.assertFalse(self.compiler)
+        self.assertFalse(self.compiler.reverted)
+        self.assertEqual(self.compiler.layer_names, set())
+
+    def test_save_as_profile(self):
+        """测试缩放导出复制文档后缩放, 不修改原文档"""
+        self.compiler.save_as("C:/导出图片/No1_web.jpg", "jpg", width=400, quality=10)
+        script = self.compiler.compile()
+        self.assertIn("var w = 400, h = null;", script)
+        self.assertIn("var copy = doc.duplicate();", script)
+        self.assertIn("o.quality = 10;", script)
+        self.assertIn("copy.close(SaveOptions.DONOTSAVECHANGES);", script)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            self.compiler.save_as("No1.webp", "webp")
+
+    @unittest.skipUnless(shutil.which("node"), "需要 node 检查脚本语法")
+    def test_script_syntax(self):
+        """测试生成的脚本语法正确"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "task.js")
+            self.compiler.create_snapshot()
+            self.compiler.revert_snapshot()
+            self.compiler.save_as("C:/导出图片/No1_thumb.jpg", "jpg", height=100, quality=8)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.compiler.compile())
+            subprocess.run(["node", "--check", path], check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
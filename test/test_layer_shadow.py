@@ -0,0 +1,328 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import fake_photoshop
+from src.layer_state import LayerState
+from src.native_core import NativePhotoshop
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+# 替换 photoshop 包只在本模块的测试中生效, 结束后恢复 sys.modules, 不影响其他测试
+_modules = mock.patch.dict(sys.modules)
+
+
+def setUpModule():
+    global layer_shadow, ps_core
+    _modules.start()
+    fake_photoshop.install()
+    layer_shadow = importlib.import_module("src.layer_shadow")
+    ps_core = importlib.import_module("src.ps_core")
+
+
+def tearDownModule():
+    _modules.stop()
+
+
+class TestLayerShadow(unittest.TestCase):
+    def setUp(self):
+        self.counter = fake_photoshop.CallCounter()
+        fake_photoshop.open_document(None, self.counter)
+        self.layer = fake_photoshop.FakeArtLayer(self.counter, "标题", visible=False, text="文本")
+        self.shadow = layer_shadow.LayerShadow(self.layer)
+        self.info = LayerState.coerce({"visible": True, "move": (0, 0), "textItem": {"contents": ""}})
+
+    def test_read_once(self):
+        """测试属性只在第一次使用时读取"""
+        state = self.shadow.read_state(self.info)
+        self.assertEqual(state.visible, False)
+        self.assertEqual(state.move, (0.0, 0.0))
+        self.assertEqual(state.text.contents, "文本")
+        self.assertTrue(self.shadow.knows(self.info))
+        calls = self.counter.total
+        self.assertEqual(self.shadow.read_state(self.info), state)
+        self.assertEqual(self.counter.total, calls)
+
+    def test_write_through(self):
+        """测试写入同时更新本地值, 与当前值相同的写入不调用 Photoshop"""
+        self.shadow.set_visible(True)
+        self.shadow.set_text("contents", "新文本")
+        self.shadow.move_to(30, 10)
+        self.assertEqual(self.layer._visible, True)
+        self.assertEqual(self.layer._bounds[:2], (30.0, 10.0))
+        self.assertEqual(self.layer._textItem._contents, "新文本")
+
+        self.counter.reset()
+        self.shadow.set_visible(True)
+        self.shadow.move_to(30, 10)
+        state = self.shadow.read_state(LayerState.coerce({"visible": True, "move": (0, 0)}))
+        self.assertEqual((state.visible, state.move), (True, (30, 10)))
+        self.assertEqual(self.counter.total, 0)
+
+    def test_rotate_reads_position(self):
+        """测试旋转后重新读取位置"""
+        self.shadow.move_to(10, 0)
+        self.shadow.rotate(90)
+        self.counter.reset()
+        self.shadow.get_position()
+        self.assertEqual(self.counter.calls["FakeArtLayer.bounds"], 1)
+
+    def test_revert(self):
+        """测试恢复快照后回到快照中的值, 不需要重新读取"""
+        self.shadow.read_state(self.info)
+        self.shadow.set_visible(True)
+        self.shadow.set_text("contents", "新文本")
+        self.shadow.revert()
+        self.counter.reset()
+        state = self.shadow.read_state(self.info)
+        self.assertEqual((state.visible, state.text.contents), (False, "文本"))
+        self.assertEqual(self.counter.total, 0)
+
+    def test_revert_unknown(self):
+        """测试快照之后才第一次读取的值不作为快照中的值"""
+        self.shadow.set_visible(True)
+        self.shadow.get_visible()
+        self.shadow.revert()
+        self.counter.reset()
+        self.shadow.get_visible()
+        self.assertEqual(self.counter.calls["FakeArtLayer.visible"], 1)
+
+    def test_readable(self):
+        """测试待执行的脚本会改变、又没有本地值的属性不能在脚本执行前读取"""
+        self.assertTrue(self.shadow.readable(self.info))
+        self.shadow.set_visible(True)
+        self.shadow.revert()
+        # 快照之后才修改的可见性, 恢复快照的脚本执行前 Photoshop 中仍是修改后的值
+        self.assertFalse(self.shadow.readable(self.info))
+        self.shadow.pending.clear()
+        self.shadow.record(LayerState(rotate=90))
+        self.assertFalse(self.shadow.readable(LayerState(move=(0, 0))))
+        self.assertTrue(self.shadow.readable(LayerState(visible=True)))
+
+    def test_record(self):
+        """测试记录脚本中的修改不调用 Photoshop"""
+        self.shadow.record(LayerState.coerce({"visible": True, "textItem": {"color": "FF0000"}}))
+        self.assertEqual(self.counter.total, 0)
+        self.assertEqual(self.shadow.get_visible(), True)
+        self.assertEqual(self.shadow.color, "#ff0000")
+
+    def test_invalidate(self):
+        """测试丢弃本地值后重新读取"""
+        self.shadow.get_visible()
+        self.layer._visible = True
+        self.assertEqual(self.shadow.get_visible(), False)
+        self.shadow.invalidate()
+        self.assertEqual(self.shadow.get_visible(), True)
+
+
+class TestShadowedEngine(unittest.TestCase):
+    def test_document_matches_tasks(self):
+        """测试使用影子后每个任务导出时文档状态与任务内容一致, 任务之间恢复正确"""
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 3, 4, text_ratio=1.0)
+        fake_photoshop.open_document(document, counter)
+        layers = {
+            f"{layer_set._name}/{layer._name}": layer
+            for layer_set in document._layerSets.items
+            for layer in layer_set._artLayers.items
+        }
+        initial = {path: (layer._visible, layer._textItem._contents) for path, layer in layers.items()}
+        tasks = [
+            {"组0/图层0": {"visible": True, "textItem": {"contents": "A"}}, "组1/图层1": {"visible": False}},
+            {"组0/图层0": {"visible": False}, "组2/图层3": {"visible": True, "move": (20, 0)}},
+            {"组1/图层1": {"visible": True, "textItem": {"contents": "B"}}},
+            {"组0/图层0": {"visible": True, "textItem": {"contents": "A"}}},
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            ps = ps_core.Photoshop("bench", psd_dir_path=tmp, export_folder=os.path.join(tmp, "out"))
+
+            def check(task):
+                # 任务中的图层为任务指定的值, 其他图层为初始值
+                for path, layer in layers.items():
+                    content = task.get(path)
+                    if content is None:
+                        state = (layer._visible, layer._textItem._contents)
+                        self.assertEqual(state, initial[path], path)
+                        continue
+                    self.assertEqual(layer._visible, content["visible"], path)
+                    if "textItem" in content:
+                        self.assertEqual(layer._textItem._contents, content["textItem"]["contents"])
+                    if "move" in content:
+                        self.assertEqual(layer._bounds[:2], (20.0, 0.0))
+
+            with ps, mock.patch.object(ps, "ps_saveas", side_effect=lambda *_: check(task)):
+                for index, task in enumerate(tasks):
+                    ps.core(f"SKU{index}", task)
+        for path, layer in layers.items():
+            self.assertEqual((layer._visible, layer._textItem._contents), initial[path], path)
+
+    def test_absolute_rotate(self):
+        """测试 rotate 在两个引擎中都是相对打开时方向的角度, 不与之前任务的角度累加"""
+        rotates = [90, 90, 180, None, -90]
+        expected = [90, 90, 180, 0, 270]
+
+        def make_tasks(path: str) -> list[dict]:
+            return [
+                {path: {"visible": True, "rotate": rotate}} if rotate is not None else {}
+                for rotate in rotates
+            ]
+
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 1, 2)
+        fake_photoshop.open_document(document, counter)
+        layer = document._layerSets.items[0]._artLayers.items[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            ps = ps_core.Photoshop("bench", psd_dir_path=tmp, export_folder=os.path.join(tmp, "out"))
+            photoshop = []
+            with ps, mock.patch.object(ps, "ps_saveas"):
+                for index, task in enumerate(make_tasks("组0/图层0")):
+                    ps.core(f"SKU{index}", task)
+                    photoshop.append(layer._rotation)
+
+            # 离线引擎恢复快照时不调用旋转, 按图层像素判断方向
+            native_layer_factory = importlib.import_module("src.native_layer_factory")
+            ps = NativePhotoshop("测试", PSD_DIR, os.path.join(tmp, "native"))
+            native = []
+            with ps, mock.patch.object(ps, "ps_saveas"):
+                group = ps.layer_factory.get_layer_by_layername("矩形/矩形1")[0]
+                rect = next(layer for layer in group.children if not layer.is_group)
+                original = rect.load_pixels()
+                for index, task in enumerate(make_tasks("矩形/矩形1")):
+                    ps.core(f"SKU{index}", task)
+                    native.append(
+                        next(
+                            angle
+                            for angle in (0, 90, 180, 270)
+                            if np.array_equal(
+                                rect.load_pixels(),
+                                native_layer_factory.rotate_pixels(original, angle),
+                            )
+                        )
+                    )
+        self.assertEqual(photoshop, expected)
+        self.assertEqual(native, expected)
+
+    def test_jsx_one_script_per_task(self):
+        """测试批量模式下所有图层都用到过之后, 每个任务(恢复快照、修改和导出)只调用一次 doJavaScript"""
+        bench = importlib.import_module("bench")
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 2, 4)
+        fake_photoshop.open_document(document, counter)
+        tasks = bench.make_tasks(document, 60, 0.5)
+        scripts = []
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            ps = ps_core.Photoshop(
+                "bench", psd_dir_path=tmp, export_folder=os.path.join(tmp, "out"), use_jsx=True
+            )
+            with ps:
+                for task in tasks:
+                    before = counter.calls["FakeApplication.doJavaScript()"]
+                    ps.core(task["任务名"], task["内容"])
+                    scripts.append(counter.calls["FakeApplication.doJavaScript()"] - before)
+        self.assertEqual(scripts[10:], [1] * (len(tasks) - 10))
+
+    def test_exit_flushes_exports(self):
+        """测试 Photoshop 引擎与离线引擎共用退出流程: 恢复图层后报告异步导出失败的文件"""
+        export_queue_module = importlib.import_module("src.export_queue")
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 1, 2)
+        fake_photoshop.open_document(document, counter)
+        layer = document._layerSets.items[0]._artLayers.items[0]
+        visible = layer._visible
+
+        def fail():
+            raise OSError("磁盘已满")
+
+        with tempfile.TemporaryDirectory() as tmp, export_queue_module.ExportQueue() as export_queue:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            ps = ps_core.Photoshop(
+                "bench",
+                psd_dir_path=tmp,
+                export_folder=os.path.join(tmp, "out"),
+                use_jsx=True,
+                export_queue=export_queue,
+            )
+            with self.assertRaises(export_queue_module.ExportError) as raised:
+                with ps, mock.patch.object(ps, "ps_saveas"):
+                    ps.core("SKU0", {"组0/图层0": {"visible": not visible}})
+                    export_queue.submit("SKU0", [("SKU0.png", fail)])
+        self.assertEqual(list(raised.exception.errors), ["SKU0"])
+        self.assertEqual(layer._visible, visible)
+
+    def test_group_move(self):
+        """测试移动图层组后重新读取子图层的位置"""
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 1, 2)
+        fake_photoshop.open_document(document, counter)
+        child = document._layerSets.items[0]._artLayers.items[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            ps = ps_core.Photoshop("bench", psd_dir_path=tmp, export_folder=os.path.join(tmp, "out"))
+            with ps, mock.patch.object(ps, "ps_saveas"):
+                ps.core(
+                    "SKU0",
+                    {"组0": {"visible": True, "move": (50, 0)}, "组0/图层0": {"visible": True, "move": (10, 0)}},
+                )
+                self.assertEqual(child._bounds[:2], (10.0, 0.0))
+
+    def test_layer_tree_cache(self):
+        """测试从图层树缓存打开时不遍历图层, 初始状态不再读取, 修改结果与遍历时一致"""
+        layer_tree_cache = importlib.import_module("src.layer_tree_cache")
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 3, 4, text_ratio=1.0)
+        fake_photoshop.open_document(document, counter)
+        layer = document._layerSets.items[1]._artLayers.items[2]
+        task = {"组1/图层2": {"visible": True, "move": (30, 0), "textItem": {"contents": "A"}}}
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, "bench.psd"), "wb").close()
+            cache = layer_tree_cache.LayerTreeCache(tmp)
+            for warm in (False, True):
+                counter.reset()
+                ps = ps_core.Photoshop(
+                    "bench",
+                    psd_dir_path=tmp,
+                    export_folder=os.path.join(tmp, "out"),
+                    layer_tree_cache=cache,
+                )
+                with ps, mock.patch.object(ps, "ps_saveas"):
+                    open_calls = counter.total
+                    counter.reset()
+                    ps.core("SKU", task)
+                    self.assertEqual(layer._visible, True)
+                    self.assertEqual(layer._bounds[:2], (30.0, 0.0))
+                    self.assertEqual(layer._textItem._contents, "A")
+                    if warm:
+                        self.assertLess(open_calls, 5)
+                        self.assertEqual(counter.calls["FakeArtLayer.visible"], 0)
+                        self.assertEqual(counter.calls["FakeTextItem.contents"], 0)
+            # 缓存有效时不打开文档
+            counter.reset()
+            self.assertEqual(ps.get_psd_info()["all_layer"][0], {"TOP": ["背景"]})
+            self.assertEqual(counter.total, 0)
+
+    def test_all_layers_from_index(self):
+        """测试图层名从图层索引读取, 建立索引后不再调用 Photoshop"""
+        counter = fake_photoshop.CallCounter()
+        document = fake_photoshop.build_document(counter, 2, 2)
+        fake_photoshop.open_document(document, counter)
+        factory = ps_core.LayerFactory(fake_photoshop.FakeSession())
+        factory.build_layer_index()
+        counter.reset()
+        self.assertEqual(
+            factory.get_all_layers(),
+            [{"TOP": ["背景"]}, "组0: ['图层0', '图层1']", "组1: ['图层0', '图层1']"],
+        )
+        self.assertEqual(counter.total, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import pickle
+import unittest
+
+from src.layer_state import EMPTY_STATE, LayerState, TextState
+
+
+class TestLayerStateModule(unittest.TestCase):
+    def test_interned(self):
+        """测试相同属性只创建一个实例, 数字文本统一为整数字符串"""
+        a = LayerState.from_dict({"visible": True, "textItem": {"contents": 123.0, "size": 35}})
+        b = LayerState(visible=True, text=TextState("123", 35))
+        self.assertIs(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertIs(pickle.loads(pickle.dumps(a)), a)
+        self.assertIs(LayerState.from_dict({"move": [1, 2]}), LayerState(move=(1, 2)))
+
+    def test_frozen(self):
+        state = LayerState(visible=True)
+        with self.assertRaises(AttributeError):
+            state.visible = False
+
+    def test_delta(self):
+        """测试只返回目标中指定且与当前不同的属性"""
+        current = LayerState.from_dict(
+            {"visible": True, "move": (0, 0), "textItem": {"contents": "A", "size": 30}}
+        )
+        target = LayerState.from_dict(
+            {"visible": True, "move": (10, 0), "textItem": {"contents": "A", "color": "#ffffff"}}
+        )
+        self.assertEqual(
+            current.delta(target).to_dict(),
+            {"move": (10, 0), "textItem": {"color": "#ffffff"}},
+        )
+        self.assertIs(current.delta(current), EMPTY_STATE)
+        self.assertFalse(target.delta(LayerState(visible=True)))
+        self.assertEqual(EMPTY_STATE.delta(target), target)
+
+    def test_change_count(self):
+        """测试文本的每个属性各算一次修改"""
+        state = LayerState.from_dict(
+            {"visible": True, "move": (1, 2), "textItem": {"contents": "A", "size": 30}}
+        )
+        self.assertEqual(state.change_count(), 4)
+        self.assertEqual(EMPTY_STATE.change_count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
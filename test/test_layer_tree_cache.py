@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src import native_core
+from src.layer_tree_cache import LayerTreeCache
+from src.native_core import NativePhotoshop
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestLayerTreeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        shutil.copy(os.path.join(PSD_DIR, "测试.psd"), self.tmp)
+        self.psd_path = os.path.join(self.tmp, "测试.psd")
+        self.cache = LayerTreeCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _engine(self) -> NativePhotoshop:
+        return NativePhotoshop(
+            psd_name="测试",
+            psd_dir_path=self.tmp,
+            export_folder=os.path.join(self.tmp, "export"),
+            layer_tree_cache=self.cache,
+        )
+
+    def test_sidecar(self):
+        """测试打开模板时写入旁路缓存, 修改时间变化但内容相同时继续使用"""
+        with self._engine():
+            pass
+        sidecar = self.psd_path + ".layers.json"
+        self.assertEqual(self.cache.path_for(self.psd_path), sidecar)
+        tree = self.cache.load(self.psd_path)
+        self.assertEqual(tree["names"][""], [["背景", "测试图层"], ["矩形", "图片", "标题"]])
+        self.assertEqual(
+            [node["index"] for node in tree["layers"]["标题/标题1"]],
+            [[["set", 2], ["art", 1]], [["set", 2], ["art", 0]]],
+        )
+        self.assertEqual(tree["layers"]["标题/标题1"][0]["text"]["contents"], "修改前1")
+
+        stat = os.stat(self.psd_path)
+        os.utime(self.psd_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(self.cache.load(self.psd_path), tree)
+        with open(sidecar, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["mtime_ns"], stat.st_mtime_ns + 10**9)
+
+    def test_template_changed(self):
+        """测试模板内容变化后缓存失效"""
+        with self._engine():
+            pass
+        with open(self.psd_path, "ab") as f:
+            f.write(b"\0")
+        self.assertIsNone(self.cache.load(self.psd_path))
+        with open(self.psd_path, "r+b") as f:
+            f.truncate(os.path.getsize(self.psd_path) - 1)
+            f.seek(100)
+            byte = f.read(1)
+            f.seek(100)
+            f.write(bytes([byte[0] ^ 1]))
+        os.utime(self.psd_path, ns=(0, 0))
+        self.assertIsNone(self.cache.load(self.psd_path))
+
+    def test_cache_dir(self):
+        """测试指定缓存目录时不在模板旁边写文件"""
+        self.cache = LayerTreeCache(os.path.join(self.tmp, "cache"))
+        with self._engine():
+            pass
+        self.assertFalse(os.path.exists(self.psd_path + ".layers.json"))
+        self.assertTrue(os.path.isfile(self.cache.path_for(self.psd_path)))
+        self.assertIsNotNone(self.cache.load(self.psd_path))
+
+    def test_psd_info_without_opening(self):
+        """测试缓存有效时 get_psd_info 不解析模板, 结果与解析模板一致"""
+        cold = self._engine().get_psd_info()
+        with mock.patch.object(native_core, "read_psd", side_effect=AssertionError):
+            warm = self._engine().get_psd_info()
+        self.assertEqual(warm, cold)
+
+    def test_warm_start(self):
+        """测试从缓存读取图层树后按位置定位图层, 渲染结果与遍历图层树一致"""
+        task = {"图片/图片1": {"visible": True}, "标题/标题1": {"visible": True, "move": (10, 20)}}
+        outputs = []
+        for _ in range(2):
+            ps = self._engine()
+            with ps:
+                ps.core("SKU", task)
+                layers = ps.layer_factory.get_layer_by_layername("标题/标题1")
+                self.assertEqual([layer.name for layer in layers], ["标题1", "标题1 拷贝"])
+                self.assertEqual(ps.layer_factory.get_layer_by_layername("标题/不存在"), [])
+            with open(os.path.join(self.tmp, "export", "SKU.png"), "rb") as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(ps.layer_factory.layer_dict.keys(), {"图片/图片1", "标题/标题1", "标题/不存在"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import unittest
+
+from load_data import XlsmLoadData, compile_column_plan, convert_row
+from src.xlsm_reader import XlsmWorkbook, parse_range_ref
+
+XLSM_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "PS_OF_PY.xlsm")
+
+
+class TestXlsmLoadDataModule(unittest.TestCase):
+    def test_workbook(self):
+        """测试读取工作簿结构、工作表级命名单元格和表格"""
+        with XlsmWorkbook(XLSM_PATH) as workbook:
+            self.assertEqual(workbook.active_sheet, "显卡新设计")
+            self.assertEqual(workbook.resolve_name("file_format", "显卡"), ("显卡", "$B$4"))
+            self.assertEqual(workbook.read_names(["file_format"], "显卡"), {"file_format": "png"})
+            header, rows = workbook.iter_table("显卡")
+            self.assertEqual(header[0], "导出文件名")
+            top, _, bottom, _ = parse_range_ref(workbook.table("显卡")["ref"])
+            self.assertEqual(sum(1 for _ in rows), bottom - top)
+
+    def test_selected_skus(self):
+        """测试按任务名筛选, 输出与 LoadData.selected_skus 格式一致"""
+        load_data = XlsmLoadData(XLSM_PATH, "显卡", skus=["10182337623491", "不存在"])
+        self.assertEqual(load_data.settings[3], "png")
+        tasks = load_data.selected_skus()
+        self.assertEqual([task["任务名"] for task in tasks], ["10182337623491"])
+        content = tasks[0]["内容"]
+        self.assertEqual(content["标题/标题1"], {"textItem": {"contents": "RTX5050"}})
+        self.assertEqual(content["显卡/GV-N5050D6-8GD"], {"visible": True})
+        self.assertEqual(content["电源/斗战550S"], {"visible": True})
+
+    def test_select_column(self):
+        """测试按选择列筛选"""
+        load_data = XlsmLoadData(XLSM_PATH, "显卡", select_column="配件2")
+        _, rows = load_data.table_rows()
+        rows = [row for row in rows if load_data.is_selected(row)]
+        self.assertEqual(len(load_data.selected_skus()), len(rows))
+        self.assertTrue(all(row[2] for row in rows))
+        with self.assertRaises(KeyError):
+            XlsmLoadData(XLSM_PATH, "显卡", select_column="不存在")
+
+
+    def test_column_plan(self):
+        """测试表头只编译一次, 转换结果与逐个匹配表头一致"""
+        header = (
+            "导出文件名",
+            "文本丨标题丨标题1",
+            "文本丨丨标题2",
+            "可显性丨显卡丨2",
+            "可显性丨产品丨电源",
+            "备注",
+        )
+        plan = compile_column_plan(header)
+        self.assertIs(compile_column_plan(header), plan)
+        self.assertEqual([index for index, _, _ in plan], [1, 2, 3, 4])
+        row = ["No1", "RTX5050丨30丨#ffffff", 123.0, "A丨F", "斗战550S丨T"]
+        self.assertEqual(
+            convert_row(plan, row),
+            {
+                "标题/标题1": {"textItem": {"contents": "RTX5050", "size": 30, "color": "#ffffff"}},
+                "标题2": {"textItem": {"contents": 123.0}},
+                "显卡/A": {"visible": False},
+                "产品/电源/斗战550S": {"visible": True},
+            },
+        )
+        self.assertEqual(convert_row(plan, ["No2", None, None, "B"]), {"显卡/B": {"visible": True}})
+
+    def test_filter_data(self):
+        """测试 filter_data 与只转换选中行的结果一致"""
+        load_data = XlsmLoadData(XLSM_PATH, "显卡")
+        tasks = load_data.filter_data(load_data.read_range())
+        self.assertEqual(
+            tasks, {filename: task["内容"] for filename, task in load_data.iter_tasks()}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
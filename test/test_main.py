@@ -0,0 +1,51 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        # 导入 main 会切换工作目录到项目根目录
+        self.cwd = os.getcwd()
+        self.addCleanup(os.chdir, self.cwd)
+
+    def test_parse_args(self):
+        """测试导入 main 并解析命令行参数"""
+        import main
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            with self.assertRaises(SystemExit) as context:
+                main.parse_args(["--help"])
+        self.assertEqual(context.exception.code, 0)
+        for option in ("--xlsm", "--sku", "--workers", "--serve", "--journal", "--cache-dir"):
+            self.assertIn(option, output.getvalue())
+        self.assertFalse(main.parse_args([]).dedupe)
+        args = main.parse_args(
+            ["native", "--plan", "--dedupe", "--sku", "A", "--sku", "B", "--export-profile", "jpg,quality=85"]
+        )
+        self.assertEqual(args.engine, "native")
+        self.assertTrue(args.plan)
+        self.assertTrue(args.dedupe)
+        self.assertEqual(args.skus, ["A", "B"])
+        self.assertEqual(args.export_profiles[0].quality, 85)
+
+    def test_script_help(self):
+        """测试以脚本方式运行 main.py --help"""
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "main.py"), "--help"],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            cwd=ROOT,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("--xlsm", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+from src.native_core import NativePhotoshop
+from src.native_layer_factory import NativeLayerFactory, rotate_pixels
+from src.psd_reader import LayerChannels, PixelCache, read_psd
+from src.task_planner import plan_task_order
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+# 只修改文本(不带 visible)、移动、旋转、隐藏图层组的任务, 相邻任务之间互相残留时导出会不同
+TASKS = [
+    {"任务名": "No1", "内容": {"标题/标题1": {"textItem": {"contents": "甲"}}}},
+    {"任务名": "No2", "内容": {"标题/标题1": {"textItem": {"contents": "乙", "size": 40}}}},
+    {"任务名": "No3", "内容": {"矩形/矩形1": {"visible": True, "move": (350, 350), "rotate": 90}}},
+    {"任务名": "No4", "内容": {"矩形/矩形1": {"visible": True, "rotate": 180}}},
+    {"任务名": "No5", "内容": {"图片/图片1": {"visible": True}, "测试图层": {"visible": True}}},
+    {"任务名": "No6", "内容": {"图片": {"visible": False}}},
+    {"任务名": "No7", "内容": {}},
+]
+
+
+def render_tasks(export_folder: str, tasks: list[dict], snapshot_revert_cost: int = None) -> dict:
+    """
+    在同一个文档中依次执行任务, 记录每次导出时的合成结果和文本图层的内容
+    未安装 Pillow 时文本图层不会重新渲染, 所以同时比较文本内容
+    :return: {任务名: (合成结果的 sha256, 文本内容)}
+    """
+    ps = NativePhotoshop("测试", PSD_DIR, export_folder)
+    exports = {}
+
+    def capture(export_name, export_profiles=None):
+        texts = tuple(
+            (layer.name, tuple(sorted(layer.text.items())))
+            for layer in ps.doc.descendants()
+            if layer.text is not None
+        )
+        pixels = hashlib.sha256(ps.compositor.composite().tobytes()).hexdigest()
+        exports[export_name] = (pixels, texts)
+
+    ps.ps_saveas = capture
+    with ps:
+        if snapshot_revert_cost is not None:
+            ps.layer_factory.snapshot_revert_cost = snapshot_revert_cost
+        for task in tasks:
+            ps.core(task["任务名"], task["内容"])
+    return exports
+
+
+class TestNativeModule(unittest.TestCase):
+    def setUp(self):
+        self.export_folder = tempfile.mkdtemp()
+        self.ps = NativePhotoshop(
+            psd_name="测试",
+            psd_dir_path=PSD_DIR,
+            export_folder=self.export_folder,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+    def test_read_psd(self):
+        """测试解析图层树"""
+        doc = read_psd(os.path.join(PSD_DIR, "测试.psd"))
+        self.assertEqual((doc.width, doc.height), (800, 800))
+        self.assertEqual(
+            [layer.name for layer in doc.children], ["背景", "测试图层", "矩形", "图片", "标题"]
+        )
+        title = doc.layerSets[2].artLayers[1]
+        self.assertEqual(title.name, "标题1")
+        self.assertEqual(title.text["contents"], "修改前1")
+
+    def test_read_rows(self):
+        """测试 RAW / RLE / ZIP 通道按行解码与整体解码一致, 延迟解码的文档与直接解码的一致"""
+        width, height = 5, 6
+        plane = np.arange(width * height, dtype=np.uint8).reshape(height, width)
+        counts = b"".join(b"\x00\x06" for _ in range(height))
+        rle = counts + b"".join(b"\x04" + row.tobytes() for row in plane)
+        channels = {
+            0: b"\x00\x00" + plane.tobytes(),
+            1: b"\x00\x01" + rle,
+            2: b"\x00\x02" + zlib.compress(plane.tobytes()),
+        }
+        data, offsets = b"", []
+        for channel_id, channel in channels.items():
+            offsets.append((channel_id, len(data), len(channel)))
+            data += channel
+        source = LayerChannels(data, False, width, height, offsets)
+        pixels = source.decode()
+        for index in range(3):
+            self.assertTrue(np.array_equal(pixels[..., index], plane))
+        self.assertTrue(np.all(pixels[..., 3] == 255))
+        self.assertTrue(np.array_equal(source.read_rows(2, 5), pixels[2:5]))
+
+        path = os.path.join(PSD_DIR, "测试.psd")
+        layers = zip(read_psd(path).descendants(), read_psd(path, lazy=True).descendants())
+        for layer, lazy_layer in layers:
+            self.assertEqual(layer.bounds, lazy_layer.bounds)
+            if layer.pixels is not None:
+                self.assertIsNone(lazy_layer.pixels)
+                self.assertTrue(np.array_equal(lazy_layer.load_pixels(), layer.pixels))
+
+    def test_decode_when_visible(self):
+        """测试打开时不解码图层像素, 图层第一次可见时才解码并放入缓存"""
+        with self.ps:
+            doc = self.ps.doc
+            self.assertIsNotNone(doc.mapping)
+            self.assertTrue(all(layer.pixels is None for layer in doc.descendants()))
+            self.assertEqual(doc.pixel_cache.misses, 0)
+            hidden = self.ps.layer_factory.get_layer_by_layername("图片/图片1")[0]
+            background = self.ps.layer_factory.get_layer_by_layername("背景")[0]
+            self.ps.compositor.composite()
+            self.assertIn(background.source, doc.pixel_cache)
+            self.assertNotIn(hidden.source, doc.pixel_cache)
+            self.ps.core("No1", {"图片/图片1": {"visible": True}})
+            self.assertIn(hidden.source, doc.pixel_cache)
+        doc.close()
+        self.assertIsNone(doc.mapping)
+
+    def test_pixel_cache_limit(self):
+        """测试缓存超过上限时淘汰最久未使用的图层, 淘汰的图层重新解码结果不变"""
+        doc = read_psd(os.path.join(PSD_DIR, "测试.psd"), lazy=True)
+        self.addCleanup(doc.close)
+        sources = [layer.source for layer in doc.descendants() if layer.source is not None]
+        first, second = sources[:2]
+        cache = PixelCache(max_bytes=max(first.nbytes, second.nbytes))
+        expected = first.decode_rows(0, first.height)
+        self.assertTrue(np.array_equal(cache.get(first), expected))
+        cache.get(second)
+        self.assertNotIn(first, cache)
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        pixels = cache.get(first)
+        self.assertTrue(np.array_equal(pixels, expected))
+        self.assertFalse(pixels.flags.writeable)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+    def test_order_independent(self):
+        """测试打乱或重新规划任务顺序后, 每个任务的导出与单独在新打开的文档中执行一致"""
+        expected = {}
+        for task in TASKS:
+            expected.update(render_tasks(self.export_folder, [task]))
+        planned, _ = plan_task_order(TASKS)
+        shuffled = list(TASKS)
+        random.Random(1).shuffle(shuffled)
+        for order in (TASKS, TASKS[::-1], shuffled, planned):
+            with self.subTest(order=[task["任务名"] for task in order]):
+                self.assertEqual(render_tasks(self.export_folder, order), expected)
+
+    def test_restore_paths_match(self):
+        """测试总是恢复快照和总是逐个恢复图层得到相同的导出"""
+        snapshot = render_tasks(self.export_folder, TASKS, snapshot_revert_cost=0)
+        replay = render_tasks(self.export_folder, TASKS, snapshot_revert_cost=10**6)
+        self.assertEqual(snapshot, replay)
+        self.assertEqual(snapshot, render_tasks(self.export_folder, TASKS[::-1], 0))
+
+    def test_get_layer_by_layername(self):
+        """测试按路径查找图层, 包含拷贝图层"""
+        with self.ps:
+            layers = self.ps.layer_factory.get_layer_by_layername("标题/标题1")
+            self.assertEqual([layer.name for layer in layers], ["标题1", "标题1 拷贝"])
+            self.assertEqual(self.ps.layer_factory.get_layer_by_layername("标题/不存在"), [])
+            # 任意深度的路径, 图层集优先于同名图层
+            nested = self.ps.layer_factory.get_layer_by_layername("图片/图片2/图片1")
+            self.assertEqual(nested[0].parent.name, "图片2")
+            rect = self.ps.layer_factory.get_layer_by_layername("矩形/矩形1")
+            self.assertTrue(rect[0].is_group)
+            self.assertIn("背景", self.ps.layer_factory.layer_dict)
+
+    def test_core(self):
+        """测试修改图层并导出, 退出时恢复初始状态"""
+        dict_for_test = {
+            "No1": {
+                "图片/图片1": {"visible": True},
+                "矩形/矩形1": {"visible": True, "move": (350, 350), "rotate": 180},
+            },
+            "No2": {
+                "图片/图片1": {"visible": False},
+            },
+        }
+        with self.ps:
+            for export_name, input_data in dict_for_test.items():
+                self.ps.core(export_name, input_data)
+            rect = self.ps.layer_factory.get_layer_by_layername("矩形/矩形1")[0]
+        self.assertEqual(rect.bounds[:2], (-2, -2))
+        self.assertEqual(sorted(os.listdir(self.export_folder)), ["No1.png", "No2.png"])
+        with open(os.path.join(self.export_folder, "No1.png"), "rb") as f:
+            self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+
+    def test_snapshot(self):
+        """测试恢复快照后合成结果与刚打开时一致, 大量图层需要恢复时选择恢复快照"""
+        with self.ps:
+            factory = self.ps.layer_factory
+            expected = self.ps.compositor.composite()
+            self.ps.core(
+                "No1",
+                {
+                    "图片/图片1": {"visible": True},
+                    "测试图层": {"visible": True},
+                    "矩形/矩形1": {"visible": True, "move": (350, 350), "rotate": 90},
+                },
+            )
+            # 恢复可见性两次、位置和角度各一次
+            self.assertEqual(factory.restore_costs({}), (4, 1))
+            calls = []
+            factory._restore_snapshot = lambda: calls.append(
+                NativeLayerFactory._restore_snapshot(factory)
+            )
+            self.ps.core("No2", {"背景": {"visible": True}})
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(factory.current_state["背景"], factory.initial_state["背景"])
+            factory.revert_to_snapshot()
+            self.assertTrue(np.array_equal(self.ps.compositor.composite(), expected))
+
+    def test_rotate_pixels(self):
+        """测试旋转 180 度两次后像素不变"""
+        pixels = np.arange(2 * 3 * 4, dtype=np.uint8).reshape(2, 3, 4)
+        self.assertTrue(np.array_equal(rotate_pixels(rotate_pixels(pixels, 180), -180), pixels))
+        self.assertEqual(rotate_pixels(pixels, 90).shape, (3, 2, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
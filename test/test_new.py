@@ -26,7 +26,8 @@ class TestNewModule(unittest.TestCase):
                 矩形: {
                     "visible": True,
                     # "move": (0, 0),
-                    "rotate": -180,
+                    # rotate 是相对打开时方向的角度, 0 为转回打开时的方向
+                    "rotate": 0,
                 },
             },
         }
@@ -76,7 +77,7 @@ class TestNewModule(unittest.TestCase):
             },
             "旋转2": {
                 矩形: {
-                    "rotate": -90,
+                    "rotate": 0,
                 },
             },
         }
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.parallel_runner import plan_shards, run_parallel, split_shards
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestParallelRunnerModule(unittest.TestCase):
+    def setUp(self):
+        self.export_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+    def test_split_shards(self):
+        """测试分片连续且大小均衡"""
+        shards = split_shards(list(range(10)), 3)
+        self.assertEqual(shards, [[0, 1, 2], [3, 4, 5], [6, 7, 8, 9]])
+        self.assertEqual(split_shards([1], 4), [[1]])
+
+    def test_plan_shards(self):
+        """测试先排序再切分, 内容相同的任务分到同一个进程"""
+        tasks = [
+            {"任务名": f"No{i}", "内容": {"图片/图片1": {"visible": bool(i % 2)}}}
+            for i in range(6)
+        ]
+        shards = plan_shards(tasks, 2)
+        self.assertEqual(
+            [{task["内容"]["图片/图片1"]["visible"] for task in shard} for shard in shards],
+            [{False}, {True}],
+        )
+
+    def test_run_parallel(self):
+        """测试多进程渲染并合并运行时间记录"""
+        tasks = [
+            {"任务名": f"No{i}", "内容": {"图片/图片1": {"visible": bool(i % 2)}}}
+            for i in range(4)
+        ]
+        result = run_parallel(
+            tasks,
+            suffix="_p",
+            engine_type="native",
+            engine_args=("测试", PSD_DIR, self.export_folder),
+            workers=2,
+        )
+        self.assertEqual(result["errors"], {})
+        self.assertEqual(sorted(result["outputs"]), ["No0_p", "No1_p", "No2_p", "No3_p"])
+        self.assertEqual(set(result["run_time_record"]), set(result["outputs"]))
+        self.assertEqual([shard["task_count"] for shard in result["shards"]], [2, 2])
+        self.assertEqual(len(os.listdir(self.export_folder)), 4)
+
+    def test_photoshop_not_supported(self):
+        with self.assertRaises(ValueError):
+            run_parallel([], engine_type="photoshop")
+
+
+if __name__ == "__main__":
+    unittest.main()
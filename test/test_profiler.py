@@ -0,0 +1,101 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from src.native_core import NativePhotoshop
+from src.profiler import Profiler
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestProfilerModule(unittest.TestCase):
+    def test_disabled(self):
+        """测试关闭时不记录任何数据"""
+        profiler = Profiler(enabled=False)
+        with profiler.span("task", "task"):
+            with profiler.span("change"):
+                pass
+        self.assertEqual(profiler.durations, {})
+        self.assertEqual(profiler.events, [])
+
+    def test_summary(self):
+        """测试分位数和直方图"""
+        profiler = Profiler()
+        # 1 到 100 微秒
+        profiler.durations["phase:change"] = [i * 1000 for i in range(100, 0, -1)]
+        stats = profiler.summary()["phase:change"]
+        self.assertEqual(stats["count"], 100)
+        self.assertEqual(stats["p50_ms"], 0.05)
+        self.assertEqual(stats["p90_ms"], 0.09)
+        self.assertEqual(stats["p99_ms"], 0.099)
+        self.assertEqual(stats["max_ms"], 0.1)
+        self.assertAlmostEqual(stats["total_ms"], 5.05)
+        histogram = profiler.histogram("phase:change")
+        # (0,1] (1,2] (2,4] ... (64,128] 微秒
+        self.assertEqual([upper for upper, _ in histogram][:3], [0.001, 0.002, 0.004])
+        self.assertEqual([count for _, count in histogram], [1, 1, 2, 4, 8, 16, 32, 36])
+        self.assertIn("phase:change", profiler.report())
+
+    def test_chrome_trace(self):
+        """测试嵌套计时写出为 Chrome trace, 子计时在父计时的时间范围内"""
+        profiler = Profiler()
+        with profiler.span("task", "task", export_name="No1"):
+            with profiler.span("change"):
+                with profiler.span("visible", "layer", layer="图片/图片1"):
+                    pass
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            profiler.write_chrome_trace(path)
+            with open(path, encoding="utf-8") as f:
+                events = json.load(f)["traceEvents"]
+        by_name = {event["name"]: event for event in events}
+        self.assertEqual(set(by_name), {"task", "change", "visible"})
+        self.assertEqual(by_name["visible"]["args"], {"layer": "图片/图片1"})
+        task, layer = by_name["task"], by_name["visible"]
+        self.assertLessEqual(task["ts"], layer["ts"])
+        self.assertGreaterEqual(task["ts"] + task["dur"], layer["ts"] + layer["dur"])
+
+    def test_merge(self):
+        """测试合并其他进程传回的统计"""
+        profiler = Profiler()
+        with profiler.span("change"):
+            pass
+        other = pickle.loads(pickle.dumps(profiler))
+        with other.span("change"):
+            pass
+        profiler.merge(other)
+        self.assertEqual(len(profiler.durations["phase:change"]), 3)
+        self.assertEqual(len(profiler.events), 3)
+
+
+class TestEngineProfile(unittest.TestCase):
+    def setUp(self):
+        self.export_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+    def test_core(self):
+        """测试任务、阶段和图层三级计时"""
+        profiler = Profiler()
+        ps = NativePhotoshop(
+            psd_name="测试",
+            psd_dir_path=PSD_DIR,
+            export_folder=self.export_folder,
+            profiler=profiler,
+        )
+        with ps:
+            ps.core("No1", {"图片/图片1": {"visible": True}, "矩形/矩形1": {"move": (1, 2)}})
+            ps.core("No2", {"图片/图片1": {"visible": False}, "矩形/矩形1": {"move": (1, 2)}})
+        summary = profiler.summary()
+        self.assertEqual(summary["task:task"]["count"], 2)
+        for phase in ("restore", "snapshot", "change", "export"):
+            self.assertEqual(summary[f"phase:{phase}"]["count"], 2)
+        self.assertEqual(summary["layer:visible"]["count"], 2)
+        # 修改一次位置, 退出时恢复一次
+        self.assertEqual(summary["layer:move"]["count"], 2)
+        self.assertIn("phase:open", summary)
+        self.assertEqual(set(ps.run_time_record), {"No1", "No2"})
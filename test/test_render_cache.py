@@ -0,0 +1,91 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import fake_photoshop
+from src.native_core import NativePhotoshop
+from src.render_cache import RenderCache, normalize_input_data
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+PSD_PATH = os.path.join(PSD_DIR, "测试.psd")
+
+
+class TestRenderCacheModule(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = RenderCache(os.path.join(self.tmp, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_make_key(self):
+        """测试键与字典顺序和数字写法无关, 与格式有关"""
+        a = {"标题/标题1": {"textItem": {"size": 35.0, "contents": 1}, "visible": True}}
+        b = {"标题/标题1": {"visible": True, "textItem": {"contents": "1", "size": 35}}}
+        self.assertEqual(normalize_input_data(a), normalize_input_data(b))
+        self.assertEqual(
+            self.cache.make_key(PSD_PATH, a, "png"), self.cache.make_key(PSD_PATH, b, "PNG")
+        )
+        self.assertNotEqual(
+            self.cache.make_key(PSD_PATH, a, "png"), self.cache.make_key(PSD_PATH, a, "jpg")
+        )
+
+    def test_engine_key(self):
+        """测试相同输入在不同引擎或不同字体下的键不同"""
+
+        def key(engine) -> str:
+            return self.cache.make_key(PSD_PATH, {}, "png", {"render": engine.render_options()})
+
+        with mock.patch.dict(sys.modules):
+            fake_photoshop.install()
+            ps_core = importlib.import_module("src.ps_core")
+            photoshop = ps_core.Photoshop("测试", PSD_DIR, self.tmp)
+        native = NativePhotoshop("测试", PSD_DIR, self.tmp)
+        font = NativePhotoshop("测试", PSD_DIR, self.tmp, font_path="simhei.ttf")
+        keys = {key(photoshop), key(native), key(font)}
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(key(NativePhotoshop("测试", PSD_DIR, self.tmp)), key(native))
+
+    def test_put_and_materialize(self):
+        src = self.write("src.png", b"image")
+        dest = os.path.join(self.tmp, "dest.png")
+        self.assertFalse(self.cache.materialize("ab" * 32, dest))
+        self.cache.put("ab" * 32, src)
+        self.assertTrue(self.cache.materialize("ab" * 32, dest))
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), b"image")
+
+    def test_evict(self):
+        """测试超过上限时淘汰最久未使用的缓存"""
+        self.cache.max_bytes = 10
+        self.cache.put("aa" * 32, self.write("a", b"123456"))
+        os.utime(self.cache._path("aa" * 32), ns=(0, 0))
+        self.cache.put("bb" * 32, self.write("b", b"123456"))
+        self.assertFalse(os.path.exists(self.cache._path("aa" * 32)))
+        self.assertTrue(os.path.exists(self.cache._path("bb" * 32)))
+        self.assertEqual(self.cache.total_bytes, 6)
+
+    def test_engine_skips_cached_task(self):
+        """测试第二次运行命中缓存, 不再合成图像"""
+        export_folder = os.path.join(self.tmp, "export")
+        input_data = {"图片/图片1": {"visible": True}}
+        for run in range(2):
+            ps = NativePhotoshop("测试", PSD_DIR, export_folder, render_cache=self.cache)
+            with ps:
+                ps.core("No1", input_data)
+                self.assertEqual(bool(ps.layer_factory.current_state), run == 0)
+        self.assertTrue(os.path.isfile(os.path.join(export_folder, "No1.png")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from src.render_server import RenderService, create_server
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestRenderServerModule(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.service = RenderService(
+            "native", ("测试", PSD_DIR, os.path.join(cls.tmp, "export"))
+        ).start()
+        cls.server = create_server(cls.service, port=0, timeout=60)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.service.close()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def request(self, path: str, payload: dict | None = None) -> dict:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        with urllib.request.urlopen(self.url + path, data) as response:
+            return json.loads(response.read())
+
+    def test_render_batch(self):
+        """测试一次请求提交多个任务, 返回导出路径和耗时"""
+        results = self.request(
+            "/render",
+            {
+                "jobs": [
+                    {"export_name": "No1", "input_data": {"图片/图片1": {"visible": True}}},
+                    {"export_name": "No2", "input_data": {"矩形/矩形1": {"move": [10, 10]}}},
+                ]
+            },
+        )["results"]
+        self.assertEqual([r["export_name"] for r in results], ["No1", "No2"])
+        for result in results:
+            self.assertTrue(os.path.isfile(result["path"]))
+            self.assertGreaterEqual(result["render_ms"], 0)
+
+    def test_render_error(self):
+        """测试单个任务失败时返回错误, 服务继续运行"""
+        result = self.service.render("No3", {"图片/图片1": {"rotate": "x"}}, timeout=60)
+        self.assertIn("error", result)
+        status = self.request("/status")
+        self.assertEqual(status["engine"], "native")
+        self.assertGreaterEqual(status["failed"], 1)
+
+    def test_bad_request(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.request("/render", {"export_name": "No4"})
+        self.assertEqual(context.exception.code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src.native_core import NativePhotoshop
+from src.task_dedup import DUPLICATES_KEY, dedupe_tasks, duplicate_names, task_content_hash
+
+PSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "psd")
+
+
+class TestDedupeTasks(unittest.TestCase):
+    def test_group_by_content(self):
+        """测试内容相同的任务合并到第一个任务, 模板不同的任务不合并"""
+        tasks = [
+            {"任务名": "A", "内容": {"标题": {"visible": True, "move": (35, 0)}}},
+            {"任务名": "B", "内容": {"标题": {"visible": False}}},
+            {"任务名": "C", "内容": {"标题": {"move": [35.0, 0.0], "visible": True}}},
+            {"任务名": "D", "内容": {"标题": {"visible": True, "move": (35, 0)}}, "模板": "其他"},
+            {"任务名": "E", "内容": {"标题": {"visible": False}}},
+        ]
+        unique, report = dedupe_tasks(tasks)
+        self.assertEqual([task["任务名"] for task in unique], ["A", "B", "D"])
+        self.assertEqual(unique[0][DUPLICATES_KEY], ["C"])
+        self.assertEqual(duplicate_names(unique[1], "_1"), ["E_1"])
+        self.assertNotIn(DUPLICATES_KEY, unique[2])
+        self.assertEqual(report, {"task_count": 5, "render_count": 3, "renders_saved": 2})
+        # 原任务不被修改
+        self.assertNotIn(DUPLICATES_KEY, tasks[0])
+
+    def test_hash_ignores_name(self):
+        """测试哈希与任务名和图层顺序无关"""
+        self.assertEqual(
+            task_content_hash({"任务名": "A", "内容": {"a": {"visible": True}, "b": {"visible": False}}}),
+            task_content_hash({"任务名": "B", "内容": {"b": {"visible": False}, "a": {"visible": True}}}),
+        )
+
+
+class TestDuplicateOutputs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.export_folder = os.path.join(self.tmp, "export")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_fan_out(self):
+        """测试只渲染一次, 相同内容的任务的导出文件与渲染结果一致"""
+        ps = NativePhotoshop("测试", PSD_DIR, self.export_folder)
+        with ps, mock.patch.object(ps, "ps_saveas", wraps=ps.ps_saveas) as saveas:
+            ps.core("SKU1", {"图片/图片1": {"visible": True}}, duplicates=["SKU2", "SKU3"])
+        self.assertEqual(saveas.call_count, 1)
+        with open(os.path.join(self.export_folder, "SKU1.png"), "rb") as f:
+            rendered = f.read()
+        for name in ("SKU2", "SKU3"):
+            with open(os.path.join(self.export_folder, f"{name}.png"), "rb") as f:
+                self.assertEqual(f.read(), rendered)
+
+    def test_rerender_linked_output(self):
+        """测试重新渲染硬链接的导出文件时不改写与它链接的文件"""
+        ps = NativePhotoshop("测试", PSD_DIR, self.export_folder)
+        with ps:
+            ps.core("SKU1", {"图片/图片1": {"visible": True}}, duplicates=["SKU2"])
+            with open(os.path.join(self.export_folder, "SKU2.png"), "rb") as f:
+                linked = f.read()
+            ps.core("SKU1", {"图片/图片1": {"visible": False}})
+        with open(os.path.join(self.export_folder, "SKU1.png"), "rb") as f:
+            self.assertNotEqual(f.read(), linked)
+        with open(os.path.join(self.export_folder, "SKU2.png"), "rb") as f:
+            self.assertEqual(f.read(), linked)
+
+
+if __name__ == "__main__":
+    unittest.main()
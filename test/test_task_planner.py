@@ -0,0 +1,55 @@
+import unittest
+
+from src.task_planner import (
+    flatten_input_data,
+    plan_task_order,
+    total_cost,
+    transition_cost,
+)
+
+
+def make_task(name: str, visible_layer: str, contents: str) -> dict:
+    return {
+        "任务名": name,
+        "内容": {
+            "显卡/A": {"visible": visible_layer == "A"},
+            "显卡/B": {"visible": visible_layer == "B"},
+            "标题/标题1": {"visible": True, "textItem": {"contents": contents}},
+        },
+    }
+
+
+class TestTaskPlannerModule(unittest.TestCase):
+    def test_transition_cost(self):
+        """测试切换代价: 值不同的属性 + 需要恢复的属性"""
+        a = flatten_input_data({"图片/图片1": {"visible": True, "move": [1, 2]}})
+        b = flatten_input_data({"图片/图片1": {"visible": False}})
+        self.assertEqual(transition_cost(a, b), 2)
+        self.assertEqual(transition_cost(b, a), 2)
+        self.assertEqual(transition_cost(a, a), 0)
+        self.assertEqual(total_cost([a, a, b]), 4)
+
+    def test_plan_task_order(self):
+        """测试交替出现的任务被排到一起, 且不丢失任务"""
+        tasks = [
+            make_task(str(i), "AB"[i % 2], "文本" if i % 2 else "标题")
+            for i in range(10)
+        ]
+        ordered, report = plan_task_order(tasks)
+        self.assertEqual(sorted(t["任务名"] for t in ordered), sorted(t["任务名"] for t in tasks))
+        self.assertEqual(report["original_cost"], 4 + 9 * 3)
+        self.assertEqual(report["planned_cost"], 4 + 3)
+        self.assertEqual(report["saved"], report["original_cost"] - report["planned_cost"])
+        self.assertEqual(
+            report["planned_cost"],
+            total_cost([flatten_input_data(t["内容"]) for t in ordered]),
+        )
+
+    def test_plan_empty(self):
+        ordered, report = plan_task_order([])
+        self.assertEqual(ordered, [])
+        self.assertEqual(report["saved_ratio"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()